@@ -0,0 +1,254 @@
+# ap_placement.py
+"""
+Tối ưu vị trí đặt AP: tìm N ô trong tập ứng viên (lưới thưa trên lối đi và sát tường)
+sao cho sai số định vị KNN mô phỏng nhỏ nhất, bằng thêm tham lam rồi đổi chỗ (swap).
+RSSI trung bình từ mọi ứng viên đến các ô đánh giá được tính một lần; nhiễu cũng rút
+một lần (common random numbers), nên mỗi lần đánh giá chỉ còn cộng nhiễu và chạy KNN,
+và mọi tập AP được so sánh trên cùng một mẫu nhiễu.
+Chạy thử:
+    python ap_placement.py --budget 4
+"""
+import argparse
+import contextlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import config
+import map_utils
+import map_cache
+import rssi_simulation
+import error_heatmap
+from fingerprint_db import FingerprintDB, cKDTree
+
+# Các tham số config ảnh hưởng đến kết quả tối ưu, nằm trong khóa cache
+_PLACEMENT_CONFIG_KEYS = (
+    'P_TX_MAX_RSSI', 'PATH_LOSS_EXPONENT_N', 'SHELF_ATTENUATION_DB', 'NOISE_STD_DEV_DB',
+    'MIN_RSSI_THRESHOLD', 'GRID_RESOLUTION_M', 'CELL_TYPE_PATH', 'CELL_TYPE_SHELF', 'AP_MARGIN_CELLS',
+    'AP_CANDIDATE_SPACING_M', 'AP_EVAL_FINGERPRINT_SPACING_M', 'AP_EVAL_QUERY_CELLS', 'AP_EVAL_TRIALS',
+    'AP_OBJECTIVE', 'AP_SWAP_ROUNDS', 'K_NEIGHBORS', 'USE_WEIGHTED_KNN', 'EPSILON_WEIGHT',
+)
+
+def candidate_cells(grid_map, spacing_m=None):
+    """Ô ứng viên đặt AP: lưới thưa trên các ô lối đi, cộng các ô sát tường (viền bản đồ) cùng bước."""
+    step = max(1, int(round((spacing_m or config.AP_CANDIDATE_SPACING_M) / config.GRID_RESOLUTION_M)))
+    selected = np.zeros(grid_map.shape, dtype=bool)
+    selected[::step, ::step] = True
+    selected[[0, -1], ::step] = True
+    selected[::step, [0, -1]] = True
+    selected &= grid_map == config.CELL_TYPE_PATH
+    return [tuple(cell) for cell in np.argwhere(selected).tolist()]
+
+class PlacementObjective:
+    """
+    Sai số định vị (mét) của một tập AP chọn từ danh sách ứng viên.
+    Fingerprint lấy trên lưới thưa các ô lối đi, sai số đo tại query_cells ô ngẫu nhiên,
+    mỗi ô trials quan sát; kết quả là trung bình hoặc p95 (config.AP_OBJECTIVE).
+    """
+    def __init__(self, grid_map, candidates, seed=None, fingerprint_spacing_m=None, query_cells=None,
+                 trials=None, k=None, weighted=None, objective=None):
+        self.candidates = [tuple(int(v) for v in cell) for cell in candidates]
+        self.k = k or config.K_NEIGHBORS
+        self.weighted = config.USE_WEIGHTED_KNN if weighted is None else weighted
+        self.objective = objective or config.AP_OBJECTIVE
+        trials = trials or config.AP_EVAL_TRIALS
+        rng = np.random.default_rng(seed)
+
+        walkable = grid_map == config.CELL_TYPE_PATH
+        step = max(1, int(round((fingerprint_spacing_m or config.AP_EVAL_FINGERPRINT_SPACING_M)
+                                / config.GRID_RESOLUTION_M)))
+        lattice = np.zeros(grid_map.shape, dtype=bool)
+        lattice[::step, ::step] = True
+        self.fingerprint_cells = np.argwhere(walkable & lattice)
+        walkable_cells = np.argwhere(walkable)
+        num_queries = min(query_cells or config.AP_EVAL_QUERY_CELLS, len(walkable_cells))
+        self.query_cells = walkable_cells[rng.choice(len(walkable_cells), num_queries, replace=False)]
+
+        # RSSI trung bình (path loss + suy hao kệ) từ mỗi ứng viên: (số ứng viên, số ô)
+        cells = np.concatenate((self.fingerprint_cells, self.query_cells))
+        mean_rssi = np.empty((len(self.candidates), len(cells)), dtype=np.float32)
+        for cand_idx, ap_pos in enumerate(self.candidates):
+            crossings = rssi_simulation.count_shelf_intersections_cells(ap_pos, grid_map, cells[:, 0], cells[:, 1])
+            mean_rssi[cand_idx] = rssi_simulation.mean_rssi_at_cells(ap_pos, cells[:, 0], cells[:, 1], crossings)
+        num_fingerprints = len(self.fingerprint_cells)
+        self.fingerprint_mean = mean_rssi[:, :num_fingerprints]
+        self.query_mean = mean_rssi[:, num_fingerprints:]
+        self.fingerprint_noise = rng.standard_normal((len(self.candidates), num_fingerprints)).astype(np.float32)
+        self.query_noise = rng.standard_normal((len(self.candidates), num_queries, trials)).astype(np.float32)
+
+    def nbytes(self):
+        return sum(values.nbytes for values in (self.fingerprint_mean, self.query_mean,
+                                                self.fingerprint_noise, self.query_noise))
+
+    def _noisy(self, cells, mean_rssi, standard_noise, ap_indices):
+        """Quan sát có nhiễu (số ô, T, số AP) cho tập AP từ mảng tính sẵn (AP, ô[, T])."""
+        return rssi_simulation.sample_observations_at_cells(
+            [self.candidates[idx] for idx in ap_indices], cells[:, 0], cells[:, 1],
+            mean_rssi[list(ap_indices)].T.astype(np.float64),
+            np.moveaxis(standard_noise[list(ap_indices)], 0, -1).reshape(len(cells), -1, len(ap_indices)))
+
+    def errors(self, ap_indices):
+        """Sai số (mét) của mọi quan sát đo: mảng (số ô đo, T)."""
+        fingerprint_rssi = self._noisy(self.fingerprint_cells, self.fingerprint_mean,
+                                       self.fingerprint_noise, ap_indices)[:, 0]
+        observations = self._noisy(self.query_cells, self.query_mean, self.query_noise, ap_indices)
+        fingerprints = FingerprintDB(self.fingerprint_cells, fingerprint_rssi)
+        if cKDTree is not None:
+            fingerprints.build_index()
+        estimates = fingerprints.predict_batch(observations.reshape(-1, len(ap_indices)), self.k, self.weighted,
+                                               config.EPSILON_WEIGHT).reshape(observations.shape[:2] + (2,))
+        return np.hypot(*(estimates - self.query_cells[:, None, :]).transpose(2, 0, 1)) * config.GRID_RESOLUTION_M
+
+    def __call__(self, ap_indices):
+        errors_m = self.errors(ap_indices)
+        return float(np.percentile(errors_m, 95) if self.objective == 'p95' else errors_m.mean())
+
+_worker_objective = None
+
+def _init_worker(objective):
+    global _worker_objective
+    _worker_objective = objective
+
+def _evaluate_in_worker(ap_indices):
+    return _worker_objective(ap_indices)
+
+@contextlib.contextmanager
+def _evaluator(objective, workers):
+    """Hàm đánh giá một danh sách tập AP; chạy song song trong ProcessPoolExecutor khi workers > 1."""
+    if workers == 1:
+        yield lambda ap_sets: [objective(ap_indices) for ap_indices in ap_sets]
+        return
+    # Mục tiêu (các mảng tính sẵn) được gửi cho mỗi worker một lần qua initializer
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(objective,)) as executor:
+        yield lambda ap_sets: list(executor.map(_evaluate_in_worker, ap_sets,
+                                                chunksize=max(1, len(ap_sets) // (4 * workers))))
+
+def optimize_access_points(grid_map, budget=None, candidates=None, baseline=None, seed=None, workers=None,
+                           swap_rounds=None, objective=None):
+    """
+    Chọn budget vị trí AP: thêm tham lam từng AP, rồi các vòng đổi chỗ (mỗi AP thử thay bằng
+    mọi ứng viên chưa dùng, nhận thay đổi tốt nhất) đến khi không cải thiện.
+    baseline: bố cục so sánh (mặc định 4 AP ở góc của define_access_points), luôn được thêm vào
+    tập ứng viên; khi truyền objective có sẵn thì mọi ô baseline phải nằm trong objective.candidates
+    (ngược lại ném ValueError). Trả về dict: 'access_points', 'error_m', 'baseline_access_points',
+    'baseline_error_m', 'improvement_pct', 'evaluations', 'time_s'.
+    """
+    start_time = time.perf_counter()
+    budget = budget or config.AP_BUDGET
+    swap_rounds = config.AP_SWAP_ROUNDS if swap_rounds is None else swap_rounds
+    workers = workers or config.AP_OPTIMIZER_WORKERS or os.cpu_count() or 1
+    if baseline is None:
+        baseline = map_utils.define_access_points(*grid_map.shape)
+    baseline = [tuple(int(v) for v in cell) for cell in baseline]
+    if objective is None:
+        candidates = candidates or candidate_cells(grid_map)
+        candidates = list(dict.fromkeys([tuple(int(v) for v in cell) for cell in candidates] + baseline))
+        objective = PlacementObjective(grid_map, candidates, seed)
+    candidate_lookup = {cell: idx for idx, cell in enumerate(objective.candidates)}
+    missing = [cell for cell in baseline if cell not in candidate_lookup]
+    if missing:
+        raise ValueError(f"Ô baseline {missing} không thuộc tập ứng viên của objective; "
+                         f"thêm chúng vào candidates hoặc truyền baseline khác")
+    if budget > len(objective.candidates):
+        raise ValueError(f"Chỉ có {len(objective.candidates)} ô ứng viên cho {budget} AP")
+    evaluations = 0
+
+    with _evaluator(objective, workers) as evaluate:
+        baseline_error = evaluate([tuple(candidate_lookup[cell] for cell in baseline)])[0]
+        chosen = []
+        for _ in range(budget):
+            options = [idx for idx in range(len(objective.candidates)) if idx not in chosen]
+            option_errors = evaluate([tuple(chosen + [idx]) for idx in options])
+            evaluations += len(options)
+            chosen.append(options[int(np.argmin(option_errors))])
+            best_error = min(option_errors)
+        if len(baseline) == budget and baseline_error < best_error: # Bắt đầu đổi chỗ từ bố cục tốt hơn
+            chosen, best_error = [candidate_lookup[cell] for cell in baseline], baseline_error
+
+        for _ in range(swap_rounds):
+            improved = False
+            for slot in range(budget):
+                options = [idx for idx in range(len(objective.candidates)) if idx not in chosen]
+                trial_sets = [tuple(chosen[:slot] + [idx] + chosen[slot + 1:]) for idx in options]
+                option_errors = evaluate(trial_sets)
+                evaluations += len(options)
+                best_option = int(np.argmin(option_errors))
+                if option_errors[best_option] < best_error:
+                    chosen, best_error = list(trial_sets[best_option]), option_errors[best_option]
+                    improved = True
+            if not improved:
+                break
+
+    return {
+        'access_points': [objective.candidates[idx] for idx in chosen],
+        'error_m': best_error,
+        'baseline_access_points': baseline,
+        'baseline_error_m': baseline_error,
+        'improvement_pct': 100 * (baseline_error - best_error) / baseline_error if baseline_error > 0 else 0.0,
+        'evaluations': evaluations,
+        'time_s': time.perf_counter() - start_time,
+    }
+
+def load_or_optimize_access_points(grid_map, budget=None, seed=None, cache_dir=None):
+    """
+    Như optimize_access_points nhưng lưu kết quả vào cache trên đĩa (map_cache), khóa theo bản đồ,
+    budget, seed và tham số vô tuyến/đánh giá trong config. Khi seed là None (kể cả config.RANDOM_SEED)
+    thì mục tiêu rút nhiễu ngẫu nhiên nên không dùng cache. Trả về dict: 'access_points', 'error_m',
+    'baseline_access_points', 'baseline_error_m', 'improvement_pct', 'from_cache'.
+    """
+    budget = budget or config.AP_BUDGET
+    seed = config.RANDOM_SEED if seed is None else seed
+    use_cache = config.CACHE_ENABLED and seed is not None
+    if use_cache:
+        key = map_cache.make_cache_key('ap_placement', grid_map, {
+            'budget': budget,
+            'seed': seed,
+            'config': {name: getattr(config, name) for name in _PLACEMENT_CONFIG_KEYS},
+        })
+        arrays = map_cache.load_entry('ap_placement', key, cache_dir)
+        if arrays is not None:
+            error_m, baseline_error_m = (float(value) for value in arrays['errors'])
+            return {
+                'access_points': [tuple(cell) for cell in arrays['access_points'].tolist()],
+                'error_m': error_m,
+                'baseline_access_points': [tuple(cell) for cell in arrays['baseline_access_points'].tolist()],
+                'baseline_error_m': baseline_error_m,
+                'improvement_pct': 100 * (baseline_error_m - error_m) / baseline_error_m if baseline_error_m > 0 else 0.0,
+                'from_cache': True,
+            }
+
+    result = optimize_access_points(grid_map, budget, seed=seed)
+    if use_cache:
+        map_cache.store_entry('ap_placement', key, {
+            'access_points': np.array(result['access_points'], dtype=np.int64).reshape(-1, 2),
+            'baseline_access_points': np.array(result['baseline_access_points'], dtype=np.int64).reshape(-1, 2),
+            'errors': np.array([result['error_m'], result['baseline_error_m']]),
+        }, cache_dir)
+    return dict(result, from_cache=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Tối ưu vị trí đặt AP theo sai số định vị mô phỏng")
+    parser.add_argument('--budget', type=int, default=config.AP_BUDGET)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    grid_map, num_rows, num_cols = map_utils.create_base_map()
+    map_utils.add_shelf(grid_map, num_rows // 4, num_cols // 4, num_rows // 2, 2)
+    map_utils.add_shelf(grid_map, num_rows // 4, (num_cols * 3 // 4) - 2, num_rows // 2, 2)
+    result = optimize_access_points(grid_map, args.budget, seed=args.seed, workers=args.workers)
+    print(f"{result['evaluations']} lần đánh giá trong {result['time_s']:.1f}s")
+    print(f"AP ở góc: {result['baseline_access_points']}, sai số {result['baseline_error_m']:.2f}m")
+    print(f"AP tối ưu: {result['access_points']}, sai số {result['error_m']:.2f}m "
+          f"(giảm {result['improvement_pct']:.1f}%)")
+
+    # Kiểm tra lại bằng đánh giá Monte-Carlo đầy đủ (fingerprint mọi ô, nhiễu mới)
+    for label, access_points in (('góc', result['baseline_access_points']), ('tối ưu', result['access_points'])):
+        fingerprints = FingerprintDB.from_rssi_grid(rssi_simulation.generate_rssi_fingerprint_array(
+            grid_map, access_points, args.seed + 1))
+        error_maps = error_heatmap.evaluate_localization_error(grid_map, access_points, fingerprints,
+                                                               trials=20, seed=args.seed + 2)
+        print(f"Đánh giá đầy đủ ({label}): sai số trung bình {error_heatmap.summarize(error_maps)['mean_m']:.2f}m")
+
+if __name__ == "__main__":
+    main()
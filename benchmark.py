@@ -0,0 +1,360 @@
+# benchmark.py
+"""
+Benchmark không cần màn hình cho mô phỏng, định vị và tìm đường.
+Ví dụ:
+    python benchmark.py --sizes 50x30,100x60 --resolutions 0.5,0.25 --aps 4,8 --k 3,5 --output bench.json
+    python benchmark.py --sizes 200x120 --resolutions 0.25 --aps 16 --workers 1,2,4
+Kết quả là JSON: mỗi cấu hình có độ trễ p50/p95, thông lượng, bộ nhớ đỉnh và sai số định vị.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import config
+import map_utils
+import rssi_simulation
+import localization_algorithms
+import path_planning
+import parallel_fingerprints
+import walkable_index
+import instrumentation
+import incremental_planner
+from fingerprint_db import build_fingerprint_db
+
+@contextlib.contextmanager
+def config_overrides(**overrides):
+    """Tạm thời ghi đè các tham số trong config, khôi phục khi thoát."""
+    saved = {name: getattr(config, name) for name in overrides}
+    try:
+        for name, value in overrides.items():
+            setattr(config, name, value)
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(config, name, value)
+
+def latency_stats(latencies_s):
+    """Thống kê độ trễ (ms) và thông lượng (thao tác/giây) từ danh sách thời gian (giây)."""
+    latencies = np.asarray(latencies_s, dtype=np.float64)
+    if latencies.size == 0:
+        return {'count': 0}
+    return {
+        'count': int(latencies.size),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'mean_ms': float(latencies.mean() * 1000),
+        'throughput_per_s': float(latencies.size / latencies.sum()) if latencies.sum() > 0 else None,
+    }
+
+def error_stats(errors_m):
+    errors = np.asarray(errors_m, dtype=np.float64)
+    return {
+        'mean_m': float(errors.mean()),
+        'p95_m': float(np.percentile(errors, 95)),
+        'max_m': float(errors.max()),
+    }
+
+@contextlib.contextmanager
+def measure_peak_memory(result):
+    """Ghi bộ nhớ đỉnh (MB, theo tracemalloc) của khối lệnh vào result['peak_memory_mb']."""
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['peak_memory_mb'] = peak / (1024 * 1024)
+
+def build_benchmark_store(num_aps):
+    """Bố cục siêu thị tổng hợp theo kích thước trong config: kệ dọc dày 2 ô cách nhau 4 ô, AP phân bố đều."""
+    grid_map, num_rows, num_cols = map_utils.create_base_map()
+    margin = config.AP_MARGIN_CELLS + 2
+    for col_start in range(margin, num_cols - margin - 2, 6):
+        map_utils.add_shelf(grid_map, num_rows // 6, col_start, num_rows * 2 // 3, 2)
+
+    # AP đặt theo lưới gần vuông trên các ô lối đi, bốn góc trước tiên
+    access_points = map_utils.define_access_points(num_rows, num_cols)[:num_aps]
+    if num_aps > len(access_points):
+        grid_side = int(np.ceil(np.sqrt(num_aps)))
+        rows = np.linspace(config.AP_MARGIN_CELLS, num_rows - 1 - config.AP_MARGIN_CELLS, grid_side + 2)[1:-1]
+        cols = np.linspace(config.AP_MARGIN_CELLS, num_cols - 1 - config.AP_MARGIN_CELLS, grid_side + 2)[1:-1]
+        for r in rows:
+            for c in cols:
+                if len(access_points) >= num_aps:
+                    break
+                access_points.append((int(round(r)), int(round(c))))
+    return grid_map, access_points
+
+def knn_stage(fingerprints, observations, query_cells, k, use_strongest_aps):
+    """Độ trễ KNN từng quan sát, sai số định vị và thông lượng theo lô cho một K."""
+    stage = {}
+    latencies, errors = [], []
+    for observed, cell in zip(observations, query_cells):
+        start_time = time.perf_counter()
+        estimate = localization_algorithms.predict_location_knn(
+            observed, fingerprints, k, config.USE_WEIGHTED_KNN, config.EPSILON_WEIGHT,
+            use_strongest_aps=use_strongest_aps)
+        latencies.append(time.perf_counter() - start_time)
+        errors.append(rssi_simulation.euclidean_distance_m(cell, estimate))
+    stage['single'] = latency_stats(latencies)
+    stage['localization_error'] = error_stats(errors)
+
+    batch = {}
+    with measure_peak_memory(batch):
+        start_time = time.perf_counter()
+        localization_algorithms.predict_location_knn_batch(
+            observations, fingerprints, k, config.USE_WEIGHTED_KNN, config.EPSILON_WEIGHT,
+            use_strongest_aps=use_strongest_aps)
+        batch['time_s'] = time.perf_counter() - start_time
+    batch['observations'] = int(len(observations))
+    batch['throughput_per_s'] = len(observations) / batch['time_s']
+    stage['batch'] = batch
+    return stage
+
+def benchmark_configuration(width_m, height_m, resolution_m, num_aps, k_values, num_queries, rng,
+                            worker_counts=()):
+    """Chạy mọi giai đoạn benchmark cho một cấu hình sàn/độ phân giải/số AP."""
+    result = {'width_m': width_m, 'height_m': height_m, 'resolution_m': resolution_m, 'num_aps': num_aps}
+    instrumentation.reset()
+    with config_overrides(SUPERMARKET_WIDTH_M=width_m, SUPERMARKET_HEIGHT_M=height_m,
+                          GRID_RESOLUTION_M=resolution_m):
+        grid_map, access_points = build_benchmark_store(num_aps)
+        walkable_cells = np.argwhere(grid_map == config.CELL_TYPE_PATH)
+        result['num_cells'] = int(grid_map.size)
+        result['num_walkable_cells'] = int(len(walkable_cells))
+
+        # --- Tạo fingerprint ---
+        stage = {}
+        with measure_peak_memory(stage):
+            start_time = time.perf_counter()
+            shelf_crossing_maps = rssi_simulation.compute_shelf_crossing_maps(grid_map, access_points)
+            # Giữ bản float64 gốc làm chuẩn so sánh cho các kiểu lưu lượng tử hóa
+            exact_fingerprints = build_fingerprint_db(grid_map, access_points, int(rng.integers(2**31)),
+                                                      shelf_crossing_maps, storage='float64')
+            fingerprints = exact_fingerprints.with_storage()
+            stage['time_s'] = time.perf_counter() - start_time
+        stage['cells_per_s'] = grid_map.size * num_aps / stage['time_s']
+        result['fingerprint_generation'] = stage
+
+        # --- Tạo fingerprint song song theo tile: khả năng mở rộng theo số tiến trình ---
+        if worker_counts:
+            parallel_seed = int(rng.integers(2**31))
+            scaling, reference = [], None
+            for workers in worker_counts:
+                start_time = time.perf_counter()
+                rssi_grid, _ = parallel_fingerprints.generate_rssi_fingerprint_array_parallel(
+                    grid_map, access_points, parallel_seed, workers=workers)
+                elapsed_s = time.perf_counter() - start_time
+                if reference is None:
+                    reference = (elapsed_s, rssi_grid)
+                scaling.append({
+                    'workers': workers,
+                    'time_s': elapsed_s,
+                    'speedup': reference[0] / elapsed_s,
+                    'matches_first': bool(np.array_equal(rssi_grid, reference[1], equal_nan=True)),
+                })
+            result['parallel_fingerprint_generation'] = {
+                'tile_rows': config.FINGERPRINT_TILE_ROWS,
+                'scaling': scaling,
+            }
+
+        # Quan sát ngẫu nhiên tại các ô lối đi
+        query_cells = walkable_cells[rng.integers(len(walkable_cells), size=num_queries)]
+        observations = np.array([
+            rssi_simulation.get_observed_rssi_at_cart(tuple(cell), grid_map, access_points, shelf_crossing_maps)
+            for cell in query_cells.tolist()
+        ])
+
+        # --- KNN đơn lẻ và theo lô cho từng K: so toàn bộ vector và theo N AP mạnh nhất ---
+        result['strongest_ap_index'] = fingerprints.build_strongest_ap_index()
+        result['knn'] = []
+        for k in k_values:
+            knn_result = {'k': k}
+            knn_result.update(knn_stage(fingerprints, observations, query_cells, k, use_strongest_aps=False))
+            knn_result['strongest_ap'] = knn_stage(fingerprints, observations, query_cells, k, use_strongest_aps=True)
+            result['knn'].append(knn_result)
+
+        # --- Lưu fingerprint lượng tử hóa: bộ nhớ, tốc độ và sai số so với float64 trên cùng quan sát ---
+        result['fingerprint_storage'] = []
+        reference = None
+        # Quan sát có ít nhất 2 AP vượt ngưỡng; quan sát còn lại trùng khoảng cách với rất nhiều
+        # fingerprint chạm ngưỡng -95 dBm nên láng giềng được chọn gần như tùy ý ở mọi kiểu lưu
+        localizable = (observations > config.MIN_RSSI_THRESHOLD).sum(axis=1) >= 2
+        for storage in ('float64', 'float32', 'uint8', 'int8'):
+            stored = exact_fingerprints.with_storage(storage)
+            storage_result = {'storage': storage,
+                              'rssi_bytes': stored.quantized.nbytes() if stored.quantized else stored.rssi.nbytes}
+            storage_result.update(knn_stage(stored, observations, query_cells, k_values[0], use_strongest_aps=False))
+            estimates = stored.predict_batch(observations, k_values[0], config.USE_WEIGHTED_KNN)
+            errors_m = np.hypot(*(estimates - query_cells).T) * config.GRID_RESOLUTION_M
+            if reference is None:
+                reference = (estimates, errors_m, storage_result['rssi_bytes'])
+            shift_m = np.hypot(*(estimates - reference[0]).T) * config.GRID_RESOLUTION_M
+            storage_result['vs_float64'] = {
+                'memory_reduction': reference[2] / storage_result['rssi_bytes'],
+                'mean_error_delta_m': float(errors_m.mean() - reference[1].mean()),
+                'localizable_fraction': float(localizable.mean()),
+                'localizable_mean_error_delta_m': (float(errors_m[localizable].mean() - reference[1][localizable].mean())
+                                                   if localizable.any() else None),
+                'mean_estimate_shift_m': float(shift_m.mean()),
+                'within_one_cell': float(np.mean(shift_m <= config.GRID_RESOLUTION_M)),
+            }
+            result['fingerprint_storage'].append(storage_result)
+
+        # --- Tìm đường A* ---
+        planner_stage = {}
+        start_time = time.perf_counter()
+        planner = path_planning.GridPlanner(grid_map)
+        planner_stage['build_time_s'] = time.perf_counter() - start_time
+        latencies, expanded, paths = [], [], []
+        for _ in range(max(1, num_queries // 10)):
+            start, end = walkable_cells[rng.integers(len(walkable_cells), size=2)].tolist()
+            start_time = time.perf_counter()
+            path = planner.find_path(tuple(start), tuple(end))
+            latencies.append(time.perf_counter() - start_time)
+            expanded.append(planner.last_expanded)
+            if path:
+                paths.append(path)
+        planner_stage['query'] = latency_stats(latencies)
+        planner_stage['mean_nodes_expanded'] = float(np.mean(expanded))
+        result['path_planning'] = planner_stage
+
+        # --- Tìm lại đường tăng dần (D* Lite): lối đi phía trước bị chặn khi xe đi được nửa đường ---
+        lookahead = config.DYNAMIC_OBSTACLE_LOOKAHEAD_CELLS
+        initial_latencies, initial_expanded, replan_latencies, replan_expanded = [], [], [], []
+        astar_latencies, astar_expanded, planner_bytes = [], [], 0
+        for path in paths:
+            if len(path) < 2 * lookahead + 2:
+                continue
+            goal = path[-1]
+            incremental = incremental_planner.DStarLitePlanner(grid_map, path[0], goal)
+            start_time = time.perf_counter()
+            route = incremental.plan()
+            initial_latencies.append(time.perf_counter() - start_time)
+            initial_expanded.append(incremental.last_expanded)
+            cart = route[len(route) // 2]
+            ahead = route[min(len(route) // 2 + lookahead, len(route) - 2)]
+            incremental.block_cells([cell for cell in incremental_planner.cells_around(
+                ahead, config.DYNAMIC_OBSTACLE_RADIUS_CELLS) if cell not in (cart, goal)])
+            start_time = time.perf_counter()
+            incremental.plan(cart)
+            replan_latencies.append(time.perf_counter() - start_time)
+            replan_expanded.append(incremental.last_expanded)
+            planner_bytes = max(planner_bytes, incremental.nbytes())
+            # So sánh: A* tìm lại từ đầu trên cùng lưới có vật cản
+            for cell in incremental.blocked_cells:
+                planner.set_walkable(cell, False)
+            start_time = time.perf_counter()
+            planner.find_path(cart, goal)
+            astar_latencies.append(time.perf_counter() - start_time)
+            astar_expanded.append(planner.last_expanded)
+            for cell in incremental.blocked_cells:
+                planner.set_walkable(cell, True)
+        if replan_latencies:
+            result['dynamic_replanning'] = {
+                'initial_plan': latency_stats(initial_latencies),
+                'initial_mean_nodes_expanded': float(np.mean(initial_expanded)),
+                'replan': latency_stats(replan_latencies),
+                'replan_mean_nodes_expanded': float(np.mean(replan_expanded)),
+                'astar_replan': latency_stats(astar_latencies),
+                'astar_mean_nodes_expanded': float(np.mean(astar_expanded)),
+                'planner_bytes': planner_bytes,
+            }
+
+        # --- Bộ nhớ theo thành phần (byte) ---
+        result['memory_bytes'] = walkable_index.memory_report(
+            grid=grid_map, fingerprints=fingerprints, shelf_crossings=shelf_crossing_maps, planner=planner)
+
+        # --- Mô phỏng di chuyển (quan sát + định vị từng bước, không vẽ, không sleep) ---
+        movement = {}
+        latencies, errors = [], []
+        for path in paths:
+            for step in path:
+                start_time = time.perf_counter()
+                observed = rssi_simulation.get_observed_rssi_at_cart(step, grid_map, access_points,
+                                                                     shelf_crossing_maps)
+                estimate = localization_algorithms.predict_location_knn(
+                    observed, fingerprints, config.K_NEIGHBORS, config.USE_WEIGHTED_KNN, config.EPSILON_WEIGHT,
+                    use_strongest_aps=config.KNN_STRONGEST_AP_INDEX)
+                latencies.append(time.perf_counter() - start_time)
+                errors.append(rssi_simulation.euclidean_distance_m(step, estimate))
+        movement['step'] = latency_stats(latencies)
+        if errors:
+            movement['localization_error'] = error_stats(errors)
+        result['movement_simulation'] = movement
+    if instrumentation.is_enabled():
+        result['instrumentation'] = instrumentation.stats()
+    return result
+
+def run_benchmarks(sizes, resolutions, ap_counts, k_values, num_queries, seed, worker_counts=()):
+    rng = np.random.default_rng(seed)
+    results = []
+    for width_m, height_m in sizes:
+        for resolution_m in resolutions:
+            for num_aps in ap_counts:
+                print(f"Benchmark {width_m}x{height_m}m, {resolution_m}m/ô, {num_aps} AP...", file=sys.stderr)
+                results.append(benchmark_configuration(width_m, height_m, resolution_m, num_aps,
+                                                       k_values, num_queries, rng, worker_counts))
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'fingerprint_engine': config.FINGERPRINT_ENGINE,
+            'seed': seed,
+            'num_queries': num_queries,
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+
+def _parse_list(text, cast):
+    return [cast(part) for part in text.split(',') if part.strip()]
+
+def _parse_size(text):
+    width_m, height_m = text.lower().split('x')
+    return float(width_m), float(height_m)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark không cần màn hình cho WinCart2")
+    parser.add_argument('--sizes', default=f"{config.SUPERMARKET_WIDTH_M}x{config.SUPERMARKET_HEIGHT_M}",
+                        help="Danh sách kích thước sàn RỘNGxCAO (mét), cách nhau bởi dấu phẩy")
+    parser.add_argument('--resolutions', default=str(config.GRID_RESOLUTION_M),
+                        help="Danh sách GRID_RESOLUTION_M (mét/ô)")
+    parser.add_argument('--aps', default='4', help="Danh sách số AP")
+    parser.add_argument('--k', default=str(config.K_NEIGHBORS), help="Danh sách K_NEIGHBORS")
+    parser.add_argument('--queries', type=int, default=200, help="Số quan sát mỗi cấu hình")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', default='',
+                        help="Danh sách số tiến trình cho engine 'parallel', ví dụ 1,2,4 (bỏ trống = không đo)")
+    parser.add_argument('--output', default=None, help="Tệp JSON đầu ra (mặc định in ra stdout)")
+    parser.add_argument('--instrument', action='store_true',
+                        help="Bật instrumentation và ghi thống kê từng giai đoạn vào mỗi cấu hình")
+    args = parser.parse_args()
+    if args.instrument:
+        instrumentation.enable()
+
+    report = run_benchmarks(
+        [_parse_size(size) for size in args.sizes.split(',') if size.strip()],
+        _parse_list(args.resolutions, float),
+        _parse_list(args.aps, int),
+        _parse_list(args.k, int),
+        args.queries,
+        args.seed,
+        _parse_list(args.workers, int),
+    )
+    report_json = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(report_json)
+        print(f"Đã ghi kết quả vào {args.output}")
+    else:
+        print(report_json)
+
+if __name__ == "__main__":
+    main()
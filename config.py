@@ -11,6 +11,7 @@ CELL_TYPE_SHELF = 1
 
 # --- Vị trí AP (tọa độ ô lưới) ---
 AP_MARGIN_CELLS = 2 # Số ô cách mép
+ACCESS_POINT_LAYOUT = 'corners' # 'corners' (4 góc) hoặc 'optimized' (ap_placement, theo sai số mô phỏng)
 
 # --- Tham số Mô phỏng RSSI ---
 P_TX_MAX_RSSI = -30     # dBm (RSSI tối đa khi ở rất gần AP, không vật cản)
@@ -19,10 +20,85 @@ SHELF_ATTENUATION_DB = 4.0 # Suy hao qua mỗi đơn vị kệ hàng (dB)
 NOISE_STD_DEV_DB = 3.0     # Độ lệch chuẩn của nhiễu Gaussian (dB)
 MIN_RSSI_THRESHOLD = -95   # Ngưỡng RSSI tối thiểu có thể phát hiện
 
+# --- Tham số tạo fingerprint ---
+FINGERPRINT_ENGINE = 'vectorized' # 'vectorized' (mảng NumPy), 'parallel' (tile đa tiến trình) hoặc 'loop' (vòng lặp từng ô)
+RANDOM_SEED = 42                  # Seed cho numpy.random.Generator (None = ngẫu nhiên, không dùng cache)
+FINGERPRINT_WORKERS = None        # Số tiến trình cho engine 'parallel' (None = số lõi CPU)
+FINGERPRINT_TILE_ROWS = 64        # Số hàng mỗi tile của engine 'parallel' (ảnh hưởng đến chuỗi nhiễu)
+
+# --- Cache fingerprint trên đĩa ---
+CACHE_ENABLED = True
+CACHE_DIR = '.wincart_cache' # Thư mục chứa các tệp .npy (mở bằng mmap_mode)
+CACHE_MAX_ENTRIES = 8        # Số mục tối đa giữ lại cho mỗi loại artifact (xóa mục ít dùng nhất)
+
 # --- Tham số KNN ---
 K_NEIGHBORS = 3
 USE_WEIGHTED_KNN = True
 EPSILON_WEIGHT = 1e-6 # Giá trị nhỏ để tránh chia cho 0 trong weighted KNN
+KNN_USE_INDEX = False      # Xây chỉ mục KD-tree (cần scipy) để tìm KNN dưới tuyến tính
+KNN_INDEX_LEAF_SIZE = 16   # Số điểm tối đa trong một lá của KD-tree
+KNN_APPROX_EPSILON = 0.0   # Sai số tương đối cho phép khi tìm qua chỉ mục (0 = chính xác)
+KNN_BATCH_MAX_DISTANCES = 4_000_000 # Số phần tử tối đa của ma trận khoảng cách mỗi khối khi dự đoán theo lô
+FINGERPRINT_STORAGE = 'float64'    # Kiểu lưu RSSI fingerprint: 'float64', 'float32', 'uint8' hoặc 'int8' (lượng tử hóa, KNN tính thẳng trên mã)
+FINGERPRINT_QUANT_BLOCK_ROWS = 65536 # Số fingerprint mỗi khối khi giải mã tạm sang float32 để tính khoảng cách
+KNN_STRONGEST_AP_INDEX = False     # Định vị theo N AP mạnh nhất: chỉ so với fingerprint cùng tập AP mạnh, RSSI dưới ngưỡng coi là thiếu
+STRONGEST_AP_TOP_N = 4             # Số AP mạnh nhất dùng để đánh chỉ mục fingerprint và chọn ứng viên
+STRONGEST_AP_MAX_MISMATCH = 1      # Số AP mạnh của quan sát được phép không có trong top-N của ứng viên
+STRONGEST_AP_MISSING_PENALTY_DB = 15.0 # Phạt tối đa (dB) cho AP chỉ quan sát hoặc chỉ fingerprint thấy: min(RSSI - ngưỡng, phạt)
+
+# --- Tham số bộ theo dõi theo thời gian ---
+MOVEMENT_LOCALIZER = 'tracker'    # Định vị khi di chuyển: 'knn' (theo lô), 'tracker' (cửa sổ + Kalman), 'particle_filter'
+TRACKER_WINDOW_RADIUS_M = 4.0     # Bán kính cửa sổ tìm kiếm tối thiểu quanh vị trí dự đoán (mét)
+TRACKER_MAX_WINDOW_RADIUS_M = 15.0 # Bán kính cửa sổ tối đa khi tự giãn theo độ lệch đo (mét)
+TRACKER_RADIUS_ADAPT_RATE = 0.1   # Hệ số trung bình trượt của độ lệch đo - dự đoán
+TRACKER_BUCKET_SIZE_M = 4.0       # Kích thước bucket của chỉ mục không gian (mét)
+TRACKER_FALLBACK_FACTOR = 1.0     # Khớp kém hơn hệ số này * khoảng cách kỳ vọng thì tìm toàn cục
+TRACKER_PROCESS_NOISE_M = 0.25    # Độ lệch chuẩn gia tốc của mô hình vận tốc không đổi (mét/bước^2)
+TRACKER_MEASUREMENT_NOISE_M = 2.0 # Độ lệch chuẩn sai số đo của KNN (mét)
+
+# --- Tham số dịch vụ theo dõi nhiều xe đẩy ---
+TRACKING_TICK_S = 0.05        # Độ dài một tick gom báo cáo RSSI thành một lô (giây)
+TRACKING_MAX_BATCH = 20000    # Số báo cáo tối đa trong một lô định vị
+
+# --- Tham số bộ lọc hạt ---
+PF_NUM_PARTICLES = 2000      # Số hạt cho mỗi xe đẩy
+PF_MOTION_STD_M = 0.5        # Độ lệch chuẩn bước di chuyển ngẫu nhiên của hạt mỗi bước (mét)
+PF_RESAMPLE_THRESHOLD = 0.5  # Lấy mẫu lại khi số hạt hiệu dụng < hệ số này * số hạt
+
+# --- Tham số đánh giá sai số Monte-Carlo ---
+HEATMAP_TRIALS = 100                 # Số quan sát có nhiễu rút cho mỗi ô lối đi
+HEATMAP_CHUNK_OBSERVATIONS = 100_000 # Số quan sát (ô x lần thử) tối đa định vị trong một khối
+HEATMAP_USE_INDEX = True             # Định vị các khối qua KD-tree (cần scipy), nhanh hơn nhiều khi ít AP
+
+# --- Tham số tối ưu vị trí AP ---
+AP_BUDGET = 4                     # Số AP cần đặt
+AP_CANDIDATE_SPACING_M = 4.0      # Khoảng cách lưới ô ứng viên đặt AP (trên lối đi và sát tường)
+AP_EVAL_FINGERPRINT_SPACING_M = 1.0 # Khoảng cách lưới fingerprint dùng khi đánh giá mục tiêu
+AP_EVAL_QUERY_CELLS = 400         # Số ô lối đi ngẫu nhiên dùng để đo sai số
+AP_EVAL_TRIALS = 5                # Số quan sát có nhiễu mỗi ô đo
+AP_OBJECTIVE = 'mean'             # Mục tiêu cần giảm: 'mean' (sai số trung bình) hoặc 'p95'
+AP_SWAP_ROUNDS = 3                # Số vòng đổi chỗ tối đa sau bước thêm tham lam
+AP_OPTIMIZER_WORKERS = None       # Số tiến trình đánh giá ứng viên song song (None = số lõi CPU)
+
+# --- Tham số đo hiệu năng ---
+INSTRUMENTATION_ENABLED = False   # Ghi số lần gọi, độ trễ và số phần tử xử lý của các giai đoạn nóng
+INSTRUMENTATION_OUTPUT = None     # Tệp JSON ghi thống kê khi kết thúc chương trình (None = chỉ in ra terminal)
+
+# --- Tham số tìm đường ---
+PATHFINDING_BACKEND = 'numpy' # 'numpy' (GridPlanner dựng một lần) hoặc 'pathfinding' (thư viện ngoài)
+DISTANCE_FIELD_SCALE = 10     # Khoảng cách trong trường khoảng cách lưu dạng uint16 = số ô * hệ số này
+ROUTE_EXACT_MAX_ITEMS = 10    # Danh sách mua sắm tối đa bao nhiêu món thì giải chính xác (Held-Karp)
+ROUTE_TWO_OPT_MAX_ROUNDS = 20 # Số vòng 2-opt + chọn lại điểm tiếp cận tối đa của heuristic
+DYNAMIC_OBSTACLE_DEMO = False       # Chặn lối đi phía trước xe giữa chặng đầu để minh họa tìm lại đường tăng dần (D* Lite)
+DYNAMIC_OBSTACLE_LOOKAHEAD_CELLS = 6 # Vật cản minh họa xuất hiện cách xe bao nhiêu ô trên đường đi
+DYNAMIC_OBSTACLE_RADIUS_CELLS = 1    # Bán kính mặc định (ô, hình vuông) của vật cản minh họa và lệnh 'b'
+
+# --- Cửa hàng nhiều tầng / nhiều khu vực ---
+ZONE_MEMORY_BUDGET_MB = 256 # Tổng bộ nhớ tối đa của các khu đang nạp (lưới, fingerprint, trường khoảng cách); vượt thì loại khu ít dùng nhất
+ZONE_LINK_COST_M = {'escalator': 15.0, 'lift': 30.0, 'passage': 0.0} # Chi phí quy đổi (mét đi bộ) của mỗi loại cổng nối khu
+
+# --- Tham số hiển thị ---
+RENDER_MODE = 'blit' # 'blit' (artist tạo một lần, chỉ vẽ lại phần động trên nền tĩnh đã lưu) hoặc 'redraw' (vẽ lại toàn bộ)
 
 # --- Màu sắc cho trực quan hóa ---
 COLOR_PATH_LINE = 'cyan'
@@ -32,4 +108,6 @@ COLOR_CART_ESTIMATED_MARKER = 'green'
 COLOR_ERROR_LINE = 'magenta'
 COLOR_AP_MARKER = 'red'
 COLOR_SHELF_ON_MAP = 'gray' # Màu cho kệ hàng trên bản đồ chính
-COLOR_PATH_ON_MAP = 'white' # Màu cho lối đi trên bản đồ chính  
\ No newline at end of file
+COLOR_PATH_ON_MAP = 'white' # Màu cho lối đi trên bản đồ chính  
+ERROR_HEATMAP_CMAP = 'magma_r' # Bảng màu lớp phủ bản đồ sai số định vị
+ERROR_HEATMAP_ALPHA = 0.6      # Độ trong suốt của lớp phủ bản đồ sai số
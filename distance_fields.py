@@ -0,0 +1,326 @@
+# distance_fields.py
+import heapq
+import numpy as np
+import config
+import instrumentation
+from path_planning import NEIGHBOR_MOVES, SQRT2
+
+try:
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+except ImportError: # scipy là tùy chọn; không có thì dùng Dijkstra thuần Python
+    csgraph_dijkstra = None
+
+UNREACHABLE_DISTANCE = np.iinfo(np.uint16).max # Giá trị uint16 đánh dấu ô không tới được
+NO_DIRECTION = -1 # Ô đích, ô kệ hoặc ô không tới được
+
+# Bảng tra (dr + 1) * 3 + (dc + 1) -> chỉ số hướng trong NEIGHBOR_MOVES
+_DIRECTION_LUT = np.full(9, NO_DIRECTION, dtype=np.int8)
+for _dir_idx, (_dr, _dc, _) in enumerate(NEIGHBOR_MOVES):
+    _DIRECTION_LUT[(_dr + 1) * 3 + (_dc + 1)] = _dir_idx
+
+def _shifted_slices(dr, dc, num_rows, num_cols):
+    """Cặp slice (nguồn, đích) sao cho đích = nguồn + (dr, dc) trên toàn lưới."""
+    src = (slice(max(0, -dr), num_rows - max(0, dr)), slice(max(0, -dc), num_cols - max(0, dc)))
+    dst = (slice(max(0, dr), num_rows - max(0, -dr)), slice(max(0, dc), num_cols - max(0, -dc)))
+    return src, dst
+
+def _walkable_graph(walkable):
+    """Đồ thị thưa vô hướng 8 hướng trên các ô đi được; trả về (graph, cell_ids)."""
+    num_rows, num_cols = walkable.shape
+    num_cells = int(np.count_nonzero(walkable))
+    cell_ids = np.full(walkable.shape, -1, dtype=np.int64)
+    cell_ids[walkable] = np.arange(num_cells)
+    edge_src, edge_dst, edge_cost = [], [], []
+    # Chỉ cần 4 hướng "tiến"; đồ thị vô hướng tự có chiều ngược lại
+    for dr, dc, cost in NEIGHBOR_MOVES:
+        if (dr, dc) not in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            continue
+        src, dst = _shifted_slices(dr, dc, num_rows, num_cols)
+        both = walkable[src] & walkable[dst]
+        edge_src.append(cell_ids[src][both])
+        edge_dst.append(cell_ids[dst][both])
+        edge_cost.append(np.full(edge_src[-1].shape, cost))
+    graph = coo_matrix((np.concatenate(edge_cost), (np.concatenate(edge_src), np.concatenate(edge_dst))),
+                       shape=(num_cells, num_cells)).tocsr()
+    return graph, cell_ids
+
+def _dijkstra_python(walkable, source):
+    """Dijkstra thuần Python từ một ô nguồn; trả về (khoảng cách float, hàng cha, cột cha)."""
+    num_rows, num_cols = walkable.shape
+    distances = np.full(walkable.shape, np.inf)
+    parent_r = np.full(walkable.shape, -1, dtype=np.int64)
+    parent_c = np.full(walkable.shape, -1, dtype=np.int64)
+    walkable_list = walkable.tolist()
+    dist_list = distances.tolist()
+    parents = {}
+    dist_list[source[0]][source[1]] = 0.0
+    open_heap = [(0.0, source)]
+    while open_heap:
+        node_dist, (r, c) = heapq.heappop(open_heap)
+        if node_dist > dist_list[r][c]:
+            continue
+        for dr, dc, move_cost in NEIGHBOR_MOVES:
+            n_r, n_c = r + dr, c + dc
+            if 0 <= n_r < num_rows and 0 <= n_c < num_cols and walkable_list[n_r][n_c]:
+                new_dist = node_dist + move_cost
+                if new_dist < dist_list[n_r][n_c]:
+                    dist_list[n_r][n_c] = new_dist
+                    parents[(n_r, n_c)] = (r, c)
+                    heapq.heappush(open_heap, (new_dist, (n_r, n_c)))
+    distances[:] = dist_list
+    for (r, c), (p_r, p_c) in parents.items():
+        parent_r[r, c], parent_c[r, c] = p_r, p_c
+    return distances, parent_r, parent_c
+
+class DistanceFields:
+    """
+    Trường khoảng cách và hướng bước tiếp theo (Dijkstra ngược) cho một tập ô đích.
+    distances: uint16 (số đích, hàng, cột), khoảng cách đường đi * scale (đơn vị ô).
+    directions: int8 (số đích, hàng, cột), chỉ số trong NEIGHBOR_MOVES của bước
+    tiếp theo về phía đích. Đi theo hướng từ bất kỳ ô nào sẽ ra đường ngắn nhất.
+    Sau khi bố cục đổi (repair), trường của ô đích bị ảnh hưởng được đánh dấu cũ (stale)
+    và chỉ tính lại khi được truy vấn hoặc khi gọi refresh().
+    """
+    def __init__(self, targets, distances, directions, scale, grid_map=None):
+        self.targets = [tuple(int(v) for v in target) for target in targets]
+        self.target_lookup = {target: idx for idx, target in enumerate(self.targets)}
+        self.distances = distances
+        self.directions = directions
+        self.scale = float(scale)
+        self.grid_map = grid_map # Bản đồ dùng để tính lại trường cũ
+        self.stale = np.zeros(len(self.targets), dtype=bool)
+
+    @staticmethod
+    @instrumentation.timed('routing.distance_fields', items=lambda fields, grid_map, targets: len(targets))
+    def _compute(grid_map, targets):
+        """Khoảng cách float (inf nếu không tới được) và hướng cho từng ô đích: ((số đích, hàng, cột), ...)."""
+        walkable = grid_map == config.CELL_TYPE_PATH
+        float_distances = np.full((len(targets),) + grid_map.shape, np.inf)
+        directions = np.full((len(targets),) + grid_map.shape, NO_DIRECTION, dtype=np.int8)
+        rows, cols = np.indices(grid_map.shape)
+
+        if csgraph_dijkstra is not None and targets:
+            graph, cell_ids = _walkable_graph(walkable)
+            walkable_r, walkable_c = np.nonzero(walkable)
+            for target_idx, target in enumerate(targets):
+                if not walkable[target]:
+                    continue
+                dist, predecessors = csgraph_dijkstra(graph, directed=False, indices=cell_ids[target],
+                                                      return_predecessors=True)
+                float_distances[target_idx][walkable] = dist
+                has_parent = predecessors >= 0
+                parent_r = np.full(grid_map.shape, -1, dtype=np.int64)
+                parent_c = np.full(grid_map.shape, -1, dtype=np.int64)
+                parent_r[walkable_r[has_parent], walkable_c[has_parent]] = walkable_r[predecessors[has_parent]]
+                parent_c[walkable_r[has_parent], walkable_c[has_parent]] = walkable_c[predecessors[has_parent]]
+                directions[target_idx] = DistanceFields._parents_to_directions(parent_r, parent_c, rows, cols)
+        else:
+            for target_idx, target in enumerate(targets):
+                if not walkable[target]:
+                    continue
+                dist, parent_r, parent_c = _dijkstra_python(walkable, target)
+                float_distances[target_idx] = dist
+                directions[target_idx] = DistanceFields._parents_to_directions(parent_r, parent_c, rows, cols)
+        return float_distances, directions
+
+    @staticmethod
+    def _quantize(float_distances, scale):
+        reachable = np.isfinite(float_distances)
+        distances = np.full(float_distances.shape, UNREACHABLE_DISTANCE, dtype=np.uint16)
+        distances[reachable] = np.rint(float_distances[reachable] * scale)
+        return distances
+
+    @classmethod
+    def build(cls, grid_map, targets, scale=None):
+        """Chạy Dijkstra từ mỗi ô đích trên các ô lối đi (8 hướng, chéo tính sqrt(2))."""
+        targets = [tuple(int(v) for v in target) for target in targets]
+        float_distances, directions = cls._compute(grid_map, targets)
+        reachable = np.isfinite(float_distances)
+        max_distance = float_distances[reachable].max() if reachable.any() else 0.0
+        scale = scale or config.DISTANCE_FIELD_SCALE
+        if max_distance * scale >= UNREACHABLE_DISTANCE:
+            scale = (UNREACHABLE_DISTANCE - 1) / max_distance # Giảm độ phân giải để vừa uint16
+        return cls(targets, cls._quantize(float_distances, scale), directions, scale, grid_map)
+
+    def refresh(self, target_indices=None):
+        """Tính lại các trường đang cũ (tất cả, hoặc chỉ trong target_indices) trên self.grid_map."""
+        stale = np.nonzero(self.stale)[0]
+        if target_indices is not None:
+            stale = np.intersect1d(stale, target_indices)
+        if not len(stale):
+            return
+        float_distances, directions = self._compute(self.grid_map, [self.targets[idx] for idx in stale])
+        reachable = np.isfinite(float_distances)
+        if reachable.any() and float_distances[reachable].max() * self.scale >= UNREACHABLE_DISTANCE:
+            # Không còn vừa uint16 với scale hiện tại: tính lại toàn bộ với scale mới
+            rebuilt = DistanceFields.build(self.grid_map, self.targets)
+            self.distances, self.directions, self.scale = rebuilt.distances, rebuilt.directions, rebuilt.scale
+        else:
+            self.distances[stale] = self._quantize(float_distances, self.scale)
+            self.directions[stale] = directions
+        self.stale[stale] = False
+
+    def _fill_opened_cells(self, target_idx, opened, boundary):
+        """
+        Gán khoảng cách/hướng cho các ô mới mở bằng Dijkstra cục bộ trong vùng mở,
+        xuất phát từ các ô biên (khoảng cách của chúng không đổi).
+        """
+        field = self.distances[target_idx]
+        directions = self.directions[target_idx]
+        best = {}
+        open_heap = []
+        for r, c in boundary:
+            stored = field[r, c]
+            if stored != UNREACHABLE_DISTANCE:
+                heapq.heappush(open_heap, (stored / self.scale, (r, c), None))
+        opened_set = set(opened)
+        while open_heap:
+            node_dist, (r, c), parent = heapq.heappop(open_heap)
+            if (r, c) in best:
+                continue
+            best[(r, c)] = node_dist
+            if parent is not None:
+                field[r, c] = min(UNREACHABLE_DISTANCE - 1, round(node_dist * self.scale))
+                directions[r, c] = _DIRECTION_LUT[(parent[0] - r + 1) * 3 + (parent[1] - c + 1)]
+            for dr, dc, move_cost in NEIGHBOR_MOVES:
+                n_r, n_c = r + dr, c + dc
+                if (n_r, n_c) in opened_set and (n_r, n_c) not in best:
+                    heapq.heappush(open_heap, (node_dist + move_cost, (n_r, n_c), (r, c)))
+
+    def repair(self, grid_map, blocked_cells, opened_cells):
+        """
+        Cập nhật sau khi bố cục đổi: blocked_cells (lối đi -> kệ) và opened_cells
+        (kệ -> lối đi) là mảng (N, 2) (hàng, cột); grid_map là bản đồ mới.
+        Chỉ ô đích mà thay đổi thật sự ảnh hưởng mới bị đánh dấu cũ:
+        - Ô bị chặn chỉ ảnh hưởng nếu nó là ô đích hoặc là bước tiếp theo của ô nào đó
+          (nằm giữa cây đường đi ngắn nhất); nếu chỉ là lá thì đánh dấu không tới được.
+        - Ô mở chỉ ảnh hưởng nếu có cặp ô biên m1, m2 mà d(m1) + octile(m1, m2) < d(m2),
+          tức đi xuyên vùng mở có thể ngắn hơn; nếu không thì điền vùng mở bằng Dijkstra cục bộ.
+        Trả về số ô đích mới bị đánh dấu cũ.
+        """
+        self.grid_map = grid_map
+        if not self.distances.flags.writeable: # Mảng mmap chỉ đọc từ cache
+            self.distances, self.directions = np.array(self.distances), np.array(self.directions)
+        walkable = grid_map == config.CELL_TYPE_PATH
+        num_rows, num_cols = grid_map.shape
+        blocked_cells = np.asarray(blocked_cells, dtype=np.int64).reshape(-1, 2)
+        opened_cells = np.asarray(opened_cells, dtype=np.int64).reshape(-1, 2)
+        target_array = np.array(self.targets, dtype=np.int64).reshape(-1, 2)
+        affected = np.zeros(len(self.targets), dtype=bool)
+
+        if len(blocked_cells):
+            blocked_r, blocked_c = blocked_cells[:, 0], blocked_cells[:, 1]
+            affected |= (target_array[:, None, :] == blocked_cells[None, :, :]).all(axis=2).any(axis=1)
+            for dir_idx, (dr, dc, _) in enumerate(NEIGHBOR_MOVES):
+                # Ô x = b - (dr, dc) có bước tiếp theo theo hướng dir_idx chính là ô bị chặn b
+                src_r, src_c = blocked_r - dr, blocked_c - dc
+                inside = (src_r >= 0) & (src_r < num_rows) & (src_c >= 0) & (src_c < num_cols)
+                if inside.any():
+                    affected |= (self.directions[:, src_r[inside], src_c[inside]] == dir_idx).any(axis=1)
+            self.distances[:, blocked_r, blocked_c] = UNREACHABLE_DISTANCE
+            self.directions[:, blocked_r, blocked_c] = NO_DIRECTION
+
+        boundary = np.empty((0, 2), dtype=np.int64)
+        if len(opened_cells):
+            opened_mask = np.zeros(grid_map.shape, dtype=bool)
+            opened_mask[opened_cells[:, 0], opened_cells[:, 1]] = True
+            near_opened = np.zeros(grid_map.shape, dtype=bool)
+            for dr, dc, _ in NEIGHBOR_MOVES:
+                src, dst = _shifted_slices(dr, dc, num_rows, num_cols)
+                near_opened[dst] |= opened_mask[src]
+            boundary = np.argwhere(near_opened & walkable & ~opened_mask)
+            if len(boundary):
+                stored = self.distances[:, boundary[:, 0], boundary[:, 1]]
+                boundary_dist = np.where(stored == UNREACHABLE_DISTANCE, np.inf, stored / self.scale)
+                delta = np.abs(boundary[:, None, :] - boundary[None, :, :])
+                octile = (SQRT2 - 1) * delta.min(axis=2) + delta.max(axis=2)
+                # Sai số lượng tử hóa: bỏ qua cải thiện nhỏ hơn một đơn vị lưu trữ
+                shortcut = boundary_dist[:, :, None] + octile[None] < boundary_dist[:, None, :] - 1.0 / self.scale
+                affected |= shortcut.any(axis=(1, 2))
+
+        newly_stale = affected & ~self.stale
+        self.stale |= affected
+        if len(opened_cells) and len(boundary):
+            opened = [tuple(cell) for cell in opened_cells.tolist()]
+            boundary_cells = [tuple(cell) for cell in boundary.tolist()]
+            for target_idx in np.nonzero(~self.stale)[0]:
+                self._fill_opened_cells(target_idx, opened, boundary_cells)
+        return int(newly_stale.sum())
+
+    def with_targets(self, grid_map, targets):
+        """
+        DistanceFields cho danh sách ô đích mới: giữ trường (và trạng thái cũ) của ô đích
+        đã có; ô đích mới được đánh dấu cũ và tính khi cần.
+        """
+        targets = [tuple(int(v) for v in target) for target in targets]
+        if targets == self.targets:
+            self.grid_map = grid_map
+            return self
+        distances = np.full((len(targets),) + self.distances.shape[1:], UNREACHABLE_DISTANCE, dtype=np.uint16)
+        directions = np.full((len(targets),) + self.directions.shape[1:], NO_DIRECTION, dtype=np.int8)
+        fields = DistanceFields(targets, distances, directions, self.scale, grid_map)
+        for idx, target in enumerate(targets):
+            old_idx = self.target_lookup.get(target)
+            if old_idx is None:
+                fields.stale[idx] = True
+            else:
+                distances[idx] = self.distances[old_idx]
+                directions[idx] = self.directions[old_idx]
+                fields.stale[idx] = self.stale[old_idx]
+        return fields
+
+    @staticmethod
+    def _parents_to_directions(parent_r, parent_c, rows, cols):
+        has_parent = parent_r >= 0
+        lut_idx = (parent_r - rows + 1) * 3 + (parent_c - cols + 1)
+        return np.where(has_parent, _DIRECTION_LUT[np.where(has_parent, lut_idx, 4)], NO_DIRECTION)
+
+    def nbytes(self):
+        return self.distances.nbytes + self.directions.nbytes
+
+    def distance(self, cell, target):
+        """Độ dài đường đi (đơn vị ô) từ cell đến target; inf nếu không tới được."""
+        target_idx = self.target_lookup[target]
+        if self.stale[target_idx]:
+            self.refresh([target_idx])
+        stored = self.distances[target_idx, cell[0], cell[1]]
+        return float('inf') if stored == UNREACHABLE_DISTANCE else stored / self.scale
+
+    def route(self, cell, target):
+        """Đường đi từ cell đến target theo trường hướng (không cần tìm kiếm); None nếu không tới được."""
+        target_idx = self.target_lookup.get(tuple(target))
+        num_rows, num_cols = self.distances.shape[1:]
+        if target_idx is None or not (0 <= cell[0] < num_rows and 0 <= cell[1] < num_cols):
+            return None
+        if self.stale[target_idx]:
+            self.refresh([target_idx])
+        if self.distances[target_idx, cell[0], cell[1]] == UNREACHABLE_DISTANCE:
+            return None
+        directions = self.directions[target_idx]
+        path = [tuple(cell)]
+        r, c = cell
+        while (r, c) != self.targets[target_idx]:
+            dr, dc, _ = NEIGHBOR_MOVES[directions[r, c]]
+            r, c = r + dr, c + dc
+            path.append((r, c))
+        return path
+
+    def nearest_target(self, cell, candidate_targets):
+        """Trong các ô đích ứng viên, chọn ô có đường đi ngắn nhất từ cell; None nếu không ô nào tới được."""
+        num_rows, num_cols = self.distances.shape[1:]
+        if not (0 <= cell[0] < num_rows and 0 <= cell[1] < num_cols):
+            return None
+        best_target, best_distance = None, float('inf')
+        for target in candidate_targets:
+            if tuple(target) not in self.target_lookup:
+                continue
+            target_distance = self.distance(cell, tuple(target))
+            if target_distance < best_distance:
+                best_target, best_distance = tuple(target), target_distance
+        return best_target
+
+def build_item_distance_fields(grid_map, item_locations_dict, scale=None):
+    """Tạo DistanceFields cho mọi điểm tiếp cận món hàng (mỗi điểm một lần, dù nhiều món dùng chung)."""
+    targets = list(dict.fromkeys(spot for spots in item_locations_dict.values() for spot in spots))
+    return DistanceFields.build(grid_map, targets, scale)
@@ -0,0 +1,91 @@
+# error_heatmap.py
+"""
+Đánh giá độ chính xác định vị theo từng ô bằng Monte-Carlo: với mỗi ô lối đi rút
+T quan sát RSSI có nhiễu (một tensor ô x T x số AP cho mỗi khối), định vị cả khối
+bằng KNN theo lô rồi tổng hợp sai số trung bình, p95 và lớn nhất cho từng ô.
+Chạy thử:
+    python error_heatmap.py --trials 100
+"""
+import argparse
+import time
+import numpy as np
+import config
+import map_utils
+import rssi_simulation
+import map_cache
+from fingerprint_db import cKDTree
+
+def evaluate_localization_error(grid_map, access_points, fingerprints, shelf_crossing_maps=None,
+                                trials=None, k=None, weighted=None, seed=None, chunk_observations=None,
+                                mean_rssi_grid=None, use_index=None):
+    """
+    Bản đồ sai số định vị KNN (mét) trên mọi ô lối đi.
+    Trả về dict: 'mean_m', 'p95_m', 'max_m' là mảng (hàng, cột), NaN ở ô kệ,
+    cùng 'trials', 'num_cells', 'time_s'.
+    chunk_observations: số quan sát tối đa mỗi khối (ô x T), giới hạn bộ nhớ.
+    use_index: tìm KNN qua KD-tree (mặc định config.HEATMAP_USE_INDEX, cần scipy); chỉ mục được
+    xây trên fingerprints nếu chưa có và giữ lại cho các truy vấn sau.
+    """
+    trials = trials or config.HEATMAP_TRIALS
+    k = k or config.K_NEIGHBORS
+    weighted = config.USE_WEIGHTED_KNN if weighted is None else weighted
+    chunk_cells = max(1, (chunk_observations or config.HEATMAP_CHUNK_OBSERVATIONS) // trials)
+    rng = np.random.default_rng(seed)
+    start_time = time.perf_counter()
+    use_index = config.HEATMAP_USE_INDEX if use_index is None else use_index
+    if use_index and cKDTree is not None and fingerprints.index is None and len(fingerprints) > 0:
+        fingerprints.build_index()
+    use_index = bool(use_index) and fingerprints.index is not None
+
+    if mean_rssi_grid is None:
+        mean_rssi_grid = rssi_simulation.compute_mean_rssi_grid(grid_map, access_points, shelf_crossing_maps)
+    cells = np.argwhere(grid_map == config.CELL_TYPE_PATH)
+    num_aps = len(access_points)
+    error_maps = {name: np.full(grid_map.shape, np.nan) for name in ('mean_m', 'p95_m', 'max_m')}
+
+    for start in range(0, len(cells), chunk_cells):
+        chunk = cells[start:start + chunk_cells]
+        observations = rssi_simulation.sample_observations_at_cells(
+            access_points, chunk[:, 0], chunk[:, 1], mean_rssi_grid[chunk[:, 0], chunk[:, 1]],
+            rng.standard_normal((len(chunk), trials, num_aps)))
+        estimates = fingerprints.predict_batch(observations.reshape(-1, num_aps), k, weighted,
+                                               config.EPSILON_WEIGHT, use_index).reshape(len(chunk), trials, 2)
+        errors_m = np.hypot(*(estimates - chunk[:, None, :]).transpose(2, 0, 1)) * config.GRID_RESOLUTION_M
+        error_maps['mean_m'][chunk[:, 0], chunk[:, 1]] = errors_m.mean(axis=1)
+        error_maps['p95_m'][chunk[:, 0], chunk[:, 1]] = np.percentile(errors_m, 95, axis=1)
+        error_maps['max_m'][chunk[:, 0], chunk[:, 1]] = errors_m.max(axis=1)
+
+    error_maps['trials'] = trials
+    error_maps['num_cells'] = int(len(cells))
+    error_maps['time_s'] = time.perf_counter() - start_time
+    return error_maps
+
+def summarize(error_maps):
+    """Thống kê toàn cửa hàng từ kết quả evaluate_localization_error."""
+    return {
+        'mean_m': float(np.nanmean(error_maps['mean_m'])),
+        'p95_of_cell_p95_m': float(np.nanpercentile(error_maps['p95_m'], 95)),
+        'max_m': float(np.nanmax(error_maps['max_m'])),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Bản đồ sai số định vị Monte-Carlo")
+    parser.add_argument('--trials', type=int, default=config.HEATMAP_TRIALS)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    grid_map, num_rows, num_cols = map_utils.create_base_map()
+    map_utils.add_shelf(grid_map, num_rows // 4, num_cols // 4, num_rows // 2, 2)
+    map_utils.add_shelf(grid_map, num_rows // 4, (num_cols * 3 // 4) - 2, num_rows // 2, 2)
+    access_points = map_utils.define_access_points(num_rows, num_cols)
+    fingerprints, shelf_crossing_maps = map_cache.load_or_build_fingerprints(grid_map, access_points)
+
+    error_maps = evaluate_localization_error(grid_map, access_points, fingerprints, shelf_crossing_maps,
+                                             args.trials, seed=args.seed)
+    summary = summarize(error_maps)
+    print(f"{error_maps['num_cells']} ô x {error_maps['trials']} lần thử trong {error_maps['time_s']:.2f}s")
+    print(f"Sai số trung bình {summary['mean_m']:.2f}m, p95 theo ô (phân vị 95) {summary['p95_of_cell_p95_m']:.2f}m, "
+          f"lớn nhất {summary['max_m']:.2f}m")
+
+if __name__ == "__main__":
+    main()
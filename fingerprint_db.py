@@ -0,0 +1,592 @@
+# fingerprint_db.py
+import pickle
+import time
+import numpy as np
+import config
+import rssi_simulation
+import parallel_fingerprints
+from walkable_index import WalkableIndex
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError: # scipy là tùy chọn, chỉ cần khi dùng FingerprintIndex
+    cKDTree = None
+
+class FingerprintIndex:
+    """
+    Chỉ mục KD-tree trên không gian vector RSSI để tìm KNN dưới tuyến tính.
+    approx_epsilon > 0 bật chế độ xấp xỉ có giới hạn: láng giềng thứ i trả về
+    cách quan sát không quá (1 + approx_epsilon) lần khoảng cách thật.
+    """
+    def __init__(self, rssi, leaf_size=None):
+        if cKDTree is None:
+            raise ImportError("FingerprintIndex cần scipy (pip install scipy)")
+        self.leaf_size = leaf_size or config.KNN_INDEX_LEAF_SIZE
+        start_time = time.perf_counter()
+        self.tree = cKDTree(rssi, leafsize=self.leaf_size)
+        self.build_time_s = time.perf_counter() - start_time
+        self._size_bytes = None
+
+    @property
+    def size_bytes(self):
+        """Kích thước chỉ mục (byte, đo qua bản tuần tự hóa của cây)."""
+        if self._size_bytes is None:
+            self._size_bytes = len(pickle.dumps(self.tree, protocol=pickle.HIGHEST_PROTOCOL))
+        return self._size_bytes
+
+    def stats(self):
+        return {
+            'num_points': int(self.tree.n),
+            'num_nodes': int(self.tree.size),
+            'leaf_size': self.leaf_size,
+            'build_time_s': self.build_time_s,
+            'size_bytes': self.size_bytes,
+        }
+
+    def query(self, observed_rssi, k, approx_epsilon=0.0):
+        """Trả về (chỉ số, khoảng cách) của k láng giềng, sắp xếp tăng dần."""
+        distances, indices = self.tree.query(observed_rssi, k=list(range(1, k + 1)), eps=approx_epsilon)
+        found = indices < self.tree.n # cKDTree đánh dấu láng giềng thiếu bằng chỉ số n
+        return indices[found], distances[found]
+
+class SpatialBuckets:
+    """
+    Chỉ mục không gian theo ô vuông (bucket) trên vị trí fingerprint, dạng CSR:
+    chỉ số fingerprint được sắp theo bucket, bucket_starts[b]..bucket_starts[b+1] là bucket b.
+    """
+    def __init__(self, positions, bucket_size):
+        self.bucket_size = bucket_size
+        if len(positions) == 0:
+            self.num_bucket_rows = self.num_bucket_cols = 0
+            self.order = np.empty(0, dtype=np.int64)
+            self.bucket_starts = np.zeros(1, dtype=np.int64)
+            return
+        bucket_rc = positions // bucket_size
+        self.num_bucket_rows = int(bucket_rc[:, 0].max()) + 1
+        self.num_bucket_cols = int(bucket_rc[:, 1].max()) + 1
+        bucket_ids = bucket_rc[:, 0] * self.num_bucket_cols + bucket_rc[:, 1]
+        self.order = np.argsort(bucket_ids, kind='stable')
+        counts = np.bincount(bucket_ids, minlength=self.num_bucket_rows * self.num_bucket_cols)
+        self.bucket_starts = np.concatenate(([0], np.cumsum(counts)))
+
+    def candidates(self, center, radius):
+        """Chỉ số các fingerprint thuộc các bucket giao với hình vuông bán kính radius quanh center."""
+        if self.num_bucket_rows == 0:
+            return np.empty(0, dtype=np.int64)
+        r_lo = max(0, int((center[0] - radius) // self.bucket_size))
+        r_hi = min(self.num_bucket_rows - 1, int((center[0] + radius) // self.bucket_size))
+        c_lo = max(0, int((center[1] - radius) // self.bucket_size))
+        c_hi = min(self.num_bucket_cols - 1, int((center[1] + radius) // self.bucket_size))
+        if r_lo > r_hi or c_lo > c_hi:
+            return np.empty(0, dtype=np.int64)
+        # Mỗi hàng bucket là một dải liên tục trong order
+        ranges = [self.order[self.bucket_starts[br * self.num_bucket_cols + c_lo]:
+                             self.bucket_starts[br * self.num_bucket_cols + c_hi + 1]]
+                  for br in range(r_lo, r_hi + 1)]
+        return np.concatenate(ranges)
+
+class StrongestAPIndex:
+    """
+    Chỉ mục ngược theo N AP mạnh nhất của mỗi fingerprint, dạng CSR:
+    order[ap_starts[a]:ap_starts[a+1]] là các fingerprint có AP a trong top-N của chúng.
+    Truy vấn chỉ so với fingerprint chung ít nhất (số AP mạnh của quan sát - max_mismatch)
+    AP mạnh. RSSI không vượt ngưỡng phát hiện (MIN_RSSI_THRESHOLD) được coi là thiếu:
+    khoảng cách chỉ tính trên AP cả hai cùng thấy, mỗi AP chỉ một bên thấy cộng
+    min(RSSI - ngưỡng, missing_penalty_db)^2, AP cả hai cùng không thấy bỏ qua.
+    """
+    def __init__(self, rssi, top_n=None, max_mismatch=None, missing_penalty_db=None):
+        self.top_n = min(top_n or config.STRONGEST_AP_TOP_N, rssi.shape[1])
+        self.max_mismatch = config.STRONGEST_AP_MAX_MISMATCH if max_mismatch is None else max_mismatch
+        self.missing_penalty_db = missing_penalty_db or config.STRONGEST_AP_MISSING_PENALTY_DB
+        start_time = time.perf_counter()
+        self.detected = rssi > config.MIN_RSSI_THRESHOLD
+        # Giá trị bằng 0 ở AP thiếu để các tổng trong distances bỏ qua chúng
+        self.rssi = np.where(self.detected, rssi, 0.0)
+        self.penalty = self._missing_penalty(self.rssi, self.detected)
+        self.total_penalty = self.penalty.sum(axis=1)
+
+        top_aps, top_valid = self.strongest_aps(rssi)
+        fingerprint_ids = np.broadcast_to(np.arange(len(rssi))[:, None], top_aps.shape)[top_valid]
+        ap_ids = top_aps[top_valid]
+        self.order = fingerprint_ids[np.argsort(ap_ids, kind='stable')]
+        self.ap_starts = np.concatenate(([0], np.cumsum(np.bincount(ap_ids, minlength=rssi.shape[1]))))
+        self.build_time_s = time.perf_counter() - start_time
+        self.last_scanned = 0 # Số cặp (quan sát, fingerprint) đã so ở truy vấn gần nhất
+
+    def _missing_penalty(self, rssi, detected):
+        """Phạt bình phương khi AP chỉ một bên thấy: (RSSI - ngưỡng)^2, tối đa missing_penalty_db^2."""
+        return np.where(detected, np.minimum(rssi - config.MIN_RSSI_THRESHOLD, self.missing_penalty_db), 0.0) ** 2
+
+    def strongest_aps(self, rssi):
+        """Top-N AP (M, N) của mỗi vector, xếp theo chỉ số AP, kèm mặt nạ AP vượt ngưỡng phát hiện."""
+        rssi = np.asarray(rssi, dtype=np.float64).reshape(-1, self.detected.shape[1])
+        top_aps = np.sort(np.argpartition(-rssi, self.top_n - 1, axis=1)[:, :self.top_n], axis=1)
+        return top_aps, np.take_along_axis(rssi, top_aps, axis=1) > config.MIN_RSSI_THRESHOLD
+
+    def nbytes(self):
+        return sum(values.nbytes for values in (self.detected, self.rssi, self.penalty, self.total_penalty,
+                                                self.order, self.ap_starts))
+
+    def stats(self):
+        postings = np.diff(self.ap_starts)
+        return {
+            'top_n': self.top_n,
+            'max_mismatch': self.max_mismatch,
+            'mean_postings_per_ap': float(postings.mean()) if len(postings) else 0.0,
+            'build_time_s': self.build_time_s,
+            'size_bytes': self.nbytes(),
+        }
+
+    def candidates(self, aps, min_k):
+        """
+        Fingerprint ứng viên cho tập AP mạnh của quan sát: chung ít nhất len(aps) - max_mismatch AP;
+        nếu ít hơn min_k ứng viên thì nới dần yêu cầu, cuối cùng là mọi fingerprint.
+        """
+        if len(aps) == 0:
+            return np.arange(len(self.rssi))
+        postings = np.concatenate([self.order[self.ap_starts[a]:self.ap_starts[a + 1]] for a in aps])
+        fingerprint_ids, shared = np.unique(postings, return_counts=True)
+        for min_shared in range(max(1, len(aps) - self.max_mismatch), 0, -1):
+            selected = fingerprint_ids[shared >= min_shared]
+            if len(selected) >= min_k:
+                return selected
+        return np.arange(len(self.rssi))
+
+    def distances(self, observations, candidate_idx):
+        """
+        Ma trận khoảng cách (M, số ứng viên) với RSSI dưới ngưỡng coi là thiếu. Chỉ các cột AP
+        mà ít nhất một quan sát thấy được nhân ma trận; AP chỉ fingerprint thấy lấy từ total_penalty.
+        """
+        observations = observations.reshape(-1, self.detected.shape[1])
+        observed_detected = observations > config.MIN_RSSI_THRESHOLD
+        aps = np.flatnonzero(observed_detected.any(axis=0))
+        observed_detected = observed_detected[:, aps]
+        observed = np.where(observed_detected, observations[:, aps], 0.0)
+        observed_penalty = self._missing_penalty(observed, observed_detected)
+        observed_detected = observed_detected.astype(np.float64)
+        rows = np.ix_(candidate_idx, aps)
+        detected, rssi = self.detected[rows].astype(np.float64), self.rssi[rows]
+        # (o - f)^2 trên AP cả hai cùng thấy, cộng phạt AP chỉ một bên thấy, đều bằng nhân ma trận
+        sq_dist = ((observed * observed - observed_penalty) @ detected.T
+                   + observed_detected @ (rssi * rssi - self.penalty[rows]).T - 2 * observed @ rssi.T)
+        sq_dist += observed_penalty.sum(axis=1)[:, None] + self.total_penalty[candidate_idx]
+        return np.sqrt(np.maximum(sq_dist, 0, out=sq_dist))
+
+    def _nearest_candidates(self, observations, candidate_idx, k):
+        """k ứng viên gần nhất của mỗi quan sát, sắp xếp tăng dần: (chỉ số, khoảng cách), mỗi mảng (M, k)."""
+        distances = self.distances(observations, candidate_idx)
+        if k < len(candidate_idx):
+            local_idx = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            local_idx = np.broadcast_to(np.arange(len(candidate_idx)), distances.shape)
+        local_dist = np.take_along_axis(distances, local_idx, axis=1)
+        order = np.argsort(local_dist, axis=1, kind='stable')
+        return (candidate_idx[np.take_along_axis(local_idx, order, axis=1)],
+                np.take_along_axis(local_dist, order, axis=1))
+
+    def query(self, observed_rssi, k):
+        """KNN cho một quan sát: (chỉ số, khoảng cách) của k láng giềng, sắp xếp tăng dần."""
+        top_aps, top_valid = self.strongest_aps(observed_rssi)
+        candidate_idx = self.candidates(top_aps[0][top_valid[0]], k)
+        self.last_scanned = len(candidate_idx)
+        nearest_idx, nearest_dist = self._nearest_candidates(observed_rssi, candidate_idx, k)
+        return nearest_idx[0], nearest_dist[0]
+
+    def query_batch(self, observations, k):
+        """
+        KNN cho (M, số AP) quan sát. Các quan sát cùng tập AP mạnh dùng chung một tập ứng viên
+        và một phép nhân ma trận. Trả về (chỉ số, khoảng cách), mỗi mảng (M, k).
+        """
+        nearest_idx = np.empty((len(observations), k), dtype=np.int64)
+        nearest_dist = np.empty((len(observations), k))
+        top_aps, top_valid = self.strongest_aps(observations)
+        keys, group_of = np.unique(np.where(top_valid, top_aps, -1), axis=0, return_inverse=True)
+        group_of = group_of.reshape(-1)
+        by_group = np.argsort(group_of, kind='stable')
+        group_starts = np.concatenate(([0], np.cumsum(np.bincount(group_of, minlength=len(keys)))))
+        self.last_scanned = 0
+        for group, key in enumerate(keys):
+            members = by_group[group_starts[group]:group_starts[group + 1]]
+            candidate_idx = self.candidates(key[key >= 0], k)
+            self.last_scanned += len(members) * len(candidate_idx)
+            nearest_idx[members], nearest_dist[members] = self._nearest_candidates(
+                observations[members], candidate_idx, k)
+        return nearest_idx, nearest_dist
+
+class QuantizedRSSI:
+    """
+    RSSI lưu dạng mã: rssi ~ offset + step * codes, với một offset và step chung cho mọi AP
+    để khoảng cách Euclide trên mã chỉ cần nhân step. codes là uint8/int8 (step = dải RSSI / 255,
+    ~0.26 dB với dải -95..-30 dBm) hoặc float32 (step 1, offset ở giữa dải để giảm sai số làm tròn).
+    Khoảng cách được tính thẳng trên mã theo từng khối block_rows fingerprint (giải mã tạm sang
+    float32), không bao giờ giải nén cả mảng.
+    """
+    DTYPES = {'float32': np.float32, 'uint8': np.uint8, 'int8': np.int8}
+
+    def __init__(self, rssi, storage, block_rows=None):
+        if storage not in self.DTYPES:
+            raise ValueError(f"Kiểu lưu fingerprint không hợp lệ: {storage}")
+        self.storage = storage
+        self.block_rows = block_rows or config.FINGERPRINT_QUANT_BLOCK_ROWS
+        rssi = np.asarray(rssi, dtype=np.float64)
+        low, high = (float(rssi.min()), float(rssi.max())) if rssi.size else (0.0, 0.0)
+        dtype = np.dtype(self.DTYPES[storage])
+        if dtype.kind == 'f':
+            self.step, self.offset = 1.0, (low + high) / 2
+            self.codes = (rssi - self.offset).astype(dtype)
+        else:
+            code_range = np.iinfo(dtype)
+            self.step = (high - low) / (code_range.max - code_range.min) if high > low else 1.0
+            self.offset = low - code_range.min * self.step
+            self.codes = np.clip(np.rint((rssi - self.offset) / self.step),
+                                 code_range.min, code_range.max).astype(dtype)
+
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def dequantize(self, rows=slice(None)):
+        """RSSI float64 của các hàng rows (mặc định toàn bộ, là một bản sao mới)."""
+        return self.codes[rows] * self.step + self.offset
+
+    def _to_codes(self, observations):
+        """Quan sát (dBm) sang không gian mã (float32) để so trực tiếp với codes."""
+        return ((np.asarray(observations, dtype=np.float64) - self.offset) / self.step).astype(np.float32)
+
+    def distances(self, observed_rssi):
+        """Khoảng cách Euclide (dB) từ một quan sát đến mọi fingerprint: mảng float64 (N,)."""
+        observed = self._to_codes(observed_rssi)
+        sq_dist = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), self.block_rows):
+            diff = self.codes[start:start + self.block_rows].astype(np.float32) - observed
+            sq_dist[start:start + len(diff)] = np.einsum('ij,ij->i', diff, diff)
+        return np.sqrt(sq_dist, dtype=np.float64) * self.step
+
+    def sq_distances(self, observations):
+        """Ma trận bình phương khoảng cách (dB^2) float32 (M, N) cho (M, số AP) quan sát, qua nhân ma trận."""
+        observed = self._to_codes(observations)
+        observed_sq_norms = np.einsum('ij,ij->i', observed, observed)[:, None]
+        sq_dist = np.empty((len(observed), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), self.block_rows):
+            block = self.codes[start:start + self.block_rows].astype(np.float32)
+            # |o - f|^2 = |o|^2 + |f|^2 - 2 o.f trên mã; |f|^2 tính lại theo khối thay vì lưu
+            sq_dist[:, start:start + len(block)] = (observed_sq_norms + np.einsum('ij,ij->i', block, block)
+                                                    - 2 * observed @ block.T)
+        np.maximum(sq_dist, 0, out=sq_dist)
+        sq_dist *= self.step * self.step
+        return sq_dist
+
+class FingerprintDB:
+    """
+    Cơ sở dữ liệu fingerprint dạng mảng.
+    positions: mảng int32 (N, 2) chứa (hàng, cột) của từng fingerprint.
+    rssi: mảng float (N, số AP) chứa vector RSSI tương ứng.
+    cell_index: WalkableIndex tùy chọn; khi có, fingerprint i là ô có dense ID i.
+    storage: kiểu lưu RSSI (mặc định config.FINGERPRINT_STORAGE); khác 'float64' thì chỉ giữ
+    QuantizedRSSI và KNN tính trên mã, còn thuộc tính rssi trả về bản giải nén tạm thời.
+    """
+    def __init__(self, positions, rssi, cell_index=None, storage=None):
+        self.positions = np.asarray(positions, dtype=np.int32).reshape(-1, 2)
+        self._rssi = np.asarray(rssi, dtype=np.float64)
+        if self._rssi.ndim != 2 or self._rssi.shape[0] != self.positions.shape[0]:
+            raise ValueError("positions và rssi phải có cùng số fingerprint")
+        if cell_index is not None and len(cell_index) != len(self.positions):
+            raise ValueError("cell_index phải có đúng một ô cho mỗi fingerprint")
+        self.cell_index = cell_index
+        self.quantized = None
+        storage = storage or config.FINGERPRINT_STORAGE
+        if storage != 'float64':
+            self.quantized = QuantizedRSSI(self._rssi, storage)
+            self._rssi = None
+        self.index = None
+        self.strongest_ap_index = None
+        self._spatial_buckets = None
+        self.last_scanned = 0 # Số cặp (quan sát, fingerprint) đã so ở truy vấn gần nhất (KD-tree: không đếm)
+
+    @classmethod
+    def from_dict(cls, fingerprints_data, storage=None):
+        """Tạo từ định dạng cũ dict[(hàng, cột)] -> list RSSI."""
+        if not fingerprints_data:
+            return cls(np.empty((0, 2), dtype=np.int64), np.empty((0, 0)), storage=storage)
+        positions = np.array(list(fingerprints_data.keys()), dtype=np.int64)
+        rssi = np.array(list(fingerprints_data.values()), dtype=np.float64)
+        return cls(positions, rssi, storage=storage)
+
+    @classmethod
+    def from_rssi_grid(cls, rssi_grid, cell_index=None, storage=None):
+        """
+        Tạo từ mảng (hàng, cột, số AP) của generate_rssi_fingerprint_array (bỏ qua ô NaN).
+        Fingerprint được xếp theo dense ID (cell_index, mặc định dựng từ các ô không NaN).
+        """
+        if cell_index is None:
+            cell_index = WalkableIndex.from_walkable(~np.isnan(rssi_grid).any(axis=2))
+        cells = cell_index.cells
+        return cls(cells, rssi_grid[cells[:, 0], cells[:, 1]], cell_index, storage)
+
+    def with_storage(self, storage=None):
+        """
+        Trả về FingerprintDB mới cùng vị trí với kiểu lưu storage (mặc định config.FINGERPRINT_STORAGE).
+        Chỉ chuyển từ bản float64: lượng tử hóa lại bản đã giải nén sẽ cộng dồn sai số.
+        """
+        storage = storage or config.FINGERPRINT_STORAGE
+        if self.quantized is not None:
+            if storage == self.storage:
+                return self
+            raise ValueError(f"Không thể chuyển fingerprint '{self.storage}' sang '{storage}': cần bản float64 gốc")
+        return FingerprintDB(self.positions, self._rssi, self.cell_index, storage)
+
+    def __len__(self):
+        return self.positions.shape[0]
+
+    @property
+    def rssi(self):
+        """Mảng RSSI float64 (N, số AP); khi lưu lượng tử hóa là bản giải nén mới ở mỗi lần truy cập."""
+        return self._rssi if self.quantized is None else self.quantized.dequantize()
+
+    @property
+    def storage(self):
+        return 'float64' if self.quantized is None else self.quantized.storage
+
+    @property
+    def num_aps(self):
+        return (self._rssi if self.quantized is None else self.quantized.codes).shape[1]
+
+    def _rssi_rows(self, rows):
+        return self._rssi[rows] if self.quantized is None else self.quantized.dequantize(rows)
+
+    def rssi_at(self, cell):
+        """Vector RSSI của ô (hàng, cột) qua dense ID; None nếu ô không có fingerprint."""
+        if len(self) == 0:
+            return None
+        if self.cell_index is None:
+            self.cell_index = WalkableIndex.from_cells(self.positions, self.positions.max(axis=0) + 1)
+        cell_id = self.cell_index.id_of(cell)
+        return None if cell_id < 0 else self._rssi_rows(cell_id)
+
+    def nbytes(self):
+        """Bộ nhớ của mảng fingerprint, bảng dense ID và các chỉ mục (nếu đã xây)."""
+        num_bytes = self._rssi.nbytes if self.quantized is None else self.quantized.nbytes()
+        if self.cell_index is not None and self.cell_index.cells is self.positions:
+            num_bytes += self.cell_index.nbytes() # positions dùng chung mảng cells của chỉ số
+        else:
+            num_bytes += self.positions.nbytes + (self.cell_index.nbytes() if self.cell_index is not None else 0)
+        if self.index is not None:
+            num_bytes += self.index.size_bytes
+        if self.strongest_ap_index is not None:
+            num_bytes += self.strongest_ap_index.nbytes()
+        return num_bytes
+
+    def to_dict(self):
+        """Chuyển ngược về định dạng dict[(hàng, cột)] -> list RSSI."""
+        return {(r, c): rssi_values for (r, c), rssi_values
+                in zip(map(tuple, self.positions.tolist()), self.rssi.tolist())}
+
+    def rssi_distances(self, observed_rssi):
+        """Khoảng cách Euclide từ vector quan sát đến mọi fingerprint (một phép tính broadcast)."""
+        observed = np.asarray(observed_rssi, dtype=np.float64)
+        if observed.shape != (self.num_aps,):
+            raise ValueError("Các vector RSSI phải có cùng độ dài")
+        if self.quantized is not None:
+            return self.quantized.distances(observed)
+        diff = self._rssi - observed
+        return np.sqrt(np.einsum('ij,ij->i', diff, diff))
+
+    def build_index(self, leaf_size=None):
+        """Xây chỉ mục KD-tree (một lần sau khi tạo fingerprint) và trả về thống kê của nó."""
+        self.index = FingerprintIndex(self.rssi, leaf_size)
+        return self.index.stats()
+
+    def build_strongest_ap_index(self, top_n=None, max_mismatch=None, missing_penalty_db=None):
+        """Xây chỉ mục theo N AP mạnh nhất (xem StrongestAPIndex) và trả về thống kê của nó."""
+        self.strongest_ap_index = StrongestAPIndex(self.rssi, top_n, max_mismatch, missing_penalty_db)
+        return self.strongest_ap_index.stats()
+
+    def _use_strongest_aps(self, use_strongest_aps, k):
+        if use_strongest_aps is None:
+            use_strongest_aps = self.strongest_ap_index is not None
+        if use_strongest_aps and k > 0 and self.strongest_ap_index is None:
+            self.build_strongest_ap_index()
+        return bool(use_strongest_aps) and k > 0
+
+    def nearest(self, observed_rssi, k, use_index=None, approx_epsilon=0.0, use_strongest_aps=None):
+        """
+        Trả về (chỉ số, khoảng cách) của k fingerprint gần nhất, sắp xếp tăng dần.
+        use_index: True/False để bắt buộc bật/tắt chỉ mục; None = dùng nếu đã xây.
+        approx_epsilon: sai số tương đối cho phép khi tìm qua chỉ mục (0 = chính xác).
+        use_strongest_aps: so theo N AP mạnh nhất, RSSI dưới ngưỡng coi là thiếu (StrongestAPIndex);
+        None = dùng nếu đã xây. Khi bật, chế độ này được ưu tiên hơn KD-tree.
+        """
+        k = min(k, len(self))
+        if self._use_strongest_aps(use_strongest_aps, k):
+            observed = np.asarray(observed_rssi, dtype=np.float64)
+            if observed.shape != (self.num_aps,):
+                raise ValueError("Các vector RSSI phải có cùng độ dài")
+            nearest_idx, nearest_dist = self.strongest_ap_index.query(observed, k)
+            self.last_scanned = self.strongest_ap_index.last_scanned
+            return nearest_idx, nearest_dist
+        if use_index is None:
+            use_index = self.index is not None
+        if use_index and len(self) > 0:
+            if self.index is None:
+                self.build_index()
+            observed = np.asarray(observed_rssi, dtype=np.float64)
+            if observed.shape != (self.num_aps,):
+                raise ValueError("Các vector RSSI phải có cùng độ dài")
+            self.last_scanned = 0
+            return self.index.query(observed, min(k, len(self)), approx_epsilon)
+
+        distances = self.rssi_distances(observed_rssi)
+        self.last_scanned = len(distances)
+        k = min(k, len(distances))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if k < len(distances):
+            nearest_idx = np.argpartition(distances, k - 1)[:k]
+        else:
+            nearest_idx = np.arange(len(distances))
+        nearest_idx = nearest_idx[np.argsort(distances[nearest_idx], kind='stable')]
+        return nearest_idx, distances[nearest_idx]
+
+    def spatial_buckets(self, bucket_size=None):
+        """Chỉ mục bucket theo vị trí, bucket_size tính bằng ô (dựng lần đầu khi cần, dùng lại sau đó)."""
+        bucket_size = bucket_size or max(1, round(config.TRACKER_BUCKET_SIZE_M / config.GRID_RESOLUTION_M))
+        if self._spatial_buckets is None or self._spatial_buckets.bucket_size != bucket_size:
+            self._spatial_buckets = SpatialBuckets(self.positions, bucket_size)
+        return self._spatial_buckets
+
+    def nearest_in_window(self, observed_rssi, k, center, radius):
+        """
+        KNN chỉ trên các fingerprint cách center (hàng, cột) không quá radius ô.
+        Trả về (chỉ số, khoảng cách, số fingerprint đã so sánh); có thể ít hơn k láng giềng.
+        """
+        observed = np.asarray(observed_rssi, dtype=np.float64)
+        if observed.shape != (self.num_aps,):
+            raise ValueError("Các vector RSSI phải có cùng độ dài")
+        candidate_idx = self.spatial_buckets().candidates(center, radius)
+        offsets = self.positions[candidate_idx] - np.asarray(center)
+        candidate_idx = candidate_idx[np.einsum('ij,ij->i', offsets, offsets) <= radius * radius]
+        self.last_scanned = len(candidate_idx)
+        diff = self._rssi_rows(candidate_idx) - observed
+        distances = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+        k = min(k, len(distances))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0), len(candidate_idx)
+        if k < len(distances):
+            nearest_local = np.argpartition(distances, k - 1)[:k]
+        else:
+            nearest_local = np.arange(len(distances))
+        nearest_local = nearest_local[np.argsort(distances[nearest_local], kind='stable')]
+        return candidate_idx[nearest_local], distances[nearest_local], len(candidate_idx)
+
+    def nearest_batch(self, observations, k, use_index=None, approx_epsilon=0.0, max_distances=None,
+                      use_strongest_aps=None):
+        """
+        KNN cho nhiều quan sát cùng lúc.
+        observations: mảng (M, số AP). Trả về (chỉ số, khoảng cách), mỗi mảng (M, k').
+        Ma trận khoảng cách được tính theo từng khối hàng để bộ nhớ không vượt quá
+        max_distances phần tử (mặc định config.KNN_BATCH_MAX_DISTANCES).
+        """
+        observations = np.asarray(observations, dtype=np.float64).reshape(-1, self.num_aps)
+        num_obs = observations.shape[0]
+        k = min(k, len(self))
+        if self._use_strongest_aps(use_strongest_aps, k) and num_obs > 0:
+            nearest_idx, nearest_dist = self.strongest_ap_index.query_batch(observations, k)
+            self.last_scanned = self.strongest_ap_index.last_scanned
+            return nearest_idx, nearest_dist
+        if use_index is None:
+            use_index = self.index is not None
+        if use_index and k > 0 and self.index is None:
+            self.build_index()
+
+        nearest_idx = np.empty((num_obs, k), dtype=np.int64)
+        nearest_dist = np.empty((num_obs, k))
+        self.last_scanned = 0 if use_index or k <= 0 else num_obs * len(self)
+        if k <= 0 or num_obs == 0:
+            return nearest_idx, nearest_dist
+
+        max_distances = max_distances or config.KNN_BATCH_MAX_DISTANCES
+        chunk_rows = max(1, max_distances // len(self))
+        fingerprint_sq_norms = None
+        if not use_index and self.quantized is None:
+            fingerprint_sq_norms = np.einsum('ij,ij->i', self._rssi, self._rssi)
+        for start in range(0, num_obs, chunk_rows):
+            chunk = observations[start:start + chunk_rows]
+            if use_index:
+                chunk_dist, chunk_idx = self.index.tree.query(chunk, k=list(range(1, k + 1)), eps=approx_epsilon)
+            else:
+                if self.quantized is not None:
+                    sq_dist = self.quantized.sq_distances(chunk)
+                else:
+                    # |o - f|^2 = |o|^2 + |f|^2 - 2 o.f, tính bằng một phép nhân ma trận
+                    sq_dist = (np.einsum('ij,ij->i', chunk, chunk)[:, None] + fingerprint_sq_norms
+                               - 2 * chunk @ self._rssi.T)
+                    np.maximum(sq_dist, 0, out=sq_dist)
+                if k < len(self):
+                    chunk_idx = np.argpartition(sq_dist, k - 1, axis=1)[:, :k]
+                else:
+                    chunk_idx = np.broadcast_to(np.arange(len(self)), sq_dist.shape)
+                chunk_sq_dist = np.take_along_axis(sq_dist, chunk_idx, axis=1)
+                order = np.argsort(chunk_sq_dist, axis=1, kind='stable')
+                chunk_idx = np.take_along_axis(chunk_idx, order, axis=1)
+                chunk_dist = np.sqrt(np.take_along_axis(chunk_sq_dist, order, axis=1))
+            nearest_idx[start:start + len(chunk)] = chunk_idx
+            nearest_dist[start:start + len(chunk)] = chunk_dist
+        return nearest_idx, nearest_dist
+
+    def predict_batch(self, observations, k, weighted=False, epsilon=config.EPSILON_WEIGHT,
+                      use_index=None, approx_epsilon=0.0, max_distances=None, use_strongest_aps=None):
+        """Dự đoán vị trí cho M quan sát; trả về mảng (M, 2), toàn NaN nếu không có dữ liệu."""
+        observations = np.asarray(observations, dtype=np.float64)
+        num_obs = observations.reshape(-1, max(self.num_aps, 1)).shape[0]
+        if len(self) == 0:
+            return np.full((num_obs, 2), np.nan)
+        nearest_idx, nearest_dist = self.nearest_batch(observations, k, use_index, approx_epsilon, max_distances,
+                                                       use_strongest_aps)
+        neighbor_positions = self.positions[nearest_idx].astype(np.float64) # (M, k, 2)
+        if weighted:
+            weights = 1 / (nearest_dist + epsilon)
+            sum_weights = weights.sum(axis=1, keepdims=True)
+            weighted_estimates = (neighbor_positions * weights[:, :, None]).sum(axis=1) / np.where(
+                sum_weights == 0, 1, sum_weights)
+            return np.where(sum_weights == 0, neighbor_positions.mean(axis=1), weighted_estimates)
+        return neighbor_positions.mean(axis=1)
+
+    def predict(self, observed_rssi, k, weighted=False, epsilon=config.EPSILON_WEIGHT,
+                use_index=None, approx_epsilon=0.0, use_strongest_aps=None):
+        """Dự đoán vị trí (hàng, cột) dạng float bằng KNN; None nếu không có dữ liệu."""
+        if len(self) == 0:
+            return None
+        nearest_idx, nearest_dist = self.nearest(observed_rssi, k, use_index, approx_epsilon, use_strongest_aps)
+        return estimate_position(self.positions[nearest_idx], nearest_dist, weighted, epsilon)
+
+def estimate_position(neighbor_positions, neighbor_distances, weighted=False, epsilon=config.EPSILON_WEIGHT):
+    """Gộp vị trí các láng giềng thành một ước tính (trung bình hoặc trung bình trọng số 1/(d+epsilon))."""
+    if len(neighbor_positions) == 0:
+        return None
+    if weighted:
+        weights = 1 / (neighbor_distances + epsilon)
+        sum_weights = weights.sum()
+        if sum_weights != 0:
+            estimated_r, estimated_c = (neighbor_positions * weights[:, None]).sum(axis=0) / sum_weights
+            return (float(estimated_r), float(estimated_c))
+    estimated_r, estimated_c = neighbor_positions.mean(axis=0)
+    return (float(estimated_r), float(estimated_c))
+
+def build_fingerprint_db(grid_map, access_points, seed=None, shelf_crossing_maps=None, storage=None):
+    """
+    Tạo FingerprintDB cho bản đồ, dùng engine trong config.FINGERPRINT_ENGINE.
+    storage: kiểu lưu RSSI (mặc định config.FINGERPRINT_STORAGE); 'float64' để giữ giá trị gốc.
+    """
+    if config.FINGERPRINT_ENGINE == 'vectorized':
+        rssi_grid = rssi_simulation.generate_rssi_fingerprint_array(
+            grid_map, access_points, config.RANDOM_SEED if seed is None else seed, shelf_crossing_maps
+        )
+        return FingerprintDB.from_rssi_grid(rssi_grid, storage=storage)
+    if config.FINGERPRINT_ENGINE == 'parallel':
+        rssi_grid, _ = parallel_fingerprints.generate_rssi_fingerprint_array_parallel(
+            grid_map, access_points, config.RANDOM_SEED if seed is None else seed, shelf_crossing_maps
+        )
+        return FingerprintDB.from_rssi_grid(rssi_grid, storage=storage)
+    num_rows, num_cols = grid_map.shape
+    return FingerprintDB.from_dict(rssi_simulation.generate_rssi_fingerprints(
+        grid_map, access_points, num_rows, num_cols, seed=seed, shelf_crossing_maps=shelf_crossing_maps
+    ), storage)
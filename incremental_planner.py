@@ -0,0 +1,236 @@
+# incremental_planner.py
+"""
+Tìm đường tăng dần D* Lite (Koenig & Likhachev 2002) cho xe đẩy khi lối đi bị chặn tạm thời
+(nhân viên, pallet, đám đông). Tìm ngược từ đích về vị trí xe; khi ô bị chặn/mở chặn hoặc xe
+di chuyển, chỉ các ô bị ảnh hưởng được cập nhật lại, phần còn lại của lần tìm trước được giữ.
+"""
+import heapq
+import math
+from array import array
+import numpy as np
+import config
+import instrumentation
+from path_planning import NEIGHBOR_MOVES
+
+# Chi phí số nguyên cố định (1 ô = COST_SCALE): khóa so sánh chính xác, không lệch do làm tròn
+# số thực theo thứ tự cộng khác nhau (lệch 1 ulp có thể làm bỏ sót ô thiếu nhất quán khi dừng).
+COST_SCALE = 1 << 30
+STRAIGHT_COST = COST_SCALE
+DIAGONAL_COST = round(math.sqrt(2) * COST_SCALE)
+INF_COST = 1 << 62
+
+class DStarLitePlanner:
+    """
+    D* Lite trên lưới 8 hướng (chi phí thẳng 1, chéo sqrt(2)), cùng lưới đệm và chỉ số phẳng
+    như GridPlanner nên đường đi có cùng độ dài với A*.
+    g, rhs: chi phí đến đích hiện tại và ước lượng một bước (số nguyên, đơn vị 1/COST_SCALE ô);
+    ô có g != rhs nằm trong hàng đợi.
+    Ô bị chặn tạm thời (blocked_cells) tách riêng khỏi bản đồ tĩnh: mở chặn không làm ô kệ đi được.
+    """
+    def __init__(self, grid_map, start_node_grid, end_node_grid):
+        self.num_rows, self.num_cols = grid_map.shape
+        self.padded_cols = self.num_cols + 2
+        padded = np.zeros((self.num_rows + 2, self.padded_cols), dtype=bool)
+        padded[1:-1, 1:-1] = grid_map == config.CELL_TYPE_PATH
+        self.static_walkable = bytes(padded.ravel().tobytes())
+        self.walkable = bytearray(self.static_walkable)
+        self.neighbor_offsets = [(dr * self.padded_cols + dc, STRAIGHT_COST if cost == 1.0 else DIAGONAL_COST)
+                                 for dr, dc, cost in NEIGHBOR_MOVES]
+        self.blocked_cells = set()
+
+        num_cells = len(self.walkable)
+        self.g = array('q', [INF_COST]) * num_cells
+        self.rhs = array('q', [INF_COST]) * num_cells
+        # Hàng đợi ưu tiên xóa lười: mục (k1, k2, ô) chỉ hợp lệ khi khớp khóa đang ghi cho ô đó
+        self.queued = bytearray(num_cells)
+        self.queued_key1 = array('q', bytes(8 * num_cells))
+        self.queued_key2 = array('q', bytes(8 * num_cells))
+        self.open_heap = []
+        self.km = 0
+
+        self.start_idx = self.to_index(start_node_grid)
+        self.goal_idx = self.to_index(end_node_grid)
+        self.last_expanded = 0  # Số nút đã mở rộng ở lần lập kế hoạch gần nhất
+        self.total_expanded = 0 # Tổng số nút đã mở rộng từ khi tạo
+        if self.in_bounds(end_node_grid):
+            self.rhs[self.goal_idx] = 0 if self.walkable[self.goal_idx] else INF_COST
+            self._update_vertex(self.goal_idx)
+
+    def to_index(self, cell):
+        return (cell[0] + 1) * self.padded_cols + (cell[1] + 1)
+
+    def to_cell(self, index):
+        r, c = divmod(index, self.padded_cols)
+        return (r - 1, c - 1)
+
+    def in_bounds(self, cell):
+        return 0 <= cell[0] < self.num_rows and 0 <= cell[1] < self.num_cols
+
+    def nbytes(self):
+        return (len(self.static_walkable) + len(self.walkable) + len(self.queued)
+                + sum(values.itemsize * len(values) for values in (self.g, self.rhs,
+                                                                   self.queued_key1, self.queued_key2)))
+
+    def _heuristic(self, index):
+        """Octile (chi phí số nguyên) từ vị trí xe đến ô index; tìm ngược nên heuristic hướng về xe."""
+        start_r, start_c = divmod(self.start_idx, self.padded_cols)
+        r, c = divmod(index, self.padded_cols)
+        dr, dc = abs(r - start_r), abs(c - start_c)
+        if dr > dc:
+            dr, dc = dc, dr
+        return DIAGONAL_COST * dr + STRAIGHT_COST * (dc - dr)
+
+    def _update_vertex(self, index):
+        g_value, rhs_value = self.g[index], self.rhs[index]
+        if g_value == rhs_value:
+            self.queued[index] = 0
+            return
+        min_cost = min(g_value, rhs_value)
+        key1, key2 = min_cost + self._heuristic(index) + self.km, min_cost
+        self.queued[index] = 1
+        self.queued_key1[index] = key1
+        self.queued_key2[index] = key2
+        heapq.heappush(self.open_heap, (key1, key2, index))
+
+    def _lookahead(self, index):
+        """rhs của ô: min chi phí bước + g trên các láng giềng đi được (0 ở đích, vô cùng nếu bị chặn)."""
+        if not self.walkable[index]:
+            return INF_COST
+        if index == self.goal_idx:
+            return 0
+        walkable, g = self.walkable, self.g
+        best = INF_COST
+        for offset, move_cost in self.neighbor_offsets:
+            neighbor_idx = index + offset
+            if walkable[neighbor_idx] and move_cost + g[neighbor_idx] < best:
+                best = move_cost + g[neighbor_idx]
+        return best
+
+    def _cells_changed(self, indices):
+        """Tính lại rhs của các ô đổi trạng thái và láng giềng của chúng, đưa ô không nhất quán vào hàng đợi."""
+        affected = set(indices)
+        for index in indices:
+            affected.update(index + offset for offset, _ in self.neighbor_offsets)
+        for index in affected:
+            self.rhs[index] = self._lookahead(index)
+            self._update_vertex(index)
+
+    def _set_cells_walkable(self, cells, walkable):
+        changed = []
+        for cell in cells:
+            cell = (int(cell[0]), int(cell[1]))
+            if not self.in_bounds(cell):
+                continue
+            index = self.to_index(cell)
+            if walkable and cell in self.blocked_cells:
+                self.blocked_cells.discard(cell)
+                self.walkable[index] = self.static_walkable[index]
+            elif not walkable and self.static_walkable[index] and cell not in self.blocked_cells:
+                self.blocked_cells.add(cell)
+                self.walkable[index] = 0
+            else:
+                continue
+            changed.append(index)
+        if changed:
+            self._cells_changed(changed)
+        return len(changed)
+
+    def block_cells(self, cells):
+        """Đánh dấu các ô (hàng, cột) bị chặn tạm thời; trả về số ô thực sự đổi trạng thái."""
+        return self._set_cells_walkable(cells, False)
+
+    def unblock_cells(self, cells):
+        """Mở chặn các ô đã chặn bằng block_cells; trả về số ô thực sự đổi trạng thái."""
+        return self._set_cells_walkable(cells, True)
+
+    def move_start(self, cell):
+        """Xe đã đi đến ô cell: cộng dồn km để khóa cũ trong hàng đợi vẫn là cận dưới."""
+        index = self.to_index(cell)
+        if index != self.start_idx:
+            self.km += self._heuristic(index)
+            self.start_idx = index
+
+    def _compute_shortest_path(self):
+        walkable, g, rhs = self.walkable, self.g, self.rhs
+        queued, queued_key1, queued_key2 = self.queued, self.queued_key1, self.queued_key2
+        open_heap, start_idx, goal_idx = self.open_heap, self.start_idx, self.goal_idx
+        expanded = 0
+        while open_heap:
+            key1, key2, index = open_heap[0]
+            if not queued[index] or queued_key1[index] != key1 or queued_key2[index] != key2:
+                heapq.heappop(open_heap) # Mục cũ đã bị thay thế hoặc ô đã nhất quán
+                continue
+            start_min = min(g[start_idx], rhs[start_idx])
+            if (key1, key2) >= (start_min + self.km, start_min) and rhs[start_idx] <= g[start_idx]:
+                break
+            heapq.heappop(open_heap)
+            min_cost = min(g[index], rhs[index])
+            new_key1 = min_cost + self._heuristic(index) + self.km
+            if (key1, key2) < (new_key1, min_cost):
+                queued_key1[index] = new_key1
+                queued_key2[index] = min_cost
+                heapq.heappush(open_heap, (new_key1, min_cost, index))
+                continue
+            expanded += 1
+            queued[index] = 0
+            if g[index] > rhs[index]:
+                # Quá nhất quán: chốt g và hạ rhs của các láng giềng qua ô này
+                g[index] = rhs[index]
+                for offset, move_cost in self.neighbor_offsets:
+                    neighbor_idx = index + offset
+                    if walkable[neighbor_idx] and neighbor_idx != goal_idx and \
+                       move_cost + g[index] < rhs[neighbor_idx]:
+                        rhs[neighbor_idx] = move_cost + g[index]
+                        self._update_vertex(neighbor_idx)
+            else:
+                # Thiếu nhất quán (đường qua ô này bị chặn): đặt g vô cùng, tính lại rhs quanh ô
+                g[index] = INF_COST
+                self.rhs[index] = self._lookahead(index)
+                self._update_vertex(index)
+                for offset, _ in self.neighbor_offsets:
+                    neighbor_idx = index + offset
+                    if walkable[neighbor_idx]:
+                        rhs[neighbor_idx] = self._lookahead(neighbor_idx)
+                        self._update_vertex(neighbor_idx)
+        return expanded
+
+    @instrumentation.timed('routing.dstar_lite', items=lambda path, planner, *_, **__: planner.last_expanded)
+    def plan(self, start_node_grid=None):
+        """
+        Đường đi ngắn nhất từ vị trí xe (start_node_grid nếu có, sau move_start) đến đích:
+        list (hàng, cột) hoặc None nếu không tới được. Lần đầu là một lần tìm đầy đủ; các lần sau
+        chỉ sửa phần bị ảnh hưởng bởi ô chặn/mở chặn kể từ lần trước.
+        """
+        self.last_expanded = 0
+        if start_node_grid is not None:
+            if not self.in_bounds(start_node_grid):
+                return None
+            self.move_start(start_node_grid)
+        if not self.walkable[self.start_idx] or not self.walkable[self.goal_idx]:
+            return None
+        self.last_expanded = self._compute_shortest_path()
+        self.total_expanded += self.last_expanded
+
+        g, walkable = self.g, self.walkable
+        if g[self.start_idx] == INF_COST and self.rhs[self.start_idx] == INF_COST:
+            return None
+        path = [self.to_cell(self.start_idx)]
+        index = self.start_idx
+        for _ in range(len(walkable)): # Đi theo láng giềng có chi phí bước + g nhỏ nhất
+            if index == self.goal_idx:
+                return path
+            best_idx, best_cost = -1, INF_COST
+            for offset, move_cost in self.neighbor_offsets:
+                neighbor_idx = index + offset
+                if walkable[neighbor_idx] and move_cost + g[neighbor_idx] < best_cost:
+                    best_idx, best_cost = neighbor_idx, move_cost + g[neighbor_idx]
+            if best_idx < 0:
+                return None
+            index = best_idx
+            path.append(self.to_cell(index))
+        return None
+
+def cells_around(center, radius):
+    """Các ô (hàng, cột) trong hình vuông bán kính radius quanh center; ô ngoài bản đồ bị block_cells bỏ qua."""
+    return [(center[0] + dr, center[1] + dc)
+            for dr in range(-radius, radius + 1) for dc in range(-radius, radius + 1)]
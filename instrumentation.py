@@ -0,0 +1,150 @@
+# instrumentation.py
+"""
+Đo các giai đoạn nóng (mô phỏng RSSI, định vị, tìm đường, vẽ): số lần gọi, tổng thời gian,
+histogram độ trễ (p50/p95/p99) và số phần tử đã xử lý (ô mô phỏng, fingerprint đã so,
+nút A* đã mở rộng...) cho từng giai đoạn.
+Bật/tắt lúc chạy bằng enable()/disable() (mặc định config.INSTRUMENTATION_ENABLED). Khi tắt,
+hàm bọc bởi timed chỉ tốn thêm một phép kiểm tra cờ toàn cục.
+"""
+import functools
+import json
+import math
+import threading
+import time
+import config
+
+# Histogram độ trễ theo thang log: _BINS_PER_DECADE ngăn mỗi bậc 10, từ 0.1 µs đến 1000 s
+_BINS_PER_DECADE = 20
+_MIN_LATENCY_S = 1e-7
+_LOG10_MIN_LATENCY = math.log10(_MIN_LATENCY_S)
+_NUM_BINS = 10 * _BINS_PER_DECADE + 1
+
+class StageStats:
+    """Thống kê cộng dồn của một giai đoạn; bộ nhớ cố định, không lưu từng lần đo."""
+    __slots__ = ('count', 'total_s', 'min_s', 'max_s', 'items', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.total_s = 0.0
+        self.min_s = math.inf
+        self.max_s = 0.0
+        self.items = 0
+        self.histogram = [0] * _NUM_BINS
+
+    def add(self, elapsed_s, items=0):
+        self.count += 1
+        self.total_s += elapsed_s
+        self.items += items
+        if elapsed_s < self.min_s:
+            self.min_s = elapsed_s
+        if elapsed_s > self.max_s:
+            self.max_s = elapsed_s
+        bin_idx = 0
+        if elapsed_s > _MIN_LATENCY_S:
+            bin_idx = int((math.log10(elapsed_s) - _LOG10_MIN_LATENCY) * _BINS_PER_DECADE)
+        self.histogram[bin_idx if bin_idx < _NUM_BINS else _NUM_BINS - 1] += 1
+
+    def percentile(self, q):
+        """Phân vị q (0-100) của độ trễ (giây), lấy tâm hình học của ngăn histogram chứa nó."""
+        if self.count == 0:
+            return None
+        rank = max(1, math.ceil(q / 100 * self.count))
+        cumulative = 0
+        for bin_idx, bin_count in enumerate(self.histogram):
+            cumulative += bin_count
+            if cumulative >= rank:
+                break
+        latency_s = _MIN_LATENCY_S * 10 ** ((bin_idx + 0.5) / _BINS_PER_DECADE)
+        return min(max(latency_s, self.min_s), self.max_s)
+
+    def to_dict(self):
+        if self.count == 0:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'total_s': self.total_s,
+            'mean_ms': self.total_s / self.count * 1000,
+            'p50_ms': self.percentile(50) * 1000,
+            'p95_ms': self.percentile(95) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'min_ms': self.min_s * 1000,
+            'max_ms': self.max_s * 1000,
+            'items': self.items,
+            'items_per_s': self.items / self.total_s if self.items and self.total_s > 0 else None,
+        }
+
+_enabled = bool(config.INSTRUMENTATION_ENABLED)
+_stages = {}
+_lock = threading.Lock() # tracking_service định vị ở thread của executor
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    """Xóa mọi thống kê đã ghi (không đổi trạng thái bật/tắt)."""
+    with _lock:
+        _stages.clear()
+
+def record(stage, elapsed_s, items=0):
+    """Ghi một lần đo cho giai đoạn stage; không làm gì khi đang tắt."""
+    if not _enabled:
+        return
+    with _lock:
+        stage_stats = _stages.get(stage)
+        if stage_stats is None:
+            stage_stats = _stages[stage] = StageStats()
+        stage_stats.add(elapsed_s, items)
+
+def timed(stage, items=None):
+    """
+    Decorator đo thời gian mỗi lần gọi hàm dưới tên stage.
+    items: hàm (kết quả, *args, **kwargs) -> số phần tử đã xử lý trong lần gọi (tùy chọn).
+    Lần gọi ném ngoại lệ không được ghi.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start_time = time.perf_counter()
+            result = func(*args, **kwargs)
+            elapsed_s = time.perf_counter() - start_time
+            record(stage, elapsed_s, int(items(result, *args, **kwargs)) if items is not None else 0)
+            return result
+        return wrapper
+    return decorator
+
+def stats(stage=None):
+    """Thống kê dạng dict của một giai đoạn, hoặc dict tên -> thống kê của mọi giai đoạn."""
+    with _lock:
+        if stage is not None:
+            return _stages[stage].to_dict() if stage in _stages else {'count': 0}
+        return {name: stage_stats.to_dict() for name, stage_stats in sorted(_stages.items())}
+
+def dump_json(path=None):
+    """Chuỗi JSON của stats(); ghi ra tệp nếu có path."""
+    stats_json = json.dumps(stats(), indent=2)
+    if path:
+        with open(path, 'w', encoding='utf-8') as output_file:
+            output_file.write(stats_json)
+    return stats_json
+
+def format_stats():
+    """Bảng thống kê nhiều dòng để in ra terminal."""
+    lines = [f"{'Giai đoạn':<28}{'Số lần':>8}{'Tổng (s)':>10}{'p50 (ms)':>10}{'p95 (ms)':>10}"
+             f"{'p99 (ms)':>10}{'Phần tử':>12}"]
+    for name, stage_stats in stats().items():
+        if stage_stats['count'] == 0:
+            continue
+        lines.append(f"{name:<28}{stage_stats['count']:>8}{stage_stats['total_s']:>10.3f}"
+                     f"{stage_stats['p50_ms']:>10.3f}{stage_stats['p95_ms']:>10.3f}"
+                     f"{stage_stats['p99_ms']:>10.3f}{stage_stats['items']:>12}")
+    return "\n".join(lines)
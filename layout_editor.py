@@ -0,0 +1,231 @@
+# layout_editor.py
+import time
+import numpy as np
+import config
+import map_utils
+import rssi_simulation
+import parallel_fingerprints
+import path_planning
+from fingerprint_db import FingerprintDB, build_fingerprint_db
+from distance_fields import DistanceFields
+
+class StoreLayout:
+    """
+    Bố cục kệ có thể chỉnh sửa (thêm, di chuyển, xóa kệ) với cập nhật tăng dần:
+    - Fingerprint: chỉ tính lại các tia (AP, ô) có thể đi qua vùng thay đổi, với đúng
+      nhiễu mà engine hiện tại đã rút cho ô đó, nên kết quả giống tạo lại toàn bộ. Điều này chỉ
+      đúng với engine có seed ('vectorized', 'parallel'); engine 'loop' rút nhiễu từ np.random
+      toàn cục nên mỗi lần sửa đều tạo lại toàn bộ fingerprint.
+    - Điểm tiếp cận món hàng: chỉ tìm lại cho kệ có ô kệ hoặc ô kề bị thay đổi.
+    - Trường khoảng cách: DistanceFields.repair chỉ đánh dấu cũ các ô đích bị ảnh hưởng;
+      chúng được tính lại khi truy vấn (hoặc refresh()).
+    shelves_layout: danh sách dict kệ như trong main.py (name, r, c, rows, cols, items_on_shelf).
+    grid_map được sửa tại chỗ, nên mọi nơi đang giữ tham chiếu đều thấy bố cục mới.
+    """
+    def __init__(self, grid_map, access_points, shelves_layout, seed=None,
+                 fingerprints=None, shelf_crossing_maps=None, distance_fields=None, planner=None):
+        self.grid_map = grid_map
+        self.access_points = list(access_points)
+        self.shelves = [dict(shelf) for shelf in shelves_layout]
+        self.seed = config.RANDOM_SEED if seed is None else seed
+        # Ô kệ không thuộc kệ nào trong danh sách (vd. vẽ trực tiếp bằng add_shelf) được giữ nguyên
+        self.fixed_shelf_mask = (grid_map == config.CELL_TYPE_SHELF) & ~self._shelf_mask(self.shelves)
+
+        if shelf_crossing_maps is None:
+            shelf_crossing_maps = rssi_simulation.compute_shelf_crossing_maps(grid_map, self.access_points)
+        self.shelf_crossing_maps = np.array(shelf_crossing_maps) # Bản sao ghi được (cache là mmap chỉ đọc)
+        if fingerprints is None:
+            fingerprints = build_fingerprint_db(grid_map, self.access_points, self.seed, self.shelf_crossing_maps)
+        self.rssi_grid = np.full(grid_map.shape + (len(self.access_points),), np.nan)
+        self._set_fingerprints(fingerprints)
+        self.standard_noise = None # Nhiễu N(0, 1) của từng (AP, ô), rút khi sửa lần đầu
+
+        self.shelf_spots = self._find_spots(self.shelves)
+        self.item_locations = self._collect_item_locations()
+        self.distance_fields = distance_fields or DistanceFields.build(grid_map, self._targets())
+        self.planner = planner or path_planning.GridPlanner(grid_map)
+
+    @staticmethod
+    def _shelf_rect(shelf):
+        return (shelf['r'], shelf['r'] + shelf['rows'], shelf['c'], shelf['c'] + shelf['cols'])
+
+    def _shelf_mask(self, shelves):
+        mask = np.zeros(self.grid_map.shape, dtype=bool)
+        for shelf in shelves:
+            row_start, row_end, col_start, col_end = self._shelf_rect(shelf)
+            mask[row_start:row_end, col_start:col_end] = True
+        return mask
+
+    def _find_spots(self, shelves):
+        """Điểm tiếp cận của từng món trên mỗi kệ (như define_item_locations), None nếu không tìm được."""
+        side_spots, fallback_spots = map_utils.compute_shelf_access_spots(self.grid_map, shelves)
+        return [[map_utils.select_access_spot(side_spots[shelf_idx], fallback_spots[shelf_idx],
+                                              item_detail.get('preferred_side'))
+                 for item_detail in shelf['items_on_shelf']]
+                for shelf_idx, shelf in enumerate(shelves)]
+
+    def _collect_item_locations(self):
+        item_locations = {}
+        for shelf, spots in zip(self.shelves, self.shelf_spots):
+            for item_detail, spot in zip(shelf['items_on_shelf'], spots):
+                locations = item_locations.setdefault(item_detail['item_name'], [])
+                if spot is None:
+                    print(f"CẢNH BÁO: Không tìm được điểm tiếp cận cho kệ '{shelf.get('name', 'Không tên')}' "
+                          f"chứa '{item_detail['item_name']}' với preferred_side='{item_detail.get('preferred_side')}'.")
+                elif spot not in locations:
+                    locations.append(spot)
+        return item_locations
+
+    def _targets(self):
+        return list(dict.fromkeys(spot for spots in self.item_locations.values() for spot in spots))
+
+    def _check_in_bounds(self, shelf):
+        """Ném ValueError nếu hình chữ nhật kệ không nằm trọn trong bản đồ (slice âm/vượt biên sẽ xóa mất kệ)."""
+        row_start, row_end, col_start, col_end = self._shelf_rect(shelf)
+        num_rows, num_cols = self.grid_map.shape
+        if row_start < 0 or col_start < 0 or row_end > num_rows or col_end > num_cols \
+           or shelf['rows'] <= 0 or shelf['cols'] <= 0:
+            raise ValueError(f"Kệ '{shelf.get('name')}' tại ({shelf['r']}, {shelf['c']}) kích thước "
+                             f"{shelf['rows']}x{shelf['cols']} nằm ngoài bản đồ {num_rows}x{num_cols}")
+
+    def _shelf_index(self, name):
+        for shelf_idx, shelf in enumerate(self.shelves):
+            if shelf.get('name') == name:
+                return shelf_idx
+        raise ValueError(f"Không có kệ tên '{name}'")
+
+    def _set_fingerprints(self, fingerprints):
+        self.rssi_grid[:] = np.nan
+        self.rssi_grid[fingerprints.positions[:, 0], fingerprints.positions[:, 1]] = fingerprints.rssi
+        self.fingerprints = fingerprints
+
+    def _noise(self):
+        if self.standard_noise is None:
+            if config.FINGERPRINT_ENGINE == 'parallel':
+                self.standard_noise = parallel_fingerprints.standard_noise_grid_tiled(
+                    self.grid_map.shape, len(self.access_points), self.seed)
+            else:
+                self.standard_noise = rssi_simulation.standard_noise_grid(
+                    self.grid_map.shape, len(self.access_points), self.seed)
+        return self.standard_noise
+
+    def add_shelf(self, shelf_info):
+        """Thêm một kệ (dict cùng định dạng shelves_layout); trả về thống kê cập nhật."""
+        if any(shelf.get('name') == shelf_info.get('name') for shelf in self.shelves):
+            raise ValueError(f"Đã có kệ tên '{shelf_info.get('name')}'")
+        self._check_in_bounds(shelf_info)
+        return self._apply(self.shelves + [dict(shelf_info)], [self._shelf_rect(shelf_info)],
+                           edited_idx=len(self.shelves))
+
+    def remove_shelf(self, name):
+        shelf_idx = self._shelf_index(name)
+        return self._apply(self.shelves[:shelf_idx] + self.shelves[shelf_idx + 1:],
+                           [self._shelf_rect(self.shelves[shelf_idx])], removed_idx=shelf_idx)
+
+    def move_shelf(self, name, new_row, new_col):
+        """Dời góc trên trái của kệ đến (new_row, new_col), giữ nguyên kích thước và món hàng."""
+        shelf_idx = self._shelf_index(name)
+        shelves = [dict(shelf) for shelf in self.shelves]
+        shelves[shelf_idx].update(r=int(new_row), c=int(new_col))
+        self._check_in_bounds(shelves[shelf_idx])
+        return self._apply(shelves, [self._shelf_rect(self.shelves[shelf_idx]), self._shelf_rect(shelves[shelf_idx])],
+                           edited_idx=shelf_idx)
+
+    def _ray_hits_box(self, ap_pos, rows, cols, changed_box):
+        """
+        Tia Bresenham từ AP đến ô (rows, cols) có thể đi qua hộp changed_box không: đoạn thẳng
+        AP -> tâm ô cắt hộp nới thêm 1 ô (điểm Bresenham lệch đường thẳng lý tưởng < 1 ô).
+        """
+        (row_lo, row_hi), (col_lo, col_hi) = changed_box
+        t_enter = np.zeros(rows.shape)
+        t_exit = np.ones(rows.shape)
+        hits = np.ones(rows.shape, dtype=bool)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for start, delta, low, high in ((ap_pos[0], rows - ap_pos[0], row_lo - 1, row_hi + 1),
+                                            (ap_pos[1], cols - ap_pos[1], col_lo - 1, col_hi + 1)):
+                t_low, t_high = (low - start) / delta, (high - start) / delta
+                parallel = delta == 0
+                hits &= ~parallel | ((low <= start) & (start <= high))
+                t_enter = np.where(parallel, t_enter, np.maximum(t_enter, np.minimum(t_low, t_high)))
+                t_exit = np.where(parallel, t_exit, np.minimum(t_exit, np.maximum(t_low, t_high)))
+        return hits & (t_enter <= t_exit)
+
+    def _apply(self, shelves, edited_rects, edited_idx=None, removed_idx=None):
+        """Áp dụng danh sách kệ mới; edited_rects là các hình chữ nhật (hàng đầu, hàng cuối, cột đầu, cột cuối) có thể đổi."""
+        start_time = time.perf_counter()
+        new_shelf_mask = self._shelf_mask(shelves) | self.fixed_shelf_mask
+        new_grid = np.where(new_shelf_mask, config.CELL_TYPE_SHELF, config.CELL_TYPE_PATH).astype(self.grid_map.dtype)
+        changed_mask = new_grid != self.grid_map
+        stats = {'changed_cells': int(changed_mask.sum()), 'rays_checked': 0, 'fingerprints_updated': 0,
+                 'shelves_respotted': 0, 'fields_invalidated': 0, 'fields_added': 0}
+        blocked = np.argwhere(changed_mask & new_shelf_mask)
+        opened = np.argwhere(changed_mask & ~new_shelf_mask)
+        self.grid_map[changed_mask] = new_grid[changed_mask]
+        if removed_idx is not None:
+            del self.shelf_spots[removed_idx]
+        self.shelves = shelves
+
+        if stats['changed_cells']:
+            if config.FINGERPRINT_ENGINE == 'loop':
+                # Nhiễu của engine 'loop' không tái lập được theo ô: tạo lại toàn bộ thay vì trộn hai luồng nhiễu
+                self.shelf_crossing_maps = np.array(
+                    rssi_simulation.compute_shelf_crossing_maps(self.grid_map, self.access_points))
+                self._set_fingerprints(build_fingerprint_db(self.grid_map, self.access_points, self.seed,
+                                                            self.shelf_crossing_maps))
+                stats['rays_checked'] = stats['fingerprints_updated'] = \
+                    len(self.fingerprints) * len(self.access_points)
+            else:
+                # Hộp bao các ô thay đổi trong từng hình chữ nhật được sửa (mọi ô thay đổi nằm trong chúng)
+                changed_boxes = []
+                for row_start, row_end, col_start, col_end in edited_rects:
+                    changed_r, changed_c = np.nonzero(changed_mask[row_start:row_end, col_start:col_end])
+                    if len(changed_r):
+                        changed_boxes.append(((row_start + changed_r.min(), row_start + changed_r.max()),
+                                              (col_start + changed_c.min(), col_start + changed_c.max())))
+                rows, cols = np.indices(self.grid_map.shape)
+                noise = self._noise()
+                # --- Fingerprint: chỉ các tia cắt vùng thay đổi ---
+                for ap_idx, ap_pos in enumerate(self.access_points):
+                    rays = changed_mask.copy()
+                    for changed_box in changed_boxes:
+                        rays |= self._ray_hits_box(ap_pos, rows, cols, changed_box)
+                    ray_r, ray_c = np.nonzero(rays)
+                    stats['rays_checked'] += len(ray_r)
+                    crossings = rssi_simulation.count_shelf_intersections_cells(ap_pos, self.grid_map, ray_r, ray_c)
+                    updated = (crossings != self.shelf_crossing_maps[ap_idx, ray_r, ray_c]) | changed_mask[ray_r, ray_c]
+                    stats['fingerprints_updated'] += int(updated.sum())
+                    self.shelf_crossing_maps[ap_idx, ray_r, ray_c] = crossings
+                    self.rssi_grid[ray_r, ray_c, ap_idx] = rssi_simulation.noisy_rssi_at_cells(
+                        ap_pos, ray_r, ray_c, crossings, noise[ap_idx, ray_r, ray_c])
+                self.rssi_grid[new_shelf_mask] = np.nan
+                self.fingerprints = FingerprintDB.from_rssi_grid(self.rssi_grid)
+
+            # --- Điểm tiếp cận: kệ có ô kệ hoặc ô kề (4 hướng) nằm trong vùng thay đổi ---
+            if edited_idx == len(self.shelf_spots):
+                self.shelf_spots.append(None)
+            respot_idx = [shelf_idx for shelf_idx, shelf in enumerate(self.shelves)
+                          if shelf_idx == edited_idx or
+                          changed_mask[max(0, shelf['r'] - 1):shelf['r'] + shelf['rows'] + 1,
+                                       max(0, shelf['c'] - 1):shelf['c'] + shelf['cols'] + 1].any()]
+            for shelf_idx, spots in zip(respot_idx, self._find_spots([self.shelves[idx] for idx in respot_idx])):
+                self.shelf_spots[shelf_idx] = spots
+            stats['shelves_respotted'] += len(respot_idx)
+
+            for r, c in blocked.tolist():
+                self.planner.set_walkable((r, c), False)
+            for r, c in opened.tolist():
+                self.planner.set_walkable((r, c), True)
+        elif edited_idx == len(self.shelf_spots): # Kệ mới trùng hoàn toàn ô kệ sẵn có
+            self.shelf_spots.extend(self._find_spots([self.shelves[edited_idx]]))
+
+        # --- Trường khoảng cách: bỏ ô đích cũ, sửa phần bị ảnh hưởng, thêm ô đích mới (tính khi cần) ---
+        self.item_locations = self._collect_item_locations()
+        targets = self._targets()
+        kept_targets = [target for target in targets if target in self.distance_fields.target_lookup]
+        fields = self.distance_fields.with_targets(self.grid_map, kept_targets)
+        if stats['changed_cells']:
+            stats['fields_invalidated'] = fields.repair(self.grid_map, blocked, opened)
+        self.distance_fields = fields.with_targets(self.grid_map, targets)
+        stats['fields_added'] = len(targets) - len(kept_targets)
+        stats['time_s'] = time.perf_counter() - start_time
+        return stats
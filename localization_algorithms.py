@@ -1,9 +1,16 @@
 # localization_algorithms.py
 import math
 import config
-from pathfinding.core.diagonal_movement import DiagonalMovement
-from pathfinding.core.grid import Grid # Sử dụng tên gốc
-from pathfinding.finder.a_star import AStarFinder
+import instrumentation
+from fingerprint_db import FingerprintDB
+from path_planning import GridPlanner
+
+try: # Thư viện pathfinding là tùy chọn, chỉ dùng khi config.PATHFINDING_BACKEND = 'pathfinding'
+    from pathfinding.core.diagonal_movement import DiagonalMovement
+    from pathfinding.core.grid import Grid # Sử dụng tên gốc
+    from pathfinding.finder.a_star import AStarFinder
+except ImportError:
+    AStarFinder = None
 
 def rssi_distance_euclidean(rssi_vec1, rssi_vec2):
     """Tính khoảng cách Euclide giữa hai vector RSSI."""
@@ -12,8 +19,35 @@ def rssi_distance_euclidean(rssi_vec1, rssi_vec2):
     squared_diff_sum = sum([(v1 - v2)**2 for v1, v2 in zip(rssi_vec1, rssi_vec2)])
     return math.sqrt(squared_diff_sum)
 
-def predict_location_knn(observed_rssi, fingerprints_data, k, weighted=False, epsilon=1e-6):
-    """Dự đoán vị trí dựa trên KNN."""
+def _knn_scanned(estimate, observed_rssi, fingerprints_data, *args, tracker=None, **kwargs):
+    """Số fingerprint đã so ở lần gọi predict_location_knn vừa xong (cho instrumentation)."""
+    if tracker is not None:
+        return tracker.last_candidates
+    if isinstance(fingerprints_data, FingerprintDB):
+        return fingerprints_data.last_scanned
+    return len(fingerprints_data)
+
+def _knn_batch_scanned(estimates, observations, fingerprints_data, *args, **kwargs):
+    if isinstance(fingerprints_data, FingerprintDB):
+        return fingerprints_data.last_scanned
+    return len(estimates) * len(fingerprints_data)
+
+@instrumentation.timed('localization.knn', items=_knn_scanned)
+def predict_location_knn(observed_rssi, fingerprints_data, k, weighted=False, epsilon=1e-6,
+                         use_index=None, approx_epsilon=0.0, tracker=None, use_strongest_aps=None):
+    """
+    Dự đoán vị trí dựa trên KNN.
+    fingerprints_data: FingerprintDB (tìm kiếm bằng mảng) hoặc dict[(hàng, cột)] -> list RSSI.
+    use_index, approx_epsilon, use_strongest_aps: chỉ áp dụng cho FingerprintDB (xem FingerprintDB.nearest).
+    tracker: TemporalKNNTracker của xe đẩy; nếu có thì tìm trong cửa sổ quanh ước tính
+    trước đó và làm mượt theo thời gian (tracker giữ fingerprint và tham số KNN riêng).
+    """
+    if tracker is not None:
+        return tracker.update(observed_rssi)
+    if isinstance(fingerprints_data, FingerprintDB):
+        return fingerprints_data.predict(observed_rssi, k, weighted, epsilon, use_index, approx_epsilon,
+                                         use_strongest_aps)
+
     if not fingerprints_data:
         # print("Lỗi: Dữ liệu fingerprint trống.")
         return None
@@ -57,13 +91,38 @@ def predict_location_knn(observed_rssi, fingerprints_data, k, weighted=False, ep
             estimated_c = weighted_sum_c / sum_weights
     return (estimated_r, estimated_c)
 
-def find_path_astar(grid_map_with_obstacles, start_node_grid, end_node_grid):
+@instrumentation.timed('localization.knn_batch', items=_knn_batch_scanned)
+def predict_location_knn_batch(observations, fingerprints_data, k, weighted=False, epsilon=1e-6,
+                               use_index=None, approx_epsilon=0.0, max_distances=None, use_strongest_aps=None):
+    """
+    Dự đoán vị trí cho nhiều quan sát trong một lần gọi.
+    observations: mảng (M, số AP) các vector RSSI quan sát được.
+    Trả về mảng (M, 2) các vị trí (hàng, cột) dạng float.
+    Bộ nhớ được giới hạn bằng cách chia khối bên trong (xem FingerprintDB.nearest_batch).
+    """
+    if not isinstance(fingerprints_data, FingerprintDB):
+        fingerprints_data = FingerprintDB.from_dict(fingerprints_data)
+    return fingerprints_data.predict_batch(observations, k, weighted, epsilon,
+                                           use_index, approx_epsilon, max_distances, use_strongest_aps)
+
+def find_path_astar(grid_map_with_obstacles, start_node_grid, end_node_grid, planner=None):
     """
     Tìm đường đi ngắn nhất bằng thuật toán A*.
     grid_map_with_obstacles: Bản đồ lưới của bạn (0 là lối đi, 1 là kệ).
     start_node_grid: (hàng, cột) của điểm bắt đầu.
     end_node_grid: (hàng, cột) của điểm kết thúc.
+    planner: GridPlanner dựng sẵn cho bản đồ này (tạo mới nếu None).
     """
+    if config.PATHFINDING_BACKEND == 'pathfinding':
+        return _find_path_astar_pathfinding(grid_map_with_obstacles, start_node_grid, end_node_grid)
+    if planner is None:
+        planner = GridPlanner(grid_map_with_obstacles)
+    return planner.find_path(start_node_grid, end_node_grid)
+
+def _find_path_astar_pathfinding(grid_map_with_obstacles, start_node_grid, end_node_grid):
+    """Bản A* cũ dựa trên thư viện pathfinding (dựng lại Grid mỗi lần gọi)."""
+    if AStarFinder is None:
+        raise ImportError("PATHFINDING_BACKEND = 'pathfinding' cần thư viện pathfinding (pip install pathfinding)")
     matrix = []
     for r_idx in range(grid_map_with_obstacles.shape[0]):
         row_data = []
@@ -6,27 +6,46 @@ import config
 import map_utils
 import rssi_simulation
 import localization_algorithms
+import map_cache
+import path_planning
+import route_optimizer
+import temporal_tracker
+import particle_filter
+import layout_editor
+import walkable_index
+import error_heatmap
+import ap_placement
 import visualization
+import instrumentation
+import incremental_planner
 
 current_interactive_plot_obj = None
 current_grid_map_data = None
 current_access_points_list = None
 current_rssi_fingerprints_map = None
+current_shelf_crossing_maps = None
+current_mean_rssi_grid = None
+current_path_planner = None
+current_item_distance_fields = None
+current_route_optimizer = None
+current_store_layout = None
 current_item_locations_dict = None
 current_map_num_rows = None
 current_map_num_cols = None
+current_blocked_cells = set() # Ô lối đi bị chặn tạm thời (hàng, cột)
 
 
 def handle_map_click(actual_cart_pos_grid):
     global current_interactive_plot_obj, current_grid_map_data, current_access_points_list
-    global current_rssi_fingerprints_map, current_item_locations_dict
+    global current_rssi_fingerprints_map, current_item_locations_dict, current_shelf_crossing_maps
+    global current_path_planner, current_item_distance_fields
 
     if current_interactive_plot_obj is None:
         return
 
     current_interactive_plot_obj.cart_actual_pos_grid = actual_cart_pos_grid
     cart_observed_rssi = rssi_simulation.get_observed_rssi_at_cart(
-        actual_cart_pos_grid, current_grid_map_data, current_access_points_list
+        actual_cart_pos_grid, current_grid_map_data, current_access_points_list, current_shelf_crossing_maps
     )
     print(f"RSSI quan sát được (mới): {[round(val, 1) for val in cart_observed_rssi]}")
 
@@ -35,7 +54,8 @@ def handle_map_click(actual_cart_pos_grid):
         current_rssi_fingerprints_map,
         config.K_NEIGHBORS,
         config.USE_WEIGHTED_KNN,
-        config.EPSILON_WEIGHT
+        config.EPSILON_WEIGHT,
+        approx_epsilon=config.KNN_APPROX_EPSILON
     )
 
     if estimated_pos_float:
@@ -56,13 +76,35 @@ def handle_map_click(actual_cart_pos_grid):
 
         while True:
             try:
-                choice = input(f"Nhập số TT món hàng bạn muốn tìm (hoặc 'q' để bỏ qua): ")
+                choice = input(f"Nhập số TT món hàng bạn muốn tìm, nhiều món cách nhau bởi dấu phẩy "
+                               f"('k' để di chuyển kệ, 'b' để chặn/mở lối đi, 'h' để xem bản đồ sai số, "
+                               f"'s' để xem thống kê hiệu năng, 'q' để bỏ qua): ")
+                if choice.lower() == 'k':
+                    move_shelf_from_input()
+                    break
+                if choice.lower() == 'b':
+                    toggle_blocked_cells_from_input()
+                    continue
+                if choice.lower() == 'h':
+                    show_error_heatmap()
+                    continue
+                if choice.lower() == 's':
+                    print_instrumentation_stats()
+                    continue
                 if choice.lower() == 'q':
                     current_interactive_plot_obj.target_item_name = None
                     current_interactive_plot_obj.target_item_pos_grid = None
                     current_interactive_plot_obj.current_path_nodes = None
                     current_interactive_plot_obj.update_plot_elements()
                     break
+                if ',' in choice:
+                    item_indices = [int(part) - 1 for part in choice.split(',') if part.strip()]
+                    if not all(0 <= idx < len(item_names_available) for idx in item_indices):
+                        print("Lựa chọn không hợp lệ.")
+                        continue
+                    handle_shopping_list([item_names_available[idx] for idx in item_indices],
+                                         estimated_pos_float, actual_cart_pos_grid)
+                    break
                 item_index = int(choice) - 1
                 if 0 <= item_index < len(item_names_available):
                     selected_item_name = item_names_available[item_index]
@@ -79,7 +121,8 @@ def handle_map_click(actual_cart_pos_grid):
                     target_pos = map_utils.get_item_target_location(
                         selected_item_name,
                         current_item_locations_dict,
-                        estimated_pos_float # Truyền vị trí xe đẩy để chọn target gần nhất
+                        estimated_pos_float, # Truyền vị trí xe đẩy để chọn target gần nhất
+                        current_item_distance_fields
                     )
                     if target_pos:
                         current_interactive_plot_obj.target_item_pos_grid = target_pos
@@ -91,11 +134,19 @@ def handle_map_click(actual_cart_pos_grid):
                             start_node_for_path = actual_cart_pos_grid
 
                         print(f"Tìm đường từ {start_node_for_path} đến {target_pos}...")
-                        path_nodes = localization_algorithms.find_path_astar(
-                            current_grid_map_data,
-                            start_node_for_path,
-                            target_pos
-                        )
+                        if current_blocked_cells or config.DYNAMIC_OBSTACLE_DEMO:
+                            # Có lối đi bị chặn tạm thời: trường khoảng cách tĩnh không còn đúng
+                            path_nodes = travel_with_replanning(start_node_for_path, [target_pos])
+                        else:
+                            # Đi theo trường hướng tính sẵn; chỉ chạy A* nếu đích không có trong trường
+                            path_nodes = current_item_distance_fields.route(start_node_for_path, target_pos)
+                            if path_nodes is None:
+                                path_nodes = localization_algorithms.find_path_astar(
+                                    current_grid_map_data,
+                                    start_node_for_path,
+                                    target_pos,
+                                    current_path_planner
+                                )
                         if path_nodes:
                             current_interactive_plot_obj.current_path_nodes = path_nodes
                             print(f"Đã tìm thấy đường đi gồm {len(path_nodes)} bước.")
@@ -124,8 +175,194 @@ def handle_map_click(actual_cart_pos_grid):
         current_interactive_plot_obj.error_m = None
         current_interactive_plot_obj.update_plot_elements()
 
+def apply_layout_edit(action, shelf_name, *args):
+    """
+    Sửa bố cục kệ ('move' tên hàng cột, 'remove' tên, 'add' dict kệ) và cập nhật tăng dần
+    fingerprint, điểm tiếp cận món hàng và trường khoảng cách.
+    """
+    global current_rssi_fingerprints_map, current_shelf_crossing_maps, current_item_locations_dict
+    global current_item_distance_fields, current_route_optimizer, current_mean_rssi_grid
+
+    if action == 'move':
+        stats = current_store_layout.move_shelf(shelf_name, *args)
+    elif action == 'remove':
+        stats = current_store_layout.remove_shelf(shelf_name)
+    elif action == 'add':
+        stats = current_store_layout.add_shelf(shelf_name)
+    else:
+        raise ValueError(f"Thao tác bố cục không hợp lệ: {action}")
+
+    current_rssi_fingerprints_map = current_store_layout.fingerprints
+    current_shelf_crossing_maps = current_store_layout.shelf_crossing_maps
+    current_item_locations_dict = current_store_layout.item_locations
+    current_item_distance_fields = current_store_layout.distance_fields
+    current_route_optimizer = None # Tạo lại khi cần (cần mọi trường khoảng cách mới nhất)
+    current_mean_rssi_grid = None
+    if config.KNN_USE_INDEX:
+        current_rssi_fingerprints_map.build_index()
+    if config.KNN_STRONGEST_AP_INDEX:
+        current_rssi_fingerprints_map.build_strongest_ap_index()
+    print(f"Đã cập nhật bố cục trong {stats['time_s'] * 1000:.0f} ms: {stats['changed_cells']} ô thay đổi, "
+          f"{stats['fingerprints_updated']} giá trị fingerprint tính lại, "
+          f"{stats['fields_invalidated'] + stats['fields_added']} trường khoảng cách sẽ tính lại khi cần.")
+
+    if current_interactive_plot_obj is not None:
+        current_interactive_plot_obj.grid_map_data = current_grid_map_data.copy()
+        current_interactive_plot_obj.item_locations_dict = current_item_locations_dict
+        current_interactive_plot_obj.rssi_fingerprints_data = current_rssi_fingerprints_map
+        current_interactive_plot_obj.target_item_name = None
+        current_interactive_plot_obj.target_item_pos_grid = None
+        current_interactive_plot_obj.current_path_nodes = None
+        current_interactive_plot_obj.error_overlay = None # Bản đồ sai số cũ không còn đúng
+        current_interactive_plot_obj.plot_initial_map()
+        current_interactive_plot_obj.update_plot_elements()
+    return stats
+
+def show_error_heatmap():
+    """Đánh giá sai số định vị Monte-Carlo trên mọi ô lối đi và phủ sai số trung bình lên bản đồ."""
+    global current_mean_rssi_grid
+    if current_mean_rssi_grid is None:
+        current_mean_rssi_grid = rssi_simulation.compute_mean_rssi_grid(
+            current_grid_map_data, current_access_points_list, current_shelf_crossing_maps
+        )
+    print(f"Đang đánh giá sai số định vị ({config.HEATMAP_TRIALS} lần thử mỗi ô)...")
+    error_maps = error_heatmap.evaluate_localization_error(
+        current_grid_map_data, current_access_points_list, current_rssi_fingerprints_map,
+        current_shelf_crossing_maps, seed=config.RANDOM_SEED, mean_rssi_grid=current_mean_rssi_grid
+    )
+    summary = error_heatmap.summarize(error_maps)
+    print(f"Xong trong {error_maps['time_s']:.2f}s: sai số trung bình {summary['mean_m']:.2f}m, "
+          f"p95 theo ô (phân vị 95) {summary['p95_of_cell_p95_m']:.2f}m, lớn nhất {summary['max_m']:.2f}m.")
+    if current_interactive_plot_obj is not None:
+        current_interactive_plot_obj.set_error_overlay(error_maps['mean_m'], 'Sai số trung bình (m)')
+
+def print_instrumentation_stats():
+    """In thống kê hiệu năng các giai đoạn nóng; ghi JSON nếu có config.INSTRUMENTATION_OUTPUT."""
+    if not instrumentation.is_enabled():
+        print("Đo hiệu năng đang tắt (đặt config.INSTRUMENTATION_ENABLED = True).")
+        return
+    print(instrumentation.format_stats())
+    if config.INSTRUMENTATION_OUTPUT:
+        instrumentation.dump_json(config.INSTRUMENTATION_OUTPUT)
+        print(f"Đã ghi thống kê hiệu năng vào {config.INSTRUMENTATION_OUTPUT}")
+
+def move_shelf_from_input():
+    """Hỏi kệ cần di chuyển và vị trí mới (góc trên trái, ô lưới) từ terminal."""
+    shelves = current_store_layout.shelves
+    for i, shelf in enumerate(shelves):
+        print(f"{i+1}. {shelf['name']} tại ({shelf['r']}, {shelf['c']}), kích thước {shelf['rows']}x{shelf['cols']}")
+    try:
+        shelf_index = int(input("Số TT kệ cần di chuyển: ")) - 1
+        new_row, new_col = (int(part) for part in input("Vị trí mới 'hàng,cột': ").split(','))
+    except ValueError:
+        print("Dữ liệu không hợp lệ.")
+        return
+    if not 0 <= shelf_index < len(shelves):
+        print("Lựa chọn không hợp lệ.")
+        return
+    try:
+        apply_layout_edit('move', shelves[shelf_index]['name'], new_row, new_col)
+    except ValueError as e:
+        print(f"Không thể di chuyển kệ: {e}")
+        return
+    print("Click lại vào bản đồ để đặt xe đẩy.")
+
+def handle_shopping_list(selected_item_names, estimated_pos_float, actual_cart_pos_grid):
+    """Lập lộ trình qua nhiều món hàng (thứ tự tối ưu) rồi mô phỏng di chuyển."""
+    global current_route_optimizer
+    start_node_for_path = (round(estimated_pos_float[0]), round(estimated_pos_float[1]))
+    if current_grid_map_data[start_node_for_path[0], start_node_for_path[1]] == config.CELL_TYPE_SHELF:
+        print(f"Cảnh báo: Điểm bắt đầu tìm đường {start_node_for_path} là kệ. Dùng vị trí thực tế.")
+        start_node_for_path = actual_cart_pos_grid
+
+    if current_route_optimizer is None:
+        current_route_optimizer = route_optimizer.ShoppingRouteOptimizer(
+            current_item_locations_dict, current_item_distance_fields
+        )
+    route = current_route_optimizer.plan(start_node_for_path, selected_item_names)
+    for item_name in route['skipped_items']:
+        print(f"Bỏ qua '{item_name}': không có điểm tiếp cận tới được.")
+    if not route['order']:
+        print("Không có món hàng nào để lập lộ trình.")
+        return
+
+    print(f"Thứ tự ghé thăm: {' -> '.join(route['order'])}")
+    print(f"Độ dài lộ trình: {route['length_m']:.1f}m ({route['method']}, "
+          f"{route['solve_time_s'] * 1000:.1f} ms)")
+    current_interactive_plot_obj.target_item_name = ', '.join(route['order'])
+    current_interactive_plot_obj.target_item_pos_grid = route['access_points'][-1]
+    path_nodes = route['path']
+    if current_blocked_cells or config.DYNAMIC_OBSTACLE_DEMO:
+        path_nodes = travel_with_replanning(start_node_for_path, route['access_points'])
+        if path_nodes is None:
+            return
+    current_interactive_plot_obj.current_path_nodes = path_nodes
+    current_interactive_plot_obj.update_plot_elements()
+    simulate_cart_movement(path_nodes, actual_cart_pos_grid)
+
+def toggle_blocked_cells_from_input():
+    """Chặn (hoặc mở lại nếu đã chặn hết) một ô vuông lối đi 'hàng,cột[,bán kính]' nhập từ terminal."""
+    try:
+        parts = [int(part) for part in input("Ô cần chặn/mở 'hàng,cột[,bán kính]': ").split(',')]
+        center, radius = (parts[0], parts[1]), parts[2] if len(parts) > 2 else config.DYNAMIC_OBSTACLE_RADIUS_CELLS
+    except (ValueError, IndexError):
+        print("Dữ liệu không hợp lệ.")
+        return
+    num_rows, num_cols = current_grid_map_data.shape
+    cells = {cell for cell in incremental_planner.cells_around(center, max(0, radius))
+             if 0 <= cell[0] < num_rows and 0 <= cell[1] < num_cols
+             and current_grid_map_data[cell] == config.CELL_TYPE_PATH}
+    if cells and cells <= current_blocked_cells:
+        current_blocked_cells.difference_update(cells)
+        print(f"Đã mở lại {len(cells)} ô; còn {len(current_blocked_cells)} ô bị chặn.")
+    else:
+        current_blocked_cells.update(cells)
+        print(f"Đã chặn {len(cells)} ô lối đi; tổng {len(current_blocked_cells)} ô bị chặn.")
+
+def travel_with_replanning(start_node, waypoints):
+    """
+    Đi lần lượt tới từng điểm trong waypoints, mỗi chặng một DStarLitePlanner tránh các ô trong
+    current_blocked_cells. Với config.DYNAMIC_OBSTACLE_DEMO, lối đi phía trước xe bị chặn ở giữa
+    chặng đầu và lộ trình được sửa tăng dần từ vị trí hiện tại.
+    Trả về các ô xe đã đi qua, hoặc None nếu một chặng không tới được.
+    """
+    travelled = [tuple(start_node)]
+    demo_pending = config.DYNAMIC_OBSTACLE_DEMO
+    for waypoint in waypoints:
+        planner = incremental_planner.DStarLitePlanner(current_grid_map_data, travelled[-1], waypoint)
+        planner.block_cells(current_blocked_cells)
+        start_time = time.perf_counter()
+        path = planner.plan()
+        print(f"Chặng tới {waypoint}: lập kế hoạch {planner.last_expanded} nút mở rộng, "
+              f"{(time.perf_counter() - start_time) * 1000:.1f} ms")
+        if path is None:
+            print(f"Không tìm thấy đường đi tới {waypoint} khi tránh {len(current_blocked_cells)} ô bị chặn.")
+            return None
+        leg_length = len(path)
+        while len(path) > 1:
+            if demo_pending and len(path) <= leg_length // 2 + 1 \
+               and len(path) > config.DYNAMIC_OBSTACLE_LOOKAHEAD_CELLS + 1:
+                demo_pending = False
+                ahead = path[config.DYNAMIC_OBSTACLE_LOOKAHEAD_CELLS]
+                obstacle = [cell for cell in incremental_planner.cells_around(
+                                ahead, config.DYNAMIC_OBSTACLE_RADIUS_CELLS)
+                            if cell not in (path[0], tuple(waypoint))]
+                num_blocked = planner.block_cells(obstacle)
+                start_time = time.perf_counter()
+                path = planner.plan(path[0])
+                print(f"Lối đi phía trước bị chặn quanh {ahead} ({num_blocked} ô): sửa lộ trình sau "
+                      f"{planner.last_expanded} nút mở rộng, {(time.perf_counter() - start_time) * 1000:.1f} ms")
+                if path is None:
+                    print(f"Không còn đường đi tới {waypoint}.")
+                    return None
+                continue
+            path = path[1:]
+            travelled.append(path[0])
+    return travelled
+
 def simulate_cart_movement(path_nodes, initial_actual_cart_pos):
     global current_interactive_plot_obj, current_grid_map_data, current_access_points_list, current_rssi_fingerprints_map
+    global current_shelf_crossing_maps, current_mean_rssi_grid
 
     if not path_nodes or current_interactive_plot_obj is None:
         return
@@ -133,18 +370,46 @@ def simulate_cart_movement(path_nodes, initial_actual_cart_pos):
     print("\nBắt đầu mô phỏng di chuyển xe đẩy...")
     current_interactive_plot_obj.current_path_nodes = path_nodes # Hiển thị toàn bộ đường đi
 
-    for i, step_pos_grid in enumerate(path_nodes):
-        current_interactive_plot_obj.cart_actual_pos_grid = step_pos_grid
-
-        observed_rssi_at_step = rssi_simulation.get_observed_rssi_at_cart(
-            step_pos_grid, current_grid_map_data, current_access_points_list
+    # Mô phỏng quan sát cho toàn bộ đường đi rồi định vị trong một lần gọi theo lô
+    observed_rssi_along_path = np.array([
+        rssi_simulation.get_observed_rssi_at_cart(
+            step_pos_grid, current_grid_map_data, current_access_points_list, current_shelf_crossing_maps
+        )
+        for step_pos_grid in path_nodes
+    ])
+    if config.MOVEMENT_LOCALIZER == 'particle_filter':
+        # Bộ lọc hạt trên RSSI trung bình của mô hình, tính một lần cho mỗi bản đồ
+        if current_mean_rssi_grid is None:
+            current_mean_rssi_grid = rssi_simulation.compute_mean_rssi_grid(
+                current_grid_map_data, current_access_points_list, current_shelf_crossing_maps
+            )
+        cart_filter = particle_filter.ParticleFilterLocalizer(
+            current_grid_map_data, current_access_points_list, mean_rssi_grid=current_mean_rssi_grid
         )
-        estimated_pos_at_step = localization_algorithms.predict_location_knn(
-            observed_rssi_at_step, current_rssi_fingerprints_map,
-            config.K_NEIGHBORS, config.USE_WEIGHTED_KNN, config.EPSILON_WEIGHT
+        estimated_positions = np.array([cart_filter.update(observed_rssi) for observed_rssi in observed_rssi_along_path])
+    elif config.MOVEMENT_LOCALIZER == 'tracker':
+        # Định vị tuần tự: tìm trong cửa sổ quanh ước tính trước và làm mượt bằng Kalman
+        cart_tracker = temporal_tracker.TemporalKNNTracker(current_rssi_fingerprints_map)
+        estimated_positions = np.array([
+            localization_algorithms.predict_location_knn(
+                observed_rssi, current_rssi_fingerprints_map,
+                config.K_NEIGHBORS, config.USE_WEIGHTED_KNN, config.EPSILON_WEIGHT,
+                tracker=cart_tracker
+            ) or (np.nan, np.nan)
+            for observed_rssi in observed_rssi_along_path
+        ])
+    else:
+        estimated_positions = localization_algorithms.predict_location_knn_batch(
+            observed_rssi_along_path, current_rssi_fingerprints_map,
+            config.K_NEIGHBORS, config.USE_WEIGHTED_KNN, config.EPSILON_WEIGHT,
+            approx_epsilon=config.KNN_APPROX_EPSILON
         )
 
-        if estimated_pos_at_step:
+    for i, step_pos_grid in enumerate(path_nodes):
+        current_interactive_plot_obj.cart_actual_pos_grid = step_pos_grid
+
+        if not np.isnan(estimated_positions[i]).any():
+            estimated_pos_at_step = (float(estimated_positions[i, 0]), float(estimated_positions[i, 1]))
             current_interactive_plot_obj.cart_estimated_pos_float = estimated_pos_at_step
             error_m_at_step = rssi_simulation.euclidean_distance_m(step_pos_grid, estimated_pos_at_step)
             current_interactive_plot_obj.error_m = error_m_at_step
@@ -163,6 +428,8 @@ def simulate_cart_movement(path_nodes, initial_actual_cart_pos):
 def run_simulation():
     global current_interactive_plot_obj, current_grid_map_data, current_access_points_list
     global current_rssi_fingerprints_map, current_item_locations_dict, current_map_num_rows, current_map_num_cols
+    global current_shelf_crossing_maps, current_path_planner, current_item_distance_fields
+    global current_route_optimizer, current_mean_rssi_grid, current_store_layout
 
     current_grid_map_data, current_map_num_rows, current_map_num_cols = map_utils.create_base_map()
 
@@ -191,16 +458,55 @@ def run_simulation():
             current_grid_map_data, shelf['r'], shelf['c'], shelf['rows'], shelf['cols']
         )
 
-    current_access_points_list = map_utils.define_access_points(current_map_num_rows, current_map_num_cols)
+    current_path_planner = path_planning.GridPlanner(current_grid_map_data)
+    if config.ACCESS_POINT_LAYOUT == 'optimized':
+        print(f"Đang tối ưu vị trí {config.AP_BUDGET} AP...")
+        placement = ap_placement.load_or_optimize_access_points(current_grid_map_data)
+        current_access_points_list = placement['access_points']
+        print(f"Vị trí AP: {current_access_points_list}, sai số mô phỏng {placement['error_m']:.2f}m "
+              f"(4 góc: {placement['baseline_error_m']:.2f}m, giảm {placement['improvement_pct']:.1f}%)"
+              f"{' (từ cache)' if placement['from_cache'] else ''}")
+    else:
+        current_access_points_list = map_utils.define_access_points(current_map_num_rows, current_map_num_cols)
     current_item_locations_dict = map_utils.define_item_locations(
         current_grid_map_data, current_map_num_rows, current_map_num_cols, shelves_layout
     )
 
-    print("Đang tạo bản đồ RSSI fingerprints...")
-    current_rssi_fingerprints_map = rssi_simulation.generate_rssi_fingerprints(
-        current_grid_map_data, current_access_points_list, current_map_num_rows, current_map_num_cols
+    print("Đang tính trường khoảng cách cho các điểm tiếp cận món hàng...")
+    current_item_distance_fields = map_cache.load_or_build_distance_fields(
+        current_grid_map_data,
+        list(dict.fromkeys(spot for spots in current_item_locations_dict.values() for spot in spots))
+    )
+    current_route_optimizer = route_optimizer.ShoppingRouteOptimizer(
+        current_item_locations_dict, current_item_distance_fields
+    )
+
+    print("Đang tạo bản đồ RSSI fingerprints (hoặc tải từ cache)...")
+    current_rssi_fingerprints_map, current_shelf_crossing_maps = map_cache.load_or_build_fingerprints(
+        current_grid_map_data, current_access_points_list
     )
     print("Hoàn thành tạo bản đồ RSSI fingerprints.")
+    current_mean_rssi_grid = None # Bộ lọc hạt tính lại khi cần
+    current_store_layout = layout_editor.StoreLayout(
+        current_grid_map_data, current_access_points_list, shelves_layout,
+        fingerprints=current_rssi_fingerprints_map, shelf_crossing_maps=current_shelf_crossing_maps,
+        distance_fields=current_item_distance_fields, planner=current_path_planner
+    )
+    current_shelf_crossing_maps = current_store_layout.shelf_crossing_maps
+    if config.KNN_USE_INDEX:
+        index_stats = current_rssi_fingerprints_map.build_index()
+        print(f"Đã xây chỉ mục KD-tree: {index_stats['num_points']} điểm, "
+              f"{index_stats['build_time_s'] * 1000:.1f} ms, {index_stats['size_bytes'] / 1024:.1f} KB")
+    if config.KNN_STRONGEST_AP_INDEX:
+        index_stats = current_rssi_fingerprints_map.build_strongest_ap_index()
+        print(f"Đã xây chỉ mục {index_stats['top_n']} AP mạnh nhất: "
+              f"{index_stats['mean_postings_per_ap']:.0f} fingerprint/AP, "
+              f"{index_stats['build_time_s'] * 1000:.1f} ms, {index_stats['size_bytes'] / 1024:.1f} KB")
+    print("Bộ nhớ theo thành phần: " + walkable_index.format_memory_report(walkable_index.memory_report(
+        grid=current_grid_map_data, fingerprints=current_rssi_fingerprints_map,
+        shelf_crossings=current_shelf_crossing_maps, planner=current_path_planner,
+        distance_fields=current_item_distance_fields
+    )))
 
     print("\nBản đồ đã sẵn sàng. Click vào một ô lối đi để đặt xe đẩy.")
     print("Sau khi click, kiểm tra terminal để nhập món hàng cần tìm.")
@@ -216,6 +522,8 @@ def run_simulation():
     )
     plt.show()
 
+    if instrumentation.is_enabled():
+        print_instrumentation_stats()
     print("Chương trình mô phỏng kết thúc.")
 
 if __name__ == "__main__":
@@ -0,0 +1,171 @@
+# map_cache.py
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import config
+import rssi_simulation
+import parallel_fingerprints
+from fingerprint_db import FingerprintDB, build_fingerprint_db
+from distance_fields import DistanceFields
+from walkable_index import WalkableIndex
+
+CACHE_FORMAT_VERSION = 2 # Tăng khi định dạng lưu trữ thay đổi để vô hiệu hóa cache cũ
+_META_FILE = 'meta.json'
+
+# Các tham số config ảnh hưởng đến fingerprint, nằm trong khóa cache
+_FINGERPRINT_CONFIG_KEYS = (
+    'P_TX_MAX_RSSI', 'PATH_LOSS_EXPONENT_N', 'SHELF_ATTENUATION_DB',
+    'NOISE_STD_DEV_DB', 'MIN_RSSI_THRESHOLD', 'GRID_RESOLUTION_M',
+    'CELL_TYPE_PATH', 'CELL_TYPE_SHELF', 'FINGERPRINT_ENGINE', 'FINGERPRINT_TILE_ROWS',
+)
+
+def _hash_grid(hasher, grid_map):
+    grid_map = np.ascontiguousarray(grid_map)
+    hasher.update(f"{grid_map.shape}|{grid_map.dtype.str}|".encode())
+    hasher.update(grid_map.tobytes())
+
+def make_cache_key(kind, grid_map, extra=None):
+    """
+    Tạo khóa cache (chuỗi hex SHA-256) từ loại artifact, nội dung bản đồ lưới
+    (None nếu artifact không gắn với một bản đồ) và các tham số bổ sung (phải tuần tự hóa được bằng JSON).
+    """
+    hasher = hashlib.sha256()
+    hasher.update(f"{kind}|v{CACHE_FORMAT_VERSION}|".encode())
+    if grid_map is not None:
+        _hash_grid(hasher, grid_map)
+    hasher.update(json.dumps(extra, sort_keys=True, default=str).encode())
+    return hasher.hexdigest()
+
+def fingerprint_cache_key(grid_map, access_points, seed):
+    """Khóa cache cho fingerprint: bản đồ, danh sách AP, tham số vô tuyến trong config và seed."""
+    extra = {
+        'access_points': [[int(r), int(c)] for r, c in access_points],
+        'config': {name: getattr(config, name) for name in _FINGERPRINT_CONFIG_KEYS},
+        'seed': seed,
+    }
+    return make_cache_key('fingerprints', grid_map, extra)
+
+def _entry_dir(cache_dir, kind, key):
+    return os.path.join(cache_dir, f"{kind}-{key}")
+
+def load_entry(kind, key, cache_dir=None, mmap_mode='r'):
+    """
+    Mở một mục cache; trả về dict tên -> mảng (memory-mapped, dùng chung trang
+    giữa các tiến trình) hoặc None nếu chưa có hay bị hỏng (mục hỏng sẽ bị xóa).
+    """
+    entry_dir = _entry_dir(cache_dir or config.CACHE_DIR, kind, key)
+    meta_path = os.path.join(entry_dir, _META_FILE)
+    if not os.path.isfile(meta_path):
+        return None
+    try:
+        with open(meta_path, encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+        if meta.get('key') != key or meta.get('version') != CACHE_FORMAT_VERSION:
+            raise ValueError("metadata không khớp")
+        arrays = {name: np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in meta['arrays']}
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Cảnh báo: Mục cache {entry_dir} không hợp lệ ({e}), sẽ tạo lại.")
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        return None
+    os.utime(meta_path) # Đánh dấu vừa dùng cho việc dọn dẹp LRU
+    return arrays
+
+def store_entry(kind, key, arrays, cache_dir=None):
+    """
+    Ghi một mục cache (mỗi mảng một tệp .npy) một cách nguyên tử: ghi vào thư mục
+    tạm rồi đổi tên, để tiến trình khác không bao giờ thấy mục ghi dở.
+    """
+    cache_dir = cache_dir or config.CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    entry_dir = _entry_dir(cache_dir, kind, key)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{kind}-", dir=cache_dir)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(array))
+        meta = {'key': key, 'kind': kind, 'version': CACHE_FORMAT_VERSION,
+                'arrays': sorted(arrays), 'created': time.time()}
+        with open(os.path.join(tmp_dir, _META_FILE), 'w', encoding='utf-8') as meta_file:
+            json.dump(meta, meta_file)
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError: # Tiến trình khác đã ghi cùng mục trước
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    prune_cache(kind, cache_dir)
+
+def prune_cache(kind, cache_dir=None, max_entries=None):
+    """Xóa các mục cũ nhất của một loại artifact, chỉ giữ lại max_entries mục dùng gần nhất."""
+    cache_dir = cache_dir or config.CACHE_DIR
+    max_entries = max_entries or config.CACHE_MAX_ENTRIES
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    for name in os.listdir(cache_dir):
+        meta_path = os.path.join(cache_dir, name, _META_FILE)
+        if name.startswith(f"{kind}-") and os.path.isfile(meta_path):
+            entries.append((os.path.getmtime(meta_path), name))
+    entries.sort(reverse=True)
+    for _, name in entries[max_entries:]:
+        shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+def load_or_build_fingerprints(grid_map, access_points, seed=None, cache_dir=None):
+    """
+    Trả về (FingerprintDB, shelf_crossing_maps) từ cache trên đĩa nếu có, ngược lại
+    tạo mới và ghi vào cache. Cache luôn giữ RSSI float64 gốc (độc lập với config.FINGERPRINT_STORAGE);
+    việc lượng tử hóa chỉ áp dụng cho bản trả về. Khi seed là None hoặc engine là 'loop' (nhiễu rút từ
+    np.random toàn cục, không theo seed) thì kết quả không tái lập được nên không dùng cache.
+    """
+    seed = config.RANDOM_SEED if seed is None else seed
+    use_cache = config.CACHE_ENABLED and seed is not None and config.FINGERPRINT_ENGINE != 'loop'
+    if use_cache:
+        key = fingerprint_cache_key(grid_map, access_points, seed)
+        arrays = load_entry('fingerprints', key, cache_dir)
+        if arrays is not None:
+            cell_index = WalkableIndex.from_cells(arrays['positions'], grid_map.shape)
+            return FingerprintDB(cell_index.cells, arrays['rssi'], cell_index), arrays['shelf_crossings']
+
+    if config.FINGERPRINT_ENGINE == 'parallel':
+        # Bản đồ số ô kệ bị cắt cũng được tính theo tile trong các worker
+        rssi_grid, shelf_crossing_maps = parallel_fingerprints.generate_rssi_fingerprint_array_parallel(
+            grid_map, access_points, seed)
+        fingerprints = FingerprintDB.from_rssi_grid(rssi_grid, storage='float64')
+    else:
+        shelf_crossing_maps = rssi_simulation.compute_shelf_crossing_maps(grid_map, access_points)
+        fingerprints = build_fingerprint_db(grid_map, access_points, seed, shelf_crossing_maps, storage='float64')
+    if use_cache:
+        store_entry('fingerprints', key, {
+            'positions': fingerprints.positions,
+            'rssi': fingerprints.rssi,
+            'shelf_crossings': shelf_crossing_maps,
+        }, cache_dir)
+    return fingerprints.with_storage(), shelf_crossing_maps
+
+def load_or_build_distance_fields(grid_map, targets, cache_dir=None):
+    """Trả về DistanceFields cho các ô đích từ cache trên đĩa nếu có, ngược lại tạo mới và ghi vào cache."""
+    targets = [tuple(int(v) for v in target) for target in targets]
+    key = make_cache_key('distance_fields', grid_map, {
+        'targets': targets,
+        'scale': config.DISTANCE_FIELD_SCALE,
+        'config': {name: getattr(config, name) for name in ('CELL_TYPE_PATH',)},
+    })
+    if config.CACHE_ENABLED:
+        arrays = load_entry('distance_fields', key, cache_dir)
+        if arrays is not None:
+            return DistanceFields(targets, arrays['distances'], arrays['directions'], float(arrays['scale'][0]),
+                                  grid_map)
+
+    fields = DistanceFields.build(grid_map, targets)
+    if config.CACHE_ENABLED:
+        store_entry('distance_fields', key, {
+            'distances': fields.distances,
+            'directions': fields.directions,
+            'scale': np.array([fields.scale]),
+        }, cache_dir)
+    return fields
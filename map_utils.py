@@ -2,11 +2,11 @@
 import numpy as np
 import config
 
-def create_base_map():
-    """Tạo bản đồ lưới cơ sở với kích thước đã định nghĩa."""
-    num_cols = int(config.SUPERMARKET_WIDTH_M / config.GRID_RESOLUTION_M)
-    num_rows = int(config.SUPERMARKET_HEIGHT_M / config.GRID_RESOLUTION_M)
-    grid_map = np.full((num_rows, num_cols), config.CELL_TYPE_PATH, dtype=int) # Mặc định là lối đi
+def create_base_map(width_m=None, height_m=None):
+    """Tạo bản đồ lưới cơ sở với kích thước đã định nghĩa (mặc định kích thước siêu thị trong config)."""
+    num_cols = int((width_m or config.SUPERMARKET_WIDTH_M) / config.GRID_RESOLUTION_M)
+    num_rows = int((height_m or config.SUPERMARKET_HEIGHT_M) / config.GRID_RESOLUTION_M)
+    grid_map = np.full((num_rows, num_cols), config.CELL_TYPE_PATH, dtype=np.uint8) # Mặc định là lối đi, 1 byte mỗi ô
     return grid_map, num_rows, num_cols
 
 def add_shelf(grid_map, row_start, col_start, num_shelf_rows, num_shelf_cols):
@@ -28,6 +28,96 @@ def define_access_points(num_rows, num_cols):
     ]
     return access_points
 
+# Các cạnh của kệ theo thứ tự xét ứng viên, và offset từ ô kệ sang ô lối đi kề cạnh đó
+ACCESS_SIDES = ('top', 'bottom', 'left', 'right')
+_SIDE_OFFSETS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+def _first_per_group(groups, keys):
+    """Chỉ số phần tử nhỏ nhất theo (keys...) trong mỗi nhóm; trả về (nhóm, chỉ số)."""
+    order = np.lexsort(tuple(reversed(keys)) + (groups,))
+    unique_groups, first = np.unique(groups[order], return_index=True)
+    return unique_groups, order[first]
+
+def compute_shelf_access_spots(grid_map, shelves_layout_info):
+    """
+    Tính điểm tiếp cận cho mọi kệ trong một lần bằng phép toán mảng (thay vì duyệt từng ô kệ).
+    Ứng viên của cạnh k là các ô lối đi kề ô kệ theo offset của cạnh đó.
+    Trả về (side_spots, fallback_spots), ô (hàng, cột) hoặc -1 nếu không có:
+    - side_spots: (số kệ, 4, 2), ứng viên cạnh ACCESS_SIDES[k] gần trung bình các ứng viên cạnh đó nhất;
+    - fallback_spots: (số kệ, 2), ứng viên (mọi cạnh) gần tâm kệ nhất.
+    Hòa nhau thì lấy ứng viên đứng trước theo thứ tự ô kệ (hàng rồi cột), rồi thứ tự cạnh.
+    """
+    num_rows_map, num_cols_map = grid_map.shape
+    num_shelves = len(shelves_layout_info)
+    side_spots = np.full((num_shelves, len(ACCESS_SIDES), 2), -1, dtype=np.int64)
+    fallback_spots = np.full((num_shelves, 2), -1, dtype=np.int64)
+    if num_shelves == 0:
+        return side_spots, fallback_spots
+
+    shelf_r, shelf_c, shelf_num_r, shelf_num_c = (np.array([shelf[key] for shelf in shelves_layout_info], dtype=np.int64)
+                                                  for key in ('r', 'c', 'rows', 'cols'))
+    row_start, col_start = np.maximum(shelf_r, 0), np.maximum(shelf_c, 0)
+    height = np.maximum(np.minimum(shelf_r + shelf_num_r, num_rows_map) - row_start, 0)
+    width = np.maximum(np.minimum(shelf_c + shelf_num_c, num_cols_map) - col_start, 0)
+
+    # Mọi ô trong hình chữ nhật của mọi kệ, theo thứ tự hàng rồi cột trong từng kệ
+    sizes = height * width
+    shelf_ids = np.repeat(np.arange(num_shelves), sizes)
+    local_idx = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    cell_r = row_start[shelf_ids] + local_idx // np.maximum(width[shelf_ids], 1)
+    cell_c = col_start[shelf_ids] + local_idx % np.maximum(width[shelf_ids], 1)
+    is_shelf = grid_map[cell_r, cell_c] == config.CELL_TYPE_SHELF
+    shelf_ids, local_idx, cell_r, cell_c = shelf_ids[is_shelf], local_idx[is_shelf], cell_r[is_shelf], cell_c[is_shelf]
+
+    cand_shelf, cand_side, cand_order, cand_r, cand_c = [], [], [], [], []
+    for side_idx, (dr, dc) in enumerate(_SIDE_OFFSETS):
+        neighbor_r, neighbor_c = cell_r + dr, cell_c + dc
+        inside = (neighbor_r >= 0) & (neighbor_r < num_rows_map) & (neighbor_c >= 0) & (neighbor_c < num_cols_map)
+        is_path = np.zeros(inside.shape, dtype=bool)
+        is_path[inside] = grid_map[neighbor_r[inside], neighbor_c[inside]] == config.CELL_TYPE_PATH
+        cand_shelf.append(shelf_ids[is_path])
+        cand_side.append(np.full(np.count_nonzero(is_path), side_idx))
+        cand_order.append(local_idx[is_path] * len(_SIDE_OFFSETS) + side_idx)
+        cand_r.append(neighbor_r[is_path])
+        cand_c.append(neighbor_c[is_path])
+    cand_shelf, cand_side, cand_order, cand_r, cand_c = (np.concatenate(parts) for parts in
+                                                         (cand_shelf, cand_side, cand_order, cand_r, cand_c))
+    if len(cand_shelf) == 0:
+        return side_spots, fallback_spots
+
+    # Theo cạnh: gần trung bình các ứng viên của (kệ, cạnh) nhất
+    group = cand_shelf * len(ACCESS_SIDES) + cand_side
+    num_groups = num_shelves * len(ACCESS_SIDES)
+    counts = np.bincount(group, minlength=num_groups)
+    avg_r = np.bincount(group, cand_r, num_groups)[group] / counts[group]
+    avg_c = np.bincount(group, cand_c, num_groups)[group] / counts[group]
+    groups, best = _first_per_group(group, ((cand_r - avg_r) ** 2 + (cand_c - avg_c) ** 2, cand_order))
+    side_spots.reshape(-1, 2)[groups] = np.column_stack((cand_r[best], cand_c[best]))
+
+    # Không theo cạnh: gần tâm kệ nhất
+    center_r = shelf_r[cand_shelf] + shelf_num_r[cand_shelf] / 2
+    center_c = shelf_c[cand_shelf] + shelf_num_c[cand_shelf] / 2
+    shelves, best = _first_per_group(cand_shelf, ((cand_r - center_r) ** 2 + (cand_c - center_c) ** 2, cand_order))
+    fallback_spots[shelves] = np.column_stack((cand_r[best], cand_c[best]))
+    return side_spots, fallback_spots
+
+def select_access_spot(side_spots, fallback_spot, preferred_side=None):
+    """
+    Chọn điểm tiếp cận của một kệ từ kết quả compute_shelf_access_spots.
+    preferred_side: một cạnh hoặc danh sách cạnh theo thứ tự ưu tiên; cạnh đầu tiên có ứng viên
+    được dùng, không cạnh nào có thì lấy ô gần tâm kệ nhất. None nếu kệ không có ứng viên.
+    """
+    if preferred_side:
+        sides_to_check = [preferred_side] if isinstance(preferred_side, str) else preferred_side
+        for p_side in sides_to_check:
+            if p_side in ACCESS_SIDES:
+                spot_r, spot_c = side_spots[ACCESS_SIDES.index(p_side)]
+                if spot_r >= 0:
+                    return (int(spot_r), int(spot_c))
+    if fallback_spot[0] < 0:
+        return None
+    return (int(fallback_spot[0]), int(fallback_spot[1]))
+
 def find_accessible_spot_near_shelf(grid_map, shelf_r, shelf_c, shelf_num_rows, shelf_num_cols, preferred_side=None):
     """
     Tìm một ô lối đi gần nhất với một kệ hàng cụ thể.
@@ -35,67 +125,22 @@ def find_accessible_spot_near_shelf(grid_map, shelf_r, shelf_c, shelf_num_rows,
     shelf_num_rows, shelf_num_cols: Kích thước của kệ.
     preferred_side: 'left', 'right', 'top', 'bottom'
     """
-    num_rows_map, num_cols_map = grid_map.shape
-    candidate_spots = []
-
-    shelf_cells = []
-    for r_offset in range(shelf_num_rows):
-        for c_offset in range(shelf_num_cols):
-            r, c = shelf_r + r_offset, shelf_c + c_offset
-            if 0 <= r < num_rows_map and 0 <= c < num_cols_map:
-                 if grid_map[r,c] == config.CELL_TYPE_SHELF:
-                    shelf_cells.append((r,c))
-
-    if not shelf_cells:
-        # print(f"Cảnh báo: Không có ô kệ nào được tìm thấy tại ({shelf_r},{shelf_c}) với kích thước ({shelf_num_rows},{shelf_num_cols}) để tìm điểm tiếp cận.")
-        return None
-
-    for r_sh, c_sh in shelf_cells:
-        potential_neighbors = [
-            (-1, 0, 'top'), (1, 0, 'bottom'),
-            (0, -1, 'left'), (0, 1, 'right')
-        ]
-        for dr, dc, side_name in potential_neighbors:
-            check_r, check_c = r_sh + dr, c_sh + dc
-            if 0 <= check_r < num_rows_map and 0 <= check_c < num_cols_map and \
-               grid_map[check_r, check_c] == config.CELL_TYPE_PATH:
-                candidate_spots.append(((check_r, check_c), side_name))
-
-    if not candidate_spots:
-        # print(f"Cảnh báo: Không tìm thấy ô lối đi trực tiếp gần kệ ({shelf_r},{shelf_c}).")
-        return None
-
-    if preferred_side:
-        sides_to_check = [preferred_side] if isinstance(preferred_side, str) else preferred_side
-        for p_side in sides_to_check:
-            preferred_spots_info = [spot_info for spot_info in candidate_spots if spot_info[1] == p_side]
-            if preferred_spots_info:
-                preferred_actual_spots = [spot for spot, side in preferred_spots_info]
-                avg_r = sum(r for r,c in preferred_actual_spots) / len(preferred_actual_spots)
-                avg_c = sum(c for r,c in preferred_actual_spots) / len(preferred_actual_spots)
-                best_spot = min(preferred_actual_spots, key=lambda spot: \
-                                     ((spot[0]-avg_r)**2 + (spot[1]-avg_c)**2) )
-                return best_spot
-
-    shelf_center_r = shelf_r + shelf_num_rows / 2
-    shelf_center_c = shelf_c + shelf_num_cols / 2
-    all_candidate_actual_spots = [spot for spot, side in candidate_spots]
-    best_overall_spot = min(all_candidate_actual_spots, key=lambda spot: \
-                             ((spot[0]-shelf_center_r)**2 + (spot[1]-shelf_center_c)**2) )
-    return best_overall_spot
+    side_spots, fallback_spots = compute_shelf_access_spots(
+        grid_map, [{'r': shelf_r, 'c': shelf_c, 'rows': shelf_num_rows, 'cols': shelf_num_cols}])
+    return select_access_spot(side_spots[0], fallback_spots[0], preferred_side)
 
 
 def define_item_locations(grid_map, num_rows, num_cols, shelves_layout_info): # Đổi tên tham số
     """
     Định nghĩa vị trí (ô lối đi có thể tiếp cận) cho các món hàng.
     shelves_layout_info: list of dicts, từ main.py
+    Điểm tiếp cận của mọi kệ được tính một lần (compute_shelf_access_spots), mỗi món chỉ còn chọn cạnh.
     """
     items_approachable_locations = {}
+    side_spots, fallback_spots = compute_shelf_access_spots(grid_map, shelves_layout_info)
+    side_spots, fallback_spots = side_spots.tolist(), fallback_spots.tolist() # Chọn theo từng món nhanh hơn trên list
 
-    for shelf_info in shelves_layout_info:
-        shelf_r, shelf_c = shelf_info['r'], shelf_info['c']
-        shelf_num_r, shelf_num_c = shelf_info['rows'], shelf_info['cols']
-
+    for shelf_idx, shelf_info in enumerate(shelves_layout_info):
         for item_detail in shelf_info['items_on_shelf']:
             item_name = item_detail['item_name']
             preferred_side = item_detail.get('preferred_side')
@@ -103,10 +148,7 @@ def define_item_locations(grid_map, num_rows, num_cols, shelves_layout_info): #
             if item_name not in items_approachable_locations:
                 items_approachable_locations[item_name] = []
 
-            # Tìm điểm tiếp cận cho toàn bộ kệ này dựa trên preferred_side
-            accessible_spot = find_accessible_spot_near_shelf(
-                grid_map, shelf_r, shelf_c, shelf_num_r, shelf_num_c, preferred_side
-            )
+            accessible_spot = select_access_spot(side_spots[shelf_idx], fallback_spots[shelf_idx], preferred_side)
 
             if accessible_spot:
                 if accessible_spot not in items_approachable_locations[item_name]:
@@ -117,9 +159,11 @@ def define_item_locations(grid_map, num_rows, num_cols, shelves_layout_info): #
     return items_approachable_locations
 
 
-def get_item_target_location(item_name, item_locations_dict, current_cart_pos_grid=None):
+def get_item_target_location(item_name, item_locations_dict, current_cart_pos_grid=None, distance_fields=None):
     """
     Lấy một vị trí (ô lưới) cho món hàng được yêu cầu từ danh sách các điểm tiếp cận.
+    distance_fields: DistanceFields của các điểm tiếp cận; nếu có thì chọn điểm gần nhất
+    theo độ dài đường đi thay vì khoảng cách đường thẳng.
     """
     if item_name in item_locations_dict and item_locations_dict[item_name]:
         possible_targets = item_locations_dict[item_name]
@@ -127,6 +171,12 @@ def get_item_target_location(item_name, item_locations_dict, current_cart_pos_gr
             # print(f"Cảnh báo: '{item_name}' có trong từ điển nhưng danh sách vị trí trống.")
             return None
 
+        if current_cart_pos_grid and len(possible_targets) > 1 and distance_fields is not None:
+            cart_cell = (round(current_cart_pos_grid[0]), round(current_cart_pos_grid[1]))
+            best_target = distance_fields.nearest_target(cart_cell, possible_targets)
+            if best_target is not None: # Ô xe đẩy không tới được đích nào thì dùng khoảng cách đường thẳng
+                return best_target
+
         if current_cart_pos_grid and len(possible_targets) > 1:
             best_target = min(possible_targets, key=lambda target_pos:
                               ((target_pos[0] - current_cart_pos_grid[0])**2 +
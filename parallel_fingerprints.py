@@ -0,0 +1,100 @@
+# parallel_fingerprints.py
+"""
+Tạo fingerprint RSSI song song cho sàn rất lớn: bản đồ được chia thành các dải hàng
+(tile) tính trong ProcessPoolExecutor. Bản đồ lưới và mảng kết quả nằm trong
+shared memory nên không phải pickle qua lại giữa các tiến trình.
+Mỗi tile có seed riêng suy ra từ (seed, chỉ số tile), nên kết quả chỉ phụ thuộc
+seed và kích thước tile, không phụ thuộc số worker.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import config
+import rssi_simulation
+
+def tile_ranges(num_rows, tile_rows=None):
+    """Các dải hàng (hàng đầu, hàng cuối) liên tiếp, mỗi dải tối đa tile_rows hàng."""
+    tile_rows = max(1, tile_rows or config.FINGERPRINT_TILE_ROWS)
+    return [(row_start, min(row_start + tile_rows, num_rows)) for row_start in range(0, num_rows, tile_rows)]
+
+def tile_rng(seed_entropy, tile_idx):
+    """Generator của một tile: nhánh tile_idx của SeedSequence(seed), không phụ thuộc thứ tự chạy."""
+    return np.random.default_rng(np.random.SeedSequence(seed_entropy, spawn_key=(tile_idx,)))
+
+def standard_noise_grid_tiled(shape, num_aps, seed=None, tile_rows=None):
+    """Nhiễu chuẩn N(0, 1) mà engine 'parallel' rút với cùng seed và kích thước tile: mảng (số AP, hàng, cột)."""
+    seed_entropy = np.random.SeedSequence(seed).entropy
+    noise = np.empty((num_aps,) + tuple(shape))
+    for tile_idx, (row_start, row_end) in enumerate(tile_ranges(shape[0], tile_rows)):
+        rng = tile_rng(seed_entropy, tile_idx)
+        for ap_idx in range(num_aps): # Cùng thứ tự rút như generate_rssi_rows
+            noise[ap_idx, row_start:row_end] = rng.standard_normal((row_end - row_start, shape[1]))
+    return noise
+
+def _create_shared(shape, dtype):
+    dtype = np.dtype(dtype)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+def _generate_tile(shared_specs, access_points, row_range, seed_entropy, tile_idx, crossings_ready):
+    """Chạy trong worker: gắn vào shared memory, tính một dải hàng và ghi thẳng vào mảng kết quả."""
+    handles, arrays = [], {}
+    try:
+        for name, (shm_name, shape, dtype) in shared_specs.items():
+            shm = shared_memory.SharedMemory(name=shm_name)
+            handles.append(shm)
+            arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        row_start, row_end = row_range
+        grid_map = arrays['grid']
+        if not crossings_ready:
+            arrays['crossings'][:, row_start:row_end] = rssi_simulation.compute_shelf_crossing_maps(
+                grid_map, access_points, row_range)
+        arrays['rssi'][row_start:row_end] = rssi_simulation.generate_rssi_rows(
+            grid_map, access_points, tile_rng(seed_entropy, tile_idx),
+            arrays['crossings'][:, row_start:row_end], row_range)
+        del grid_map
+        arrays.clear() # Bỏ tham chiếu đến bộ đệm trước khi đóng shared memory
+    finally:
+        for shm in handles:
+            shm.close()
+    return tile_idx
+
+def generate_rssi_fingerprint_array_parallel(grid_map, access_points, seed=None, shelf_crossing_maps=None,
+                                             workers=None, tile_rows=None):
+    """
+    Tạo mảng RSSI (hàng, cột, số AP) theo tile song song, cùng định dạng với
+    generate_rssi_fingerprint_array. Trả về (rssi, shelf_crossing_maps).
+    workers: số tiến trình (mặc định config.FINGERPRINT_WORKERS, None = số lõi CPU);
+    workers=1 chạy các tile tuần tự trong tiến trình hiện tại, cho kết quả giống hệt.
+    """
+    workers = workers or config.FINGERPRINT_WORKERS or os.cpu_count() or 1
+    seed_entropy = np.random.SeedSequence(seed).entropy
+    num_rows, num_cols = grid_map.shape
+    tiles = tile_ranges(num_rows, tile_rows)
+
+    shared = {}
+    try:
+        shared['grid'] = _create_shared(grid_map.shape, grid_map.dtype)
+        shared['crossings'] = _create_shared((len(access_points), num_rows, num_cols), np.int32)
+        shared['rssi'] = _create_shared((num_rows, num_cols, len(access_points)), np.float64)
+        shared['grid'][1][:] = grid_map
+        crossings_ready = shelf_crossing_maps is not None
+        if crossings_ready:
+            shared['crossings'][1][:] = shelf_crossing_maps
+        shared_specs = {name: (shm.name, array.shape, array.dtype.str) for name, (shm, array) in shared.items()}
+
+        tile_args = [(shared_specs, access_points, row_range, seed_entropy, tile_idx, crossings_ready)
+                     for tile_idx, row_range in enumerate(tiles)]
+        if workers == 1 or len(tiles) == 1:
+            for args in tile_args:
+                _generate_tile(*args)
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tiles))) as executor:
+                list(executor.map(_generate_tile, *zip(*tile_args)))
+        return shared['rssi'][1].copy(), shared['crossings'][1].copy()
+    finally:
+        for name in list(shared):
+            shm = shared.pop(name)[0] # Bỏ view ndarray trước khi đóng bộ đệm
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,105 @@
+# particle_filter.py
+import numpy as np
+import config
+import instrumentation
+import rssi_simulation
+
+class ParticleFilterLocalizer:
+    """
+    Bộ lọc hạt định vị một xe đẩy, toàn bộ bằng mảng NumPy.
+    - Chuyển động: bước ngẫu nhiên Gaussian, hạt rơi vào kệ hoặc ra ngoài bản đồ
+      giữ nguyên vị trí cũ, nên hạt luôn nằm trên ô CELL_TYPE_PATH.
+    - Likelihood: Gaussian với độ lệch chuẩn NOISE_STD_DEV_DB quanh RSSI trung bình
+      của mô hình (compute_mean_rssi_grid). Giá trị quan sát ở MIN_RSSI_THRESHOLD
+      được coi là bị kẹp: hạt dự đoán dưới ngưỡng không bị phạt.
+    - Lấy mẫu lại kiểu systematic khi số hạt hiệu dụng xuống thấp.
+    """
+    def __init__(self, grid_map, access_points, shelf_crossing_maps=None, num_particles=None,
+                 seed=None, mean_rssi_grid=None):
+        self.grid_map = grid_map
+        self.walkable = grid_map == config.CELL_TYPE_PATH
+        self.walkable_cells = np.argwhere(self.walkable)
+        # Bản đồ đi được có viền False, tra cứu phẳng không cần kiểm tra biên
+        padded = np.zeros((grid_map.shape[0] + 2, grid_map.shape[1] + 2), dtype=bool)
+        padded[1:-1, 1:-1] = self.walkable
+        self.padded_walkable = padded.ravel()
+        self.padded_cols = grid_map.shape[1] + 2
+        self.num_particles = num_particles or config.PF_NUM_PARTICLES
+        self.rng = np.random.default_rng(seed)
+        if mean_rssi_grid is None:
+            mean_rssi_grid = rssi_simulation.compute_mean_rssi_grid(grid_map, access_points, shelf_crossing_maps)
+        self.mean_rssi_grid = mean_rssi_grid.astype(np.float32)
+        self.motion_std_cells = config.PF_MOTION_STD_M / config.GRID_RESOLUTION_M
+        self.particles = None
+        self.log_weights = None
+        self.reset()
+
+    def reset(self, center=None, spread_cells=None):
+        """Khởi tạo hạt đều trên mọi ô lối đi, hoặc quanh center nếu được cho."""
+        if center is None:
+            picks = self.rng.integers(len(self.walkable_cells), size=self.num_particles)
+            self.particles = self.walkable_cells[picks].astype(np.float64)
+        else:
+            spread_cells = spread_cells or self.motion_std_cells
+            self.particles = np.tile(np.asarray(center, dtype=np.float64), (self.num_particles, 1))
+            self._move(spread_cells)
+        self.log_weights = np.full(self.num_particles, -np.log(self.num_particles))
+
+    def _cells(self, positions):
+        """Ô (hàng, cột) của các vị trí; hạt luôn nằm trong bản đồ nên chỉ cần làm tròn."""
+        return np.rint(positions).astype(np.int64)
+
+    def _move(self, step_std_cells):
+        proposed = self.particles + self.rng.normal(0.0, step_std_cells, size=self.particles.shape)
+        # Kẹp vào viền (ô không đi được) để tra cứu trong bản đồ có viền
+        cell_r = np.clip(np.rint(proposed[:, 0]).astype(np.int64), -1, self.grid_map.shape[0]) + 1
+        cell_c = np.clip(np.rint(proposed[:, 1]).astype(np.int64), -1, self.grid_map.shape[1]) + 1
+        valid = self.padded_walkable[cell_r * self.padded_cols + cell_c]
+        self.particles = np.where(valid[:, None], proposed, self.particles)
+
+    def _log_likelihood(self, observed_rssi):
+        cells = self._cells(self.particles)
+        expected = self.mean_rssi_grid[cells[:, 0], cells[:, 1]] # (số hạt, số AP)
+        observed = np.asarray(observed_rssi, dtype=np.float32)
+        censored = observed <= config.MIN_RSSI_THRESHOLD
+        # Kênh bị kẹp ở ngưỡng: chỉ phạt khi mô hình dự đoán tín hiệu mạnh hơn ngưỡng
+        expected = np.where(censored, np.maximum(expected, config.MIN_RSSI_THRESHOLD), expected)
+        residual = (observed - expected) / config.NOISE_STD_DEV_DB
+        return -0.5 * np.einsum('ij,ij->i', residual, residual)
+
+    def _systematic_resample(self, weights):
+        positions = (self.rng.random() + np.arange(self.num_particles)) / self.num_particles
+        cumulative = np.cumsum(weights)
+        cumulative[-1] = 1.0
+        picks = np.searchsorted(cumulative, positions)
+        self.particles = self.particles[picks]
+        self.log_weights = np.full(self.num_particles, -np.log(self.num_particles))
+
+    @instrumentation.timed('localization.particle_filter',
+                           items=lambda estimate, localizer, *_, **__: localizer.num_particles)
+    def update(self, observed_rssi):
+        """Một bước lọc (chuyển động, likelihood, lấy mẫu lại); trả về vị trí ước tính (hàng, cột)."""
+        self._move(self.motion_std_cells)
+        self.log_weights = self.log_weights + self._log_likelihood(observed_rssi)
+        self.log_weights -= self.log_weights.max()
+        weights = np.exp(self.log_weights)
+        weights /= weights.sum()
+        self.log_weights = np.log(np.maximum(weights, 1e-300))
+        estimate = self.estimate(weights)
+
+        effective_particles = 1.0 / np.sum(weights ** 2)
+        if effective_particles < config.PF_RESAMPLE_THRESHOLD * self.num_particles:
+            self._systematic_resample(weights)
+        return estimate
+
+    def estimate(self, weights=None):
+        """Trung bình có trọng số của các hạt; nếu rơi vào kệ thì lấy hạt gần trung bình nhất."""
+        if weights is None:
+            weights = np.exp(self.log_weights - self.log_weights.max())
+            weights /= weights.sum()
+        mean_pos = weights @ self.particles
+        mean_cell = self._cells(mean_pos[None, :])[0]
+        if not self.walkable[mean_cell[0], mean_cell[1]]:
+            offsets = self.particles - mean_pos
+            mean_pos = self.particles[np.argmin(np.einsum('ij,ij->i', offsets, offsets))]
+        return (float(mean_pos[0]), float(mean_pos[1]))
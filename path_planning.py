@@ -0,0 +1,139 @@
+# path_planning.py
+import heapq
+import math
+from array import array
+import numpy as np
+import config
+import instrumentation
+
+SQRT2 = math.sqrt(2)
+
+# 8 hướng di chuyển (dr, dc, chi phí), giống DiagonalMovement.always của thư viện pathfinding
+NEIGHBOR_MOVES = (
+    (-1, 0, 1.0), (1, 0, 1.0), (0, -1, 1.0), (0, 1, 1.0),
+    (-1, -1, SQRT2), (-1, 1, SQRT2), (1, -1, SQRT2), (1, 1, SQRT2),
+)
+
+def octile_distance(dr, dc):
+    """Heuristic octile cho lưới 8 hướng (chi phí thẳng 1, chéo sqrt(2))."""
+    dr, dc = abs(dr), abs(dc)
+    return (SQRT2 - 1) * min(dr, dc) + max(dr, dc)
+
+class GridPlanner:
+    """
+    Bộ tìm đường A* trên lưới NumPy, dựng cấu trúc đi được một lần cho mỗi bản đồ
+    và tái sử dụng cho mọi truy vấn.
+    Lưới được đệm một viền ô không đi được, nên các ô được đánh chỉ số phẳng
+    và láng giềng chỉ là phép cộng offset, không cần kiểm tra biên.
+    Trạng thái nằm trong bytearray/array kiểu cố định (15 byte mỗi ô) thay vì list Python.
+    """
+    def __init__(self, grid_map):
+        self.num_rows, self.num_cols = grid_map.shape
+        self.padded_cols = self.num_cols + 2
+        padded = np.zeros((self.num_rows + 2, self.padded_cols), dtype=bool)
+        padded[1:-1, 1:-1] = grid_map == config.CELL_TYPE_PATH
+        self.walkable = bytearray(padded.ravel().tobytes())
+        self.neighbor_offsets = [(dr * self.padded_cols + dc, cost) for dr, dc, cost in NEIGHBOR_MOVES]
+
+        # Mảng chi phí/cha dùng lại giữa các truy vấn; search_stamp đánh dấu giá trị
+        # nào thuộc lần tìm hiện tại, nên không phải xóa mảng trước mỗi truy vấn.
+        # Dấu là 1 byte (1..255): chỉ xóa mảng dấu khi quay vòng, mỗi 255 truy vấn.
+        num_cells = len(self.walkable)
+        self.g_cost = array('d', bytes(8 * num_cells))
+        self.parent = array('i', bytes(4 * num_cells))
+        self.search_stamp = bytearray(num_cells)
+        self.closed_stamp = bytearray(num_cells)
+        self.current_search = 0
+        self.last_expanded = 0 # Số nút đã mở rộng ở truy vấn gần nhất
+
+    def to_index(self, cell):
+        return (cell[0] + 1) * self.padded_cols + (cell[1] + 1)
+
+    def to_cell(self, index):
+        r, c = divmod(index, self.padded_cols)
+        return (r - 1, c - 1)
+
+    def in_bounds(self, cell):
+        return 0 <= cell[0] < self.num_rows and 0 <= cell[1] < self.num_cols
+
+    def is_walkable(self, cell):
+        return self.in_bounds(cell) and self.walkable[self.to_index(cell)]
+
+    def set_walkable(self, cell, walkable):
+        """Cập nhật trạng thái đi được của một ô (dùng khi bố cục thay đổi)."""
+        self.walkable[self.to_index(cell)] = bool(walkable)
+
+    def nbytes(self):
+        return (len(self.walkable) + len(self.search_stamp) + len(self.closed_stamp)
+                + self.g_cost.itemsize * len(self.g_cost) + self.parent.itemsize * len(self.parent))
+
+    def _check_endpoint(self, cell, label):
+        if not self.in_bounds(cell):
+            print(f"Lỗi tìm đường: Điểm {label} ({cell[0]},{cell[1]}) nằm ngoài biên của lưới.")
+            return False
+        if not self.walkable[self.to_index(cell)]:
+            print(f"Lỗi tìm đường: Điểm {label} ({cell[0]},{cell[1]}) là vật cản.")
+            return False
+        return True
+
+    @instrumentation.timed('routing.astar', items=lambda path, planner, *_, **__: planner.last_expanded)
+    def find_path(self, start_node_grid, end_node_grid):
+        """Tìm đường đi ngắn nhất (8 hướng); trả về list (hàng, cột) từ start đến end hoặc None."""
+        self.last_expanded = 0
+        if not self._check_endpoint(start_node_grid, "bắt đầu") or \
+           not self._check_endpoint(end_node_grid, "kết thúc"):
+            return None
+
+        self.current_search += 1
+        if self.current_search > 255:
+            self.current_search = 1
+            self.search_stamp[:] = bytes(len(self.search_stamp))
+            self.closed_stamp[:] = bytes(len(self.closed_stamp))
+        stamp = self.current_search
+        walkable, g_cost, parent = self.walkable, self.g_cost, self.parent
+        search_stamp, closed_stamp = self.search_stamp, self.closed_stamp
+        padded_cols = self.padded_cols
+        start_idx = self.to_index(start_node_grid)
+        end_idx = self.to_index(end_node_grid)
+        end_r, end_c = divmod(end_idx, padded_cols)
+
+        g_cost[start_idx] = 0.0
+        parent[start_idx] = -1
+        search_stamp[start_idx] = stamp
+        open_heap = [(0.0, start_idx)]
+        expanded = 0
+        while open_heap:
+            _, node_idx = heapq.heappop(open_heap)
+            if closed_stamp[node_idx] == stamp:
+                continue
+            closed_stamp[node_idx] = stamp
+            expanded += 1
+            if node_idx == end_idx:
+                break
+            node_g = g_cost[node_idx]
+            for offset, move_cost in self.neighbor_offsets:
+                neighbor_idx = node_idx + offset
+                if not walkable[neighbor_idx] or closed_stamp[neighbor_idx] == stamp:
+                    continue
+                new_g = node_g + move_cost
+                if search_stamp[neighbor_idx] != stamp or new_g < g_cost[neighbor_idx]:
+                    search_stamp[neighbor_idx] = stamp
+                    g_cost[neighbor_idx] = new_g
+                    parent[neighbor_idx] = node_idx
+                    n_r, n_c = divmod(neighbor_idx, padded_cols)
+                    heapq.heappush(open_heap, (new_g + octile_distance(n_r - end_r, n_c - end_c), neighbor_idx))
+        self.last_expanded = expanded
+
+        if closed_stamp[end_idx] != stamp:
+            return None
+        path = []
+        node_idx = end_idx
+        while node_idx != -1:
+            path.append(self.to_cell(node_idx))
+            node_idx = parent[node_idx]
+        path.reverse()
+        return path
+
+def path_length(path_nodes):
+    """Độ dài đường đi (đơn vị ô, chéo tính sqrt(2))."""
+    return sum(math.hypot(r2 - r1, c2 - c1) for (r1, c1), (r2, c2) in zip(path_nodes, path_nodes[1:]))
@@ -0,0 +1,188 @@
+# route_optimizer.py
+import time
+import numpy as np
+import config
+from distance_fields import UNREACHABLE_DISTANCE
+
+class ShoppingRouteOptimizer:
+    """
+    Tối ưu thứ tự ghé thăm cho một danh sách món hàng.
+    Mỗi món chọn đúng một điểm tiếp cận; ma trận khoảng cách đường đi giữa các điểm
+    tiếp cận được lấy từ DistanceFields một lần và dùng lại cho mọi truy vấn.
+    """
+    def __init__(self, item_locations_dict, distance_fields):
+        self.item_locations_dict = item_locations_dict
+        self.distance_fields = distance_fields
+        distance_fields.refresh() # Ma trận dùng mảng khoảng cách trực tiếp, cần mọi trường mới nhất
+        targets = distance_fields.targets
+        target_r = np.array([r for r, _ in targets], dtype=np.int64)
+        target_c = np.array([c for _, c in targets], dtype=np.int64)
+        # pairwise[i, j] = độ dài đường đi (ô) từ điểm tiếp cận i đến j
+        stored = distance_fields.distances[:, target_r, target_c].T
+        self.pairwise = np.where(stored == UNREACHABLE_DISTANCE, np.inf,
+                                 stored / distance_fields.scale)
+
+    def _distances_from_cell(self, cell):
+        stored = self.distance_fields.distances[:, cell[0], cell[1]]
+        return np.where(stored == UNREACHABLE_DISTANCE, np.inf, stored / self.distance_fields.scale)
+
+    def plan(self, cart_pos_grid, item_names, exact_max_items=None):
+        """
+        Lập lộ trình từ vị trí xe đẩy qua mọi món trong item_names.
+        Trả về dict gồm: order (tên món theo thứ tự), access_points, path (đường đi
+        ghép đầy đủ), length_cells, length_m, solve_time_s, method ('exact'/'heuristic')
+        và skipped_items (món không có điểm tiếp cận hoặc không tới được).
+        """
+        start_time = time.perf_counter()
+        exact_max_items = exact_max_items or config.ROUTE_EXACT_MAX_ITEMS
+        cart_cell = (round(cart_pos_grid[0]), round(cart_pos_grid[1]))
+        from_cart = self._distances_from_cell(cart_cell)
+
+        # Mỗi "nút" là một cặp (món, điểm tiếp cận); chỉ giữ điểm tới được từ xe đẩy
+        items, node_item, node_target, skipped_items = [], [], [], []
+        for item_name in dict.fromkeys(item_names):
+            spots = [self.distance_fields.target_lookup.get(tuple(spot))
+                     for spot in self.item_locations_dict.get(item_name, [])]
+            spots = [idx for idx in spots if idx is not None and np.isfinite(from_cart[idx])]
+            if not spots:
+                skipped_items.append(item_name)
+                continue
+            for target_idx in spots:
+                node_item.append(len(items))
+                node_target.append(target_idx)
+            items.append(item_name)
+        node_item = np.array(node_item, dtype=np.int64)
+        node_target = np.array(node_target, dtype=np.int64)
+
+        if not items:
+            order_nodes, method = [], 'exact'
+        elif len(items) <= exact_max_items:
+            order_nodes, method = self._solve_exact(len(items), node_item, node_target, from_cart), 'exact'
+        else:
+            order_nodes, method = self._solve_heuristic(len(items), node_item, node_target, from_cart), 'heuristic'
+
+        access_points = [self.distance_fields.targets[node_target[node]] for node in order_nodes]
+        path = [cart_cell]
+        for access_point in access_points:
+            leg = self.distance_fields.route(path[-1], access_point)
+            path.extend(leg[1:])
+        length_cells = self._order_length(order_nodes, node_target, from_cart)
+        return {
+            'order': [items[node_item[node]] for node in order_nodes],
+            'access_points': access_points,
+            'path': path,
+            'length_cells': length_cells,
+            'length_m': length_cells * config.GRID_RESOLUTION_M,
+            'solve_time_s': time.perf_counter() - start_time,
+            'method': method,
+            'skipped_items': skipped_items,
+        }
+
+    def _order_length(self, order_nodes, node_target, from_cart):
+        if not order_nodes:
+            return 0.0
+        targets = node_target[list(order_nodes)]
+        return float(from_cart[targets[0]] + self.pairwise[targets[:-1], targets[1:]].sum())
+
+    def _solve_exact(self, num_items, node_item, node_target, from_cart):
+        """Quy hoạch động Held-Karp trên (tập món đã ghé, nút cuối), chọn luôn điểm tiếp cận."""
+        num_nodes = len(node_item)
+        node_bits = 1 << node_item
+        pair = self.pairwise[np.ix_(node_target, node_target)]
+        full_mask = (1 << num_items) - 1
+        cost = np.full((full_mask + 1, num_nodes), np.inf)
+        parent = np.full((full_mask + 1, num_nodes), -1, dtype=np.int64)
+        cost[node_bits, np.arange(num_nodes)] = from_cart[node_target]
+
+        for mask in range(1, full_mask + 1):
+            current = cost[mask]
+            if not np.isfinite(current).any():
+                continue
+            candidates = current[:, None] + pair # (nút trước, nút tiếp)
+            best_prev = np.argmin(candidates, axis=0)
+            best_cost = candidates[best_prev, np.arange(num_nodes)]
+            next_nodes = np.nonzero((mask & node_bits) == 0)[0]
+            next_masks = mask | node_bits[next_nodes]
+            improved = best_cost[next_nodes] < cost[next_masks, next_nodes]
+            cost[next_masks[improved], next_nodes[improved]] = best_cost[next_nodes][improved]
+            parent[next_masks[improved], next_nodes[improved]] = best_prev[next_nodes][improved]
+
+        order_nodes = []
+        mask, node = full_mask, int(np.argmin(cost[full_mask]))
+        while node != -1:
+            order_nodes.append(node)
+            prev_node = int(parent[mask, node])
+            mask &= ~int(node_bits[node])
+            node = prev_node
+        return order_nodes[::-1]
+
+    def _best_access_points(self, item_order, item_nodes, from_cart, node_target):
+        """Với thứ tự món cố định, chọn điểm tiếp cận tối ưu cho từng món (quy hoạch động theo tầng)."""
+        layer_nodes = item_nodes[item_order[0]]
+        layer_cost = from_cart[node_target[layer_nodes]]
+        back_pointers = []
+        for item_idx in item_order[1:]:
+            next_nodes = item_nodes[item_idx]
+            candidates = layer_cost[:, None] + self.pairwise[np.ix_(node_target[layer_nodes], node_target[next_nodes])]
+            best_prev = np.argmin(candidates, axis=0)
+            back_pointers.append((layer_nodes, best_prev))
+            layer_cost = candidates[best_prev, np.arange(len(next_nodes))]
+            layer_nodes = next_nodes
+        choice = int(np.argmin(layer_cost))
+        order_nodes = [int(layer_nodes[choice])]
+        for prev_nodes, best_prev in reversed(back_pointers):
+            choice = int(best_prev[choice])
+            order_nodes.append(int(prev_nodes[choice]))
+        return order_nodes[::-1]
+
+    def _solve_heuristic(self, num_items, node_item, node_target, from_cart):
+        """Láng giềng gần nhất rồi cải thiện bằng 2-opt (đường mở), xen kẽ chọn lại điểm tiếp cận."""
+        item_nodes = [np.nonzero(node_item == item_idx)[0] for item_idx in range(num_items)]
+
+        # Láng giềng gần nhất: luôn đi đến nút gần nhất của một món chưa ghé
+        visited = np.zeros(num_items, dtype=bool)
+        current_dist = from_cart[node_target]
+        order_nodes = []
+        for _ in range(num_items):
+            masked = np.where(visited[node_item], np.inf, current_dist)
+            node = int(np.argmin(masked))
+            order_nodes.append(node)
+            visited[node_item[node]] = True
+            current_dist = self.pairwise[node_target[node], node_target]
+
+        best_length = self._order_length(order_nodes, node_target, from_cart)
+        for _ in range(config.ROUTE_TWO_OPT_MAX_ROUNDS):
+            order_nodes = self._two_opt(order_nodes, node_target, from_cart)
+            item_order = [int(node_item[node]) for node in order_nodes]
+            order_nodes = self._best_access_points(item_order, item_nodes, from_cart, node_target)
+            new_length = self._order_length(order_nodes, node_target, from_cart)
+            if new_length >= best_length - 1e-9:
+                break
+            best_length = new_length
+        return order_nodes
+
+    def _two_opt(self, order_nodes, node_target, from_cart):
+        """2-opt cho đường mở bắt đầu tại xe đẩy (khoảng cách đối xứng); điểm tiếp cận giữ nguyên."""
+        targets = [int(node_target[node]) for node in order_nodes]
+        pairwise = self.pairwise
+        num_stops = len(targets)
+
+        def dist_before(i): # Khoảng cách từ điểm dừng trước i (hoặc xe đẩy) đến i
+            return from_cart[targets[i]] if i == 0 else pairwise[targets[i - 1], targets[i]]
+
+        improved = True
+        while improved:
+            improved = False
+            for i in range(num_stops - 1):
+                for j in range(i + 1, num_stops):
+                    # Đảo đoạn [i..j]: thay cạnh (i-1, i) và (j, j+1) bằng (i-1, j) và (i, j+1)
+                    before = dist_before(i)
+                    after = from_cart[targets[j]] if i == 0 else pairwise[targets[i - 1], targets[j]]
+                    if j + 1 < num_stops:
+                        before += pairwise[targets[j], targets[j + 1]]
+                        after += pairwise[targets[i], targets[j + 1]]
+                    if after < before - 1e-9:
+                        targets[i:j + 1] = targets[i:j + 1][::-1]
+                        order_nodes[i:j + 1] = order_nodes[i:j + 1][::-1]
+                        improved = True
+        return order_nodes
@@ -2,6 +2,7 @@
 import math
 import numpy as np
 import config
+import instrumentation
 
 def euclidean_distance_m(p1_grid, p2_grid):
     """Tính khoảng cách Euclide giữa hai điểm trên lưới (tính bằng mét)."""
@@ -34,8 +35,14 @@ def get_line_cells(x1_col, y1_row, x2_col, y2_row): # Nhận (cột, hàng) cho
             y1 += sy
     return points
 
-def count_shelf_intersections(ap_pos_grid, cell_pos_grid, current_grid_map):
-    """Đếm số lượng ô kệ hàng mà đường thẳng từ AP đến cell_pos_grid đi qua."""
+def count_shelf_intersections(ap_pos_grid, cell_pos_grid, current_grid_map, shelf_crossing_map=None):
+    """
+    Đếm số lượng ô kệ hàng mà đường thẳng từ AP đến cell_pos_grid đi qua.
+    shelf_crossing_map: bản đồ tính sẵn cho AP này (xem compute_shelf_crossing_maps),
+    nếu có thì chỉ cần tra cứu O(1) thay vì duyệt Bresenham.
+    """
+    if shelf_crossing_map is not None:
+        return int(shelf_crossing_map[cell_pos_grid[0], cell_pos_grid[1]])
     line_cells = get_line_cells(ap_pos_grid[1], ap_pos_grid[0], cell_pos_grid[1], cell_pos_grid[0])
     shelf_crossings = 0
     for r, c in line_cells[1:-1]:
@@ -44,7 +51,7 @@ def count_shelf_intersections(ap_pos_grid, cell_pos_grid, current_grid_map):
                 shelf_crossings += 1
     return shelf_crossings
 
-def calculate_single_rssi(ap_pos_grid, cell_pos_grid, current_grid_map):
+def calculate_single_rssi(ap_pos_grid, cell_pos_grid, current_grid_map, shelf_crossing_map=None):
     """Tính toán RSSI mô phỏng tại cell_pos_grid từ một AP."""
     distance_m = euclidean_distance_m(ap_pos_grid, cell_pos_grid)
 
@@ -52,29 +59,229 @@ def calculate_single_rssi(ap_pos_grid, cell_pos_grid, current_grid_map):
         return config.P_TX_MAX_RSSI + np.random.normal(0, config.NOISE_STD_DEV_DB / 3)
 
     path_loss_db = 10 * config.PATH_LOSS_EXPONENT_N * math.log10(distance_m)
-    num_shelves = count_shelf_intersections(ap_pos_grid, cell_pos_grid, current_grid_map)
+    num_shelves = count_shelf_intersections(ap_pos_grid, cell_pos_grid, current_grid_map, shelf_crossing_map)
     total_shelf_attenuation_db = num_shelves * config.SHELF_ATTENUATION_DB
     noise_db = np.random.normal(0, config.NOISE_STD_DEV_DB)
     rssi = config.P_TX_MAX_RSSI - path_loss_db - total_shelf_attenuation_db + noise_db
     return max(rssi, config.MIN_RSSI_THRESHOLD)
 
-def generate_rssi_fingerprints(grid_map, access_points, num_rows, num_cols):
-    """Tạo bản đồ fingerprint RSSI cho tất cả các ô lối đi."""
+def count_shelf_intersections_grid(ap_pos_grid, current_grid_map, row_range=None):
+    """
+    Đếm số ô kệ bị cắt trên đường thẳng từ AP đến MỌI ô của bản đồ cùng lúc.
+    Chạy thuật toán Bresenham song song (mỗi phần tử mảng là một tia), cho kết quả
+    giống hệt count_shelf_intersections (bỏ qua hai điểm đầu mút).
+    row_range: (hàng đầu, hàng cuối) nếu chỉ tính cho một dải hàng đích.
+    Trả về mảng số nguyên (hàng, cột).
+    """
+    num_rows, num_cols = current_grid_map.shape
+    row_start, row_end = row_range or (0, num_rows)
+    target_r, target_c = np.divmod(np.arange(row_start * num_cols, row_end * num_cols), num_cols)
+    crossings = count_shelf_intersections_cells(ap_pos_grid, current_grid_map, target_r, target_c)
+    return crossings.reshape(row_end - row_start, num_cols)
+
+def count_shelf_intersections_cells(ap_pos_grid, current_grid_map, target_r, target_c):
+    """
+    Như count_shelf_intersections_grid nhưng cho một tập ô đích bất kỳ (mảng chỉ số hàng,
+    cột cùng shape); dùng khi chỉ một phần các tia cần tính lại.
+    """
+    num_rows, num_cols = current_grid_map.shape
+    is_shelf = (current_grid_map == config.CELL_TYPE_SHELF).ravel()
+    ap_r, ap_c = ap_pos_grid
+    if target_r.size == 0:
+        return np.zeros(target_r.shape, dtype=np.int32)
+    dx = np.abs(target_c - ap_c)
+    dy = np.abs(target_r - ap_r)
+    sx = np.where(ap_c < target_c, 1, -1)
+    sy = np.where(ap_r < target_r, 1, -1)
+    err = dx - dy
+    num_points = np.maximum(dx, dy) + 1 # Số điểm trên tia, kể cả hai đầu mút
+
+    x = np.full(target_c.shape, ap_c)
+    y = np.full(target_r.shape, ap_r)
+    crossings = np.zeros(target_c.shape, dtype=np.int32)
+    for step in range(1, int(num_points.max()) - 1):
+        e2 = 2 * err
+        move_x = e2 > -dy
+        move_y = e2 < dx
+        err = err - np.where(move_x, dy, 0) + np.where(move_y, dx, 0)
+        x = x + np.where(move_x, sx, 0)
+        y = y + np.where(move_y, sy, 0)
+        inner = step < num_points - 1 # Bỏ qua điểm cuối (ô đích)
+        # Các tia đã kết thúc có thể đi ra ngoài lưới, nên kẹp chỉ số trước khi tra cứu
+        flat_idx = np.clip(y, 0, num_rows - 1) * num_cols + np.clip(x, 0, num_cols - 1)
+        crossings += inner & is_shelf[flat_idx]
+    return crossings
+
+@instrumentation.timed('rssi.shelf_crossings', items=lambda crossing_maps, *_, **__: crossing_maps.size)
+def compute_shelf_crossing_maps(grid_map, access_points, row_range=None):
+    """
+    Tính trước bản đồ "số ô kệ bị cắt" cho từng AP.
+    Trả về mảng (số AP, hàng, cột); phần tử [i, r, c] là số ô kệ giữa AP i và ô (r, c).
+    Chỉ cần tính lại khi bố cục kệ hoặc vị trí AP thay đổi.
+    row_range: (hàng đầu, hàng cuối) nếu chỉ tính cho một dải hàng.
+    """
+    row_start, row_end = row_range or (0, grid_map.shape[0])
+    crossing_maps = np.empty((len(access_points), row_end - row_start, grid_map.shape[1]), dtype=np.int32)
+    for ap_idx, ap_pos in enumerate(access_points):
+        crossing_maps[ap_idx] = count_shelf_intersections_grid(ap_pos, grid_map, row_range)
+    return crossing_maps
+
+def _near_ap_mask(ap_pos_grid, rows, cols):
+    distance_m = np.hypot(rows - ap_pos_grid[0], cols - ap_pos_grid[1]) * config.GRID_RESOLUTION_M
+    return distance_m, distance_m < config.GRID_RESOLUTION_M / 2 # Ở rất gần hoặc trùng AP
+
+def _mean_rssi_at_cells(distance_m, near_ap, shelf_crossings):
+    path_loss_db = 10 * config.PATH_LOSS_EXPONENT_N * np.log10(np.where(near_ap, 1.0, distance_m))
+    return config.P_TX_MAX_RSSI - path_loss_db - shelf_crossings * config.SHELF_ATTENUATION_DB
+
+def _add_noise(mean_rssi, standard_noise, near_ap):
+    noise_db = standard_noise * np.where(near_ap, config.NOISE_STD_DEV_DB / 3, config.NOISE_STD_DEV_DB)
+    noisy_rssi = mean_rssi + noise_db
+    return np.where(near_ap, noisy_rssi, np.maximum(noisy_rssi, config.MIN_RSSI_THRESHOLD))
+
+def mean_rssi_at_cells(ap_pos_grid, rows, cols, shelf_crossings):
+    """RSSI trung bình (không nhiễu, chưa kẹp ngưỡng) từ một AP tại các ô (rows, cols) bất kỳ."""
+    distance_m, near_ap = _near_ap_mask(ap_pos_grid, rows, cols)
+    return _mean_rssi_at_cells(distance_m, near_ap, shelf_crossings)
+
+def noisy_rssi_at_cells(ap_pos_grid, rows, cols, shelf_crossings, standard_noise):
+    """
+    RSSI có nhiễu từ một AP tại các ô (rows, cols) bất kỳ, với nhiễu chuẩn N(0, 1) cho sẵn
+    (cùng shape). Cho cùng giá trị với generate_rssi_rows khi dùng đúng nhiễu đã rút cho ô đó.
+    """
+    distance_m, near_ap = _near_ap_mask(ap_pos_grid, rows, cols)
+    return _add_noise(_mean_rssi_at_cells(distance_m, near_ap, shelf_crossings), standard_noise, near_ap)
+
+def sample_observations_at_cells(access_points, rows, cols, mean_rssi, standard_noise):
+    """
+    Nhiều quan sát có nhiễu (như get_observed_rssi_at_cart) tại mỗi ô cùng lúc.
+    mean_rssi: (số ô, số AP) từ compute_mean_rssi_grid; standard_noise: N(0, 1) dạng (số ô, T, số AP).
+    Trả về mảng (số ô, T, số AP).
+    """
+    near_ap = np.column_stack([_near_ap_mask(ap_pos, rows, cols)[1] for ap_pos in access_points]) \
+        if len(access_points) else np.empty((len(rows), 0), dtype=bool)
+    return _add_noise(mean_rssi[:, None, :], standard_noise, near_ap[:, None, :])
+
+def _row_indices(grid_map, row_range):
+    row_start, row_end = row_range or (0, grid_map.shape[0])
+    rows, cols = np.indices((row_end - row_start, grid_map.shape[1]))
+    return rows + row_start, cols
+
+def compute_mean_rssi_grid(grid_map, access_points, shelf_crossing_maps=None, row_range=None):
+    """
+    RSSI trung bình (không nhiễu, chưa kẹp ngưỡng) của mô hình tại mọi ô: mảng (hàng, cột, số AP).
+    Ô trùng AP có giá trị P_TX_MAX_RSSI như trong calculate_single_rssi.
+    row_range: chỉ tính cho dải hàng (hàng đầu, hàng cuối); shelf_crossing_maps khi đó
+    là bản đồ của riêng dải hàng này.
+    """
+    if shelf_crossing_maps is None:
+        shelf_crossing_maps = compute_shelf_crossing_maps(grid_map, access_points, row_range)
+    rows, cols = _row_indices(grid_map, row_range)
+    mean_rssi = np.empty(rows.shape + (len(access_points),))
+    for ap_idx, ap_pos in enumerate(access_points):
+        distance_m, near_ap = _near_ap_mask(ap_pos, rows, cols)
+        mean_rssi[:, :, ap_idx] = _mean_rssi_at_cells(distance_m, near_ap, shelf_crossing_maps[ap_idx])
+    return mean_rssi
+
+@instrumentation.timed('rssi.generate_rows', items=lambda rssi, *_, **__: rssi.shape[0] * rssi.shape[1])
+def generate_rssi_rows(grid_map, access_points, rng, shelf_crossing_maps=None, row_range=None):
+    """
+    Mô phỏng RSSI có nhiễu cho một dải hàng (mặc định toàn bộ lưới): mảng (hàng, cột, số AP).
+    Nhiễu lấy từ rng (numpy.random.Generator), lần lượt từng AP trên cả dải hàng.
+    shelf_crossing_maps: bản đồ số ô kệ bị cắt của đúng dải hàng (tính mới nếu None).
+    """
+    rows, cols = _row_indices(grid_map, row_range)
+    rssi = compute_mean_rssi_grid(grid_map, access_points, shelf_crossing_maps, row_range)
+
+    for ap_idx, ap_pos in enumerate(access_points):
+        _, near_ap = _near_ap_mask(ap_pos, rows, cols)
+        rssi[:, :, ap_idx] = _add_noise(rssi[:, :, ap_idx], rng.standard_normal(rows.shape), near_ap)
+
+    row_start, row_end = row_range or (0, grid_map.shape[0])
+    rssi[grid_map[row_start:row_end] == config.CELL_TYPE_SHELF] = np.nan
+    return rssi
+
+def standard_noise_grid(shape, num_aps, seed=None):
+    """
+    Nhiễu chuẩn N(0, 1) mà generate_rssi_fingerprint_array rút với cùng seed: mảng (số AP, hàng, cột).
+    Dùng để tính lại một phần fingerprint mà vẫn khớp với lần tạo toàn bộ.
+    """
+    rng = np.random.default_rng(seed)
+    return np.stack([rng.standard_normal(shape) for _ in range(num_aps)]) if num_aps else \
+        np.empty((0,) + tuple(shape))
+
+def generate_rssi_fingerprint_array(grid_map, access_points, seed=None, shelf_crossing_maps=None):
+    """
+    Mô phỏng RSSI cho toàn bộ lưới dưới dạng mảng (hàng, cột, số AP).
+    Cùng mô hình với calculate_single_rssi (path loss, suy hao kệ, nhiễu Gaussian,
+    ngưỡng tối thiểu), nhưng nhiễu lấy từ numpy.random.Generator có seed.
+    Ô kệ hàng có giá trị NaN.
+    shelf_crossing_maps: kết quả của compute_shelf_crossing_maps (tính mới nếu None).
+    """
+    return generate_rssi_rows(grid_map, access_points, np.random.default_rng(seed), shelf_crossing_maps)
+
+def generate_rssi_fingerprints_vectorized(grid_map, access_points, num_rows, num_cols, seed=None,
+                                          shelf_crossing_maps=None):
+    """Tạo bản đồ fingerprint RSSI bằng engine mảng NumPy (cùng định dạng với bản vòng lặp)."""
+    if shelf_crossing_maps is not None:
+        shelf_crossing_maps = shelf_crossing_maps[:, :num_rows, :num_cols]
+    rssi = generate_rssi_fingerprint_array(grid_map[:num_rows, :num_cols], access_points, seed,
+                                           shelf_crossing_maps)
+    return _rssi_array_to_dict(grid_map[:num_rows, :num_cols], rssi)
+
+def _rssi_array_to_dict(grid_map, rssi):
+    """Mảng (hàng, cột, số AP) sang dict[(hàng, cột)] -> list RSSI trên các ô lối đi."""
+    walkable_r, walkable_c = np.nonzero(grid_map != config.CELL_TYPE_SHELF)
+    rssi_rows = rssi[walkable_r, walkable_c].tolist()
+    return {(r, c): rssi_values
+            for r, c, rssi_values in zip(walkable_r.tolist(), walkable_c.tolist(), rssi_rows)}
+
+@instrumentation.timed('rssi.fingerprints', items=lambda fingerprints, *_, **__: len(fingerprints))
+def generate_rssi_fingerprints(grid_map, access_points, num_rows, num_cols, engine=None, seed=None,
+                               shelf_crossing_maps=None):
+    """
+    Tạo bản đồ fingerprint RSSI cho tất cả các ô lối đi.
+    engine: 'vectorized', 'parallel' (tile đa tiến trình) hoặc 'loop' (mặc định lấy từ config.FINGERPRINT_ENGINE).
+    seed: seed cho engine 'vectorized' và 'parallel' (mặc định config.RANDOM_SEED); engine 'loop'
+    rút nhiễu từ np.random toàn cục.
+    shelf_crossing_maps: bản đồ số ô kệ bị cắt tính sẵn cho từng AP (tùy chọn).
+    """
+    engine = engine or config.FINGERPRINT_ENGINE
+    if engine == 'vectorized':
+        return generate_rssi_fingerprints_vectorized(
+            grid_map, access_points, num_rows, num_cols,
+            config.RANDOM_SEED if seed is None else seed, shelf_crossing_maps
+        )
+    if engine == 'parallel':
+        import parallel_fingerprints # Nhập muộn: parallel_fingerprints dùng các hàm của mô-đun này
+        if shelf_crossing_maps is not None:
+            shelf_crossing_maps = shelf_crossing_maps[:, :num_rows, :num_cols]
+        rssi, _ = parallel_fingerprints.generate_rssi_fingerprint_array_parallel(
+            grid_map[:num_rows, :num_cols], access_points, config.RANDOM_SEED if seed is None else seed,
+            shelf_crossing_maps
+        )
+        return _rssi_array_to_dict(grid_map[:num_rows, :num_cols], rssi)
+    if engine != 'loop':
+        raise ValueError(f"Engine tạo fingerprint không hợp lệ: {engine}")
+
     fingerprints = {}
     for r_idx in range(num_rows):
         for c_idx in range(num_cols):
             if grid_map[r_idx, c_idx] != config.CELL_TYPE_SHELF:
                 current_cell_rssi_values = []
-                for ap_pos in access_points:
-                    rssi_val = calculate_single_rssi(ap_pos, (r_idx, c_idx), grid_map)
+                for ap_idx, ap_pos in enumerate(access_points):
+                    crossing_map = shelf_crossing_maps[ap_idx] if shelf_crossing_maps is not None else None
+                    rssi_val = calculate_single_rssi(ap_pos, (r_idx, c_idx), grid_map, crossing_map)
                     current_cell_rssi_values.append(rssi_val)
                 fingerprints[(r_idx, c_idx)] = current_cell_rssi_values
     return fingerprints
 
-def get_observed_rssi_at_cart(cart_pos_grid, grid_map, access_points):
+@instrumentation.timed('rssi.observe')
+def get_observed_rssi_at_cart(cart_pos_grid, grid_map, access_points, shelf_crossing_maps=None):
     """Tính toán RSSI 'quan sát được' tại vị trí xe đẩy."""
     observed_rssi = []
-    for ap_pos in access_points:
-        rssi_val = calculate_single_rssi(ap_pos, cart_pos_grid, grid_map)
+    for ap_idx, ap_pos in enumerate(access_points):
+        crossing_map = shelf_crossing_maps[ap_idx] if shelf_crossing_maps is not None else None
+        rssi_val = calculate_single_rssi(ap_pos, cart_pos_grid, grid_map, crossing_map)
         observed_rssi.append(rssi_val)
     return observed_rssi
\ No newline at end of file
@@ -0,0 +1,381 @@
+# store_zones.py
+"""
+Cửa hàng nhiều tầng / nhiều khu vực. Mỗi khu (zone) có lưới, AP và fingerprint riêng; khu chỉ
+được dựng khi xe đẩy báo vị trí từ khu đó lần đầu (lưới từ manifest, fingerprint và trường khoảng
+cách mở từ cache trên đĩa qua map_cache) và bị loại theo LRU khi tổng bộ nhớ các khu đang nạp
+vượt ngân sách.
+Các khu nối với nhau qua cổng (thang cuốn, thang máy, lối thông). Khoảng cách giữa các cổng của
+cùng một khu được tính trước và lưu cache, nên tìm đường liên khu chỉ chạy Dijkstra trên đồ thị
+cổng nhỏ và chỉ nạp các khu nằm trên lộ trình.
+Chạy thử:
+    python store_zones.py
+"""
+import heapq
+import json
+import time
+from collections import OrderedDict
+import numpy as np
+import config
+import map_utils
+import map_cache
+import rssi_simulation
+import localization_algorithms
+import path_planning
+import walkable_index
+
+# Manifest: {'zones': [spec, ...], 'links': [link, ...]}
+# spec: {'name', 'floor', 'width_m', 'height_m', 'shelves' (như shelves_layout trong main.py),
+#        'access_points' (tùy chọn, mặc định 4 góc), 'portals': {tên cổng: [hàng, cột]}}
+# link: {'from': [khu, cổng], 'to': [khu, cổng], 'kind': 'escalator'/'lift'/'passage',
+#        'cost_m' (tùy chọn, mặc định theo config.ZONE_LINK_COST_M), 'bidirectional' (mặc định True)}
+
+def build_zone_grid(spec):
+    """Bản đồ lưới của một khu từ manifest (không tạo fingerprint)."""
+    grid_map, _, _ = map_utils.create_base_map(spec['width_m'], spec['height_m'])
+    for shelf in spec.get('shelves', []):
+        map_utils.add_shelf(grid_map, shelf['r'], shelf['c'], shelf['rows'], shelf['cols'])
+    return grid_map
+
+def _portal_cells(spec):
+    return [tuple(int(v) for v in cell) for cell in spec.get('portals', {}).values()]
+
+class Zone:
+    """Trạng thái đã nạp của một khu: lưới, AP, fingerprint, điểm tiếp cận món hàng, trường khoảng cách đến các cổng."""
+    def __init__(self, spec, cache_dir=None):
+        self.name = spec['name']
+        self.floor = spec.get('floor', 0)
+        self.grid_map = build_zone_grid(spec)
+        num_rows, num_cols = self.grid_map.shape
+        self.access_points = ([tuple(cell) for cell in spec['access_points']] if spec.get('access_points')
+                              else map_utils.define_access_points(num_rows, num_cols))
+        self.fingerprints, self.shelf_crossing_maps = map_cache.load_or_build_fingerprints(
+            self.grid_map, self.access_points, seed=spec.get('seed'), cache_dir=cache_dir)
+        self.item_locations = map_utils.define_item_locations(self.grid_map, num_rows, num_cols,
+                                                              spec.get('shelves', []))
+        self.portals = {name: tuple(int(v) for v in cell) for name, cell in spec.get('portals', {}).items()}
+        self.portal_fields = map_cache.load_or_build_distance_fields(self.grid_map, _portal_cells(spec), cache_dir)
+        self.planner = path_planning.GridPlanner(self.grid_map)
+
+    def nbytes(self):
+        return walkable_index.memory_report(
+            grid=self.grid_map, fingerprints=self.fingerprints, shelf_crossings=self.shelf_crossing_maps,
+            distance_fields=self.portal_fields, planner=self.planner)['total']
+
+class MultiZoneStore:
+    """
+    Cửa hàng gồm nhiều khu, nạp lười theo LRU trong giới hạn memory_budget_bytes
+    (mặc định config.ZONE_MEMORY_BUDGET_MB). Khu đang dùng gần nhất luôn được giữ lại.
+    Nút của đồ thị cổng là cặp (khu, cổng); cạnh gồm đường đi bộ giữa hai cổng cùng khu
+    và các liên kết (thang cuốn, thang máy...) trong manifest.
+    """
+    def __init__(self, manifest, memory_budget_bytes=None, cache_dir=None):
+        self.specs = OrderedDict((spec['name'], spec) for spec in manifest['zones'])
+        self.links = [dict(link) for link in manifest.get('links', [])]
+        self.memory_budget_bytes = memory_budget_bytes or config.ZONE_MEMORY_BUDGET_MB * 1024 * 1024
+        self.cache_dir = cache_dir
+        self.loaded = OrderedDict() # tên khu -> Zone, cũ nhất trước
+        self.loads = 0
+        self.evictions = 0
+        self.portal_nodes = [(zone_name, portal_name) for zone_name, spec in self.specs.items()
+                             for portal_name in spec.get('portals', {})]
+        self.portal_lookup = {node: idx for idx, node in enumerate(self.portal_nodes)}
+        self.portal_graph = None # list kề: nút -> [(nút kề, chi phí mét, loại cạnh)]
+        self._manifest_key = map_cache.make_cache_key('portal_graph', None, {
+            'zones': list(self.specs.values()),
+            'config': {name: getattr(config, name) for name in ('GRID_RESOLUTION_M', 'CELL_TYPE_PATH')},
+        })
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path, encoding='utf-8') as manifest_file:
+            return cls(json.load(manifest_file), **kwargs)
+
+    def loaded_nbytes(self):
+        return sum(zone.nbytes() for zone in self.loaded.values())
+
+    def zone(self, name):
+        """Khu theo tên: nạp nếu chưa có (rồi loại khu ít dùng nhất khi vượt ngân sách), đánh dấu vừa dùng."""
+        if name in self.loaded:
+            self.loaded.move_to_end(name)
+            return self.loaded[name]
+        if name not in self.specs:
+            raise KeyError(f"Không có khu '{name}' trong manifest")
+        self.loaded[name] = Zone(self.specs[name], self.cache_dir)
+        self.loads += 1
+        while len(self.loaded) > 1 and self.loaded_nbytes() > self.memory_budget_bytes:
+            self.loaded.popitem(last=False)
+            self.evictions += 1
+        return self.loaded[name]
+
+    def localize(self, zone_name, observed_rssi, k=None, weighted=None):
+        """Định vị KNN trong một khu (xe đẩy báo RSSI kèm khu hiện tại); nạp khu nếu đây là lần đầu."""
+        zone = self.zone(zone_name)
+        return localization_algorithms.predict_location_knn(
+            observed_rssi, zone.fingerprints, k or config.K_NEIGHBORS,
+            config.USE_WEIGHTED_KNN if weighted is None else weighted, config.EPSILON_WEIGHT)
+
+    def observe(self, zone_name, cell):
+        """RSSI mô phỏng tại ô cell của một khu (dùng để chạy thử, không cần thiết bị thật)."""
+        zone = self.zone(zone_name)
+        return rssi_simulation.get_observed_rssi_at_cart(cell, zone.grid_map, zone.access_points,
+                                                         zone.shelf_crossing_maps)
+
+    def _intra_zone_distances(self):
+        """Ma trận khoảng cách đi bộ (mét) giữa các cổng cùng khu; inf giữa hai khu khác nhau. Chỉ dựng lưới, không nạp khu."""
+        num_portals = len(self.portal_nodes)
+        distances = np.full((num_portals, num_portals), np.inf)
+        for zone_name, spec in self.specs.items():
+            cells = _portal_cells(spec)
+            if not cells:
+                continue
+            fields = map_cache.load_or_build_distance_fields(build_zone_grid(spec), cells, self.cache_dir)
+            node_ids = [self.portal_lookup[(zone_name, portal_name)] for portal_name in spec['portals']]
+            for from_idx, cell in zip(node_ids, cells):
+                for to_idx, target in zip(node_ids, cells):
+                    distances[from_idx, to_idx] = fields.distance(cell, target) * config.GRID_RESOLUTION_M
+        return distances
+
+    def build_portal_graph(self):
+        """
+        Dựng đồ thị cổng: khoảng cách giữa các cổng cùng khu lấy từ cache (tính một lần cho mỗi
+        manifest) cộng các liên kết. Trả về dict thống kê: 'num_portals', 'num_edges', 'from_cache', 'time_s'.
+        """
+        start_time = time.perf_counter()
+        arrays = map_cache.load_entry('portal_graph', self._manifest_key, self.cache_dir) \
+            if config.CACHE_ENABLED else None
+        from_cache = arrays is not None
+        if from_cache:
+            distances = np.asarray(arrays['distances'])
+        else:
+            distances = self._intra_zone_distances()
+            if config.CACHE_ENABLED:
+                map_cache.store_entry('portal_graph', self._manifest_key, {'distances': distances}, self.cache_dir)
+
+        graph = [[] for _ in self.portal_nodes]
+        for from_idx, to_idx in zip(*np.nonzero(np.isfinite(distances))):
+            if from_idx != to_idx:
+                graph[from_idx].append((int(to_idx), float(distances[from_idx, to_idx]), 'walk'))
+        for link in self.links:
+            from_idx = self.portal_lookup[tuple(link['from'])]
+            to_idx = self.portal_lookup[tuple(link['to'])]
+            cost_m = link.get('cost_m', config.ZONE_LINK_COST_M.get(link.get('kind'), 0.0))
+            graph[from_idx].append((to_idx, cost_m, link.get('kind', 'passage')))
+            if link.get('bidirectional', True):
+                graph[to_idx].append((from_idx, cost_m, link.get('kind', 'passage')))
+        self.portal_graph = graph
+        return {
+            'num_portals': len(self.portal_nodes),
+            'num_edges': sum(len(edges) for edges in graph),
+            'from_cache': from_cache,
+            'time_s': time.perf_counter() - start_time,
+        }
+
+    def _zone_geometry(self, zone_name):
+        """
+        (item_locations, portal_fields) của một khu mà không nạp fingerprint: lấy từ khu đã nạp nếu có
+        (không đổi thứ tự LRU), ngược lại dựng lưới từ manifest và mở trường khoảng cách đến cổng từ cache.
+        """
+        if zone_name in self.loaded:
+            zone = self.loaded[zone_name]
+            return zone.item_locations, zone.portal_fields
+        if zone_name not in self.specs:
+            raise KeyError(f"Không có khu '{zone_name}' trong manifest")
+        spec = self.specs[zone_name]
+        grid_map = build_zone_grid(spec)
+        num_rows, num_cols = grid_map.shape
+        item_locations = map_utils.define_item_locations(grid_map, num_rows, num_cols, spec.get('shelves', []))
+        return item_locations, map_cache.load_or_build_distance_fields(grid_map, _portal_cells(spec), self.cache_dir)
+
+    def _portal_costs(self, zone_name, cell, portal_fields):
+        """Chi phí đi bộ (mét) từ ô cell đến từng cổng của khu: dict nút -> mét (chỉ cổng tới được)."""
+        costs = {}
+        for portal_name, portal_cell in self.specs[zone_name].get('portals', {}).items():
+            distance = portal_fields.distance(cell, tuple(int(v) for v in portal_cell))
+            if np.isfinite(distance):
+                costs[self.portal_lookup[(zone_name, portal_name)]] = distance * config.GRID_RESOLUTION_M
+        return costs
+
+    def _search(self, start_zone, start_cell, goals):
+        """
+        Một lượt Dijkstra trên đồ thị cổng từ (start_zone, start_cell) đến đích gần nhất trong goals
+        (list (khu, ô, portal_fields của khu)). Chỉ nạp khu đầu và các khu trên lộ trình thắng.
+        Trả về (dict lộ trình như route, chỉ số đích) hoặc (None, None) nếu không tới được.
+        """
+        if self.portal_graph is None:
+            self.build_portal_graph()
+        start_cell = tuple(start_cell)
+        start = self.zone(start_zone)
+        start_node = len(self.portal_nodes)
+        goal_base = start_node + 1 # Nút đích thứ j là goal_base + j
+
+        start_edges = [(portal_idx, cost_m, 'walk')
+                       for portal_idx, cost_m in self._portal_costs(start_zone, start_cell, start.portal_fields).items()]
+        goal_edges = {} # nút cổng -> [(nút đích, mét, 'walk')]
+        direct_paths = {}
+        for goal_idx, (goal_zone, goal_cell, goal_fields) in enumerate(goals):
+            goal_node = goal_base + goal_idx
+            for portal_idx, cost_m in self._portal_costs(goal_zone, goal_cell, goal_fields).items():
+                goal_edges.setdefault(portal_idx, []).append((goal_node, cost_m, 'walk'))
+            if goal_zone == start_zone:
+                path = start.planner.find_path(start_cell, tuple(goal_cell))
+                if path:
+                    direct_paths[goal_node] = path
+                    start_edges.append((goal_node, path_planning.path_length(path) * config.GRID_RESOLUTION_M,
+                                        'direct'))
+
+        best = {start_node: 0.0}
+        parent = {start_node: None}
+        goal_node = None
+        open_heap = [(0.0, start_node)]
+        while open_heap:
+            node_cost, node = heapq.heappop(open_heap)
+            if node >= goal_base:
+                goal_node = node
+                break
+            if node_cost > best.get(node, np.inf):
+                continue
+            edges = start_edges if node == start_node else self.portal_graph[node] + goal_edges.get(node, [])
+            for neighbor, cost_m, kind in edges:
+                if node_cost + cost_m < best.get(neighbor, np.inf):
+                    best[neighbor] = node_cost + cost_m
+                    parent[neighbor] = (node, kind)
+                    heapq.heappush(open_heap, (best[neighbor], neighbor))
+        if goal_node is None:
+            return None, None
+
+        chain = [(goal_node, None)]
+        while parent[chain[-1][0]] is not None:
+            chain.append(parent[chain[-1][0]])
+        chain.reverse() # [(nút, loại cạnh sang nút kế tiếp), ...]
+        nodes = [node for node, _ in chain]
+        kinds = [kind for _, kind in chain[:-1]]
+
+        def location(node):
+            if node == start_node:
+                return start_zone, start_cell
+            if node >= goal_base:
+                goal_zone, goal_cell, _ = goals[node - goal_base]
+                return goal_zone, tuple(goal_cell)
+            zone_name, portal_name = self.portal_nodes[node]
+            return zone_name, tuple(self.specs[zone_name]['portals'][portal_name])
+
+        legs, transfers = [], []
+        for from_node, to_node, kind in zip(nodes, nodes[1:], kinds):
+            (from_zone, from_cell), (to_zone, to_cell) = location(from_node), location(to_node)
+            if kind == 'direct':
+                legs.append({'zone': from_zone, 'path': direct_paths[to_node]})
+            elif kind == 'walk':
+                fields = self.zone(from_zone).portal_fields
+                if to_node >= goal_base:
+                    path = fields.route(to_cell, from_cell)[::-1] # Từ cổng đến đích = đảo đường đích -> cổng
+                else:
+                    path = fields.route(from_cell, to_cell)
+                legs.append({'zone': from_zone, 'path': path})
+            else:
+                transfers.append({'from': self.portal_nodes[from_node], 'to': self.portal_nodes[to_node],
+                                  'kind': kind})
+        return {
+            'cost_m': best[goal_node],
+            'legs': legs,
+            'transfers': transfers,
+            'zones': list(dict.fromkeys(leg['zone'] for leg in legs)),
+        }, goal_node - goal_base
+
+    def route(self, start_zone, start_cell, goal_zone, goal_cell):
+        """
+        Lộ trình ngắn nhất từ (start_zone, start_cell) đến (goal_zone, goal_cell), có thể qua nhiều khu.
+        Chỉ nạp khu đầu, khu cuối và các khu trung gian trên lộ trình tìm được.
+        Trả về dict: 'cost_m', 'legs' (list {'zone', 'path'}), 'transfers' (list {'from', 'to', 'kind'}),
+        'zones' (các khu theo thứ tự đi qua); None nếu không tới được.
+        """
+        _, goal_fields = self._zone_geometry(goal_zone)
+        found_route, _ = self._search(start_zone, start_cell, [(goal_zone, tuple(goal_cell), goal_fields)])
+        return found_route
+
+    def item_zones(self, item_name):
+        """Các khu có kệ chứa món hàng (đọc từ manifest, không nạp khu)."""
+        return [zone_name for zone_name, spec in self.specs.items()
+                if any(item['item_name'] == item_name
+                       for shelf in spec.get('shelves', []) for item in shelf['items_on_shelf'])]
+
+    def route_to_item(self, start_zone, start_cell, item_name):
+        """
+        Lộ trình ngắn nhất đến điểm tiếp cận gần nhất của món hàng ở mọi khu có món đó, trong một lượt
+        Dijkstra với mọi cặp (khu, điểm tiếp cận) làm đích. Khu ứng viên chỉ được đọc điểm tiếp cận và
+        trường khoảng cách đến cổng (cache), không nạp; chỉ các khu trên lộ trình thắng được nạp.
+        Trả về dict như route kèm 'target' (khu, ô); None nếu không tới được.
+        """
+        goals = []
+        for zone_name in self.item_zones(item_name):
+            item_locations, portal_fields = self._zone_geometry(zone_name)
+            goals.extend((zone_name, tuple(spot), portal_fields) for spot in item_locations.get(item_name, []))
+        if not goals:
+            return None
+        found_route, goal_idx = self._search(start_zone, start_cell, goals)
+        if found_route is None:
+            return None
+        return dict(found_route, target=goals[goal_idx][:2])
+
+def example_manifest():
+    """Cửa hàng mẫu: tầng 1 gồm hai khu nối bằng lối thông, tầng 2 nối với tầng 1 bằng thang cuốn và thang máy."""
+    def aisle_shelves(prefix, num_shelves, width_m, height_m, items):
+        num_rows = int(height_m / config.GRID_RESOLUTION_M)
+        num_cols = int(width_m / config.GRID_RESOLUTION_M)
+        step = num_cols // (num_shelves + 1)
+        return [{'name': f"{prefix} {idx + 1}", 'r': num_rows // 5, 'c': step * (idx + 1), 'rows': num_rows * 3 // 5,
+                 'cols': 2, 'items_on_shelf': [{'item_name': name, 'preferred_side': 'right'}
+                                               for name in items[idx::num_shelves]]}
+                for idx in range(num_shelves)]
+    return {
+        'zones': [
+            {'name': 'T1-Thực phẩm', 'floor': 1, 'width_m': 50, 'height_m': 30,
+             'shelves': aisle_shelves('Kệ TP', 4, 50, 30, ['Sữa', 'Bánh mì', 'Trứng', 'Rau', 'Thịt', 'Cá']),
+             'portals': {'lối sang đồ uống': [30, 99], 'thang cuốn': [2, 50], 'thang máy': [57, 50]}},
+            {'name': 'T1-Đồ uống', 'floor': 1, 'width_m': 30, 'height_m': 30,
+             'shelves': aisle_shelves('Kệ ĐU', 2, 30, 30, ['Nước ngọt', 'Bia', 'Nước suối']),
+             'portals': {'lối sang thực phẩm': [30, 0]}},
+            {'name': 'T2-Gia dụng', 'floor': 2, 'width_m': 60, 'height_m': 40,
+             'shelves': aisle_shelves('Kệ GD', 5, 60, 40, ['Nồi', 'Chảo', 'Khăn', 'Đèn', 'Ổ cắm']),
+             'portals': {'thang cuốn': [2, 60], 'thang máy': [77, 60]}},
+        ],
+        'links': [
+            {'from': ['T1-Thực phẩm', 'lối sang đồ uống'], 'to': ['T1-Đồ uống', 'lối sang thực phẩm'], 'kind': 'passage'},
+            {'from': ['T1-Thực phẩm', 'thang cuốn'], 'to': ['T2-Gia dụng', 'thang cuốn'], 'kind': 'escalator'},
+            {'from': ['T1-Thực phẩm', 'thang máy'], 'to': ['T2-Gia dụng', 'thang máy'], 'kind': 'lift'},
+        ],
+    }
+
+def main():
+    store = MultiZoneStore(example_manifest())
+    graph_stats = store.build_portal_graph()
+    print(f"Đồ thị cổng: {graph_stats['num_portals']} cổng, {graph_stats['num_edges']} cạnh, "
+          f"{graph_stats['time_s'] * 1000:.1f} ms ({'cache' if graph_stats['from_cache'] else 'tính mới'}); "
+          f"đã nạp {len(store.loaded)} khu")
+
+    start_time = time.perf_counter()
+    observed = store.observe('T1-Thực phẩm', (40, 10))
+    print(f"Xe đẩy báo từ T1-Thực phẩm: ước tính {store.localize('T1-Thực phẩm', observed)}, nạp khu mất "
+          f"{(time.perf_counter() - start_time) * 1000:.0f} ms; đang giữ {list(store.loaded)}")
+
+    for item_name in ('Bia', 'Đèn'):
+        start_time = time.perf_counter()
+        item_route = store.route_to_item('T1-Thực phẩm', (40, 10), item_name)
+        if item_route is None:
+            print(f"Không tới được '{item_name}'.")
+            continue
+        print(f"Đến '{item_name}' tại {item_route['target']}: {item_route['cost_m']:.1f}m qua {item_route['zones']}, "
+              f"{len(item_route['transfers'])} lần chuyển khu, {(time.perf_counter() - start_time) * 1000:.0f} ms")
+    print(f"Khu đang nạp: {list(store.loaded)}, {store.loaded_nbytes() / (1024 * 1024):.2f} MB; "
+          f"{store.loads} lần nạp, {store.evictions} lần loại")
+
+    # Ngân sách chỉ vừa một khu: đi sang tầng 2 rồi quay lại thì khu cũ bị loại theo LRU
+    tight_store = MultiZoneStore(example_manifest(),
+                                 memory_budget_bytes=max(zone.nbytes() for zone in store.loaded.values()))
+    tight_store.localize('T1-Thực phẩm', observed)
+    tight_store.localize('T2-Gia dụng', tight_store.observe('T2-Gia dụng', (40, 10)))
+    tight_store.localize('T1-Thực phẩm', observed)
+    print(f"Ngân sách {tight_store.memory_budget_bytes / (1024 * 1024):.2f} MB: đang giữ {list(tight_store.loaded)}; "
+          f"{tight_store.loads} lần nạp, {tight_store.evictions} lần loại")
+
+if __name__ == "__main__":
+    main()
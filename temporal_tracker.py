@@ -0,0 +1,131 @@
+# temporal_tracker.py
+import numpy as np
+import config
+from fingerprint_db import estimate_position
+
+class ConstantVelocityKalman:
+    """
+    Bộ lọc Kalman vận tốc không đổi trên (hàng, cột).
+    Trạng thái [r, c, vr, vc]; mỗi bước là một bước thời gian (dt = 1).
+    process_noise, measurement_noise tính bằng ô (mặc định đổi từ mét trong config).
+    """
+    def __init__(self, process_noise=None, measurement_noise=None):
+        process_noise = process_noise or config.TRACKER_PROCESS_NOISE_M / config.GRID_RESOLUTION_M
+        measurement_noise = measurement_noise or config.TRACKER_MEASUREMENT_NOISE_M / config.GRID_RESOLUTION_M
+        self.transition = np.array([[1, 0, 1, 0],
+                                    [0, 1, 0, 1],
+                                    [0, 0, 1, 0],
+                                    [0, 0, 0, 1]], dtype=np.float64)
+        self.observation = np.array([[1, 0, 0, 0],
+                                     [0, 1, 0, 0]], dtype=np.float64)
+        # Nhiễu gia tốc rời rạc (mô hình white-noise acceleration)
+        q = np.array([[0.25, 0, 0.5, 0],
+                      [0, 0.25, 0, 0.5],
+                      [0.5, 0, 1, 0],
+                      [0, 0.5, 0, 1]], dtype=np.float64)
+        self.process_cov = q * process_noise ** 2
+        self.measurement_cov = np.eye(2) * measurement_noise ** 2
+        self.state = None
+        self.cov = None
+
+    def predict(self):
+        """Dự đoán vị trí bước kế tiếp (không cập nhật trạng thái); None nếu chưa khởi tạo."""
+        if self.state is None:
+            return None
+        predicted = self.transition @ self.state
+        return (float(predicted[0]), float(predicted[1]))
+
+    def update(self, measured_pos):
+        """Bước dự đoán + hiệu chỉnh với phép đo (hàng, cột); trả về vị trí đã làm mượt."""
+        measured = np.asarray(measured_pos, dtype=np.float64)
+        if self.state is None:
+            self.state = np.array([measured[0], measured[1], 0.0, 0.0])
+            self.cov = np.diag([self.measurement_cov[0, 0], self.measurement_cov[1, 1], 1.0, 1.0])
+            return (float(measured[0]), float(measured[1]))
+        state = self.transition @ self.state
+        cov = self.transition @ self.cov @ self.transition.T + self.process_cov
+        innovation = measured - self.observation @ state
+        innovation_cov = self.observation @ cov @ self.observation.T + self.measurement_cov
+        gain = cov @ self.observation.T @ np.linalg.inv(innovation_cov)
+        self.state = state + gain @ innovation
+        self.cov = (np.eye(4) - gain @ self.observation) @ cov
+        return (float(self.state[0]), float(self.state[1]))
+
+    def reset(self):
+        self.state = None
+        self.cov = None
+
+class TemporalKNNTracker:
+    """
+    Bộ định vị có trạng thái cho một xe đẩy: KNN chỉ tìm trong cửa sổ quanh vị trí
+    dự đoán từ bước trước (qua SpatialBuckets), quay về tìm toàn cục khi chất lượng
+    khớp giảm, rồi làm mượt bằng Kalman vận tốc không đổi.
+    Bán kính cửa sổ tự giãn theo độ lệch gần đây giữa phép đo và dự đoán (trong khoảng
+    window_radius .. max_window_radius ô), để không bị khóa ở vùng sai khi KNN nhiễu nhiều.
+    """
+    def __init__(self, fingerprints, k=None, weighted=None, epsilon=None,
+                 window_radius=None, max_window_radius=None, fallback_factor=None, smoothing=True):
+        self.fingerprints = fingerprints
+        self.k = k or config.K_NEIGHBORS
+        self.weighted = config.USE_WEIGHTED_KNN if weighted is None else weighted
+        self.epsilon = epsilon or config.EPSILON_WEIGHT
+        self.window_radius = window_radius or config.TRACKER_WINDOW_RADIUS_M / config.GRID_RESOLUTION_M
+        self.max_window_radius = max(self.window_radius,
+                                     max_window_radius or config.TRACKER_MAX_WINDOW_RADIUS_M / config.GRID_RESOLUTION_M)
+        self.current_radius = self.window_radius
+        self.innovation_ms = 0.0 # Trung bình trượt của bình phương độ lệch đo - dự đoán (ô^2)
+        fallback_factor = fallback_factor or config.TRACKER_FALLBACK_FACTOR
+        # Khoảng cách RSSI kỳ vọng khi khớp đúng ô: hiệu của hai vector nhiễu độc lập
+        expected_match_distance = config.NOISE_STD_DEV_DB * np.sqrt(2 * max(fingerprints.num_aps, 1))
+        self.fallback_distance = fallback_factor * expected_match_distance
+        self.kalman = ConstantVelocityKalman() if smoothing else None
+        self.last_raw_estimate = None
+        self.last_estimate = None
+        self.last_used_global = False
+        self.last_candidates = 0 # Số fingerprint đã so sánh ở bước gần nhất
+        self.global_searches = 0
+
+    def reset(self):
+        self.last_raw_estimate = None
+        self.last_estimate = None
+        self.current_radius = self.window_radius
+        self.innovation_ms = 0.0
+        if self.kalman is not None:
+            self.kalman.reset()
+
+    def update(self, observed_rssi):
+        """Định vị một quan sát mới; trả về vị trí (hàng, cột) float hoặc None."""
+        if len(self.fingerprints) == 0:
+            return None
+        center = self.kalman.predict() if self.kalman is not None else None
+        if center is None:
+            center = self.last_estimate
+
+        nearest_idx = nearest_dist = None
+        self.last_used_global = True
+        if center is not None:
+            nearest_idx, nearest_dist, num_candidates = self.fingerprints.nearest_in_window(
+                observed_rssi, self.k, center, self.current_radius)
+            # Cửa sổ quá ít ứng viên hoặc khớp kém thì quay về tìm toàn cục
+            if len(nearest_idx) == min(self.k, len(self.fingerprints)) and \
+               nearest_dist[0] <= self.fallback_distance:
+                self.last_used_global = False
+                self.last_candidates = num_candidates
+        if self.last_used_global:
+            nearest_idx, nearest_dist = self.fingerprints.nearest(observed_rssi, self.k)
+            self.last_candidates = len(self.fingerprints)
+            self.global_searches += 1
+
+        raw_estimate = estimate_position(self.fingerprints.positions[nearest_idx], nearest_dist,
+                                         self.weighted, self.epsilon)
+        self.last_raw_estimate = raw_estimate
+        if center is not None and raw_estimate is not None:
+            innovation_sq = (raw_estimate[0] - center[0]) ** 2 + (raw_estimate[1] - center[1]) ** 2
+            self.innovation_ms += config.TRACKER_RADIUS_ADAPT_RATE * (innovation_sq - self.innovation_ms)
+            self.current_radius = float(np.clip(3 * np.sqrt(self.innovation_ms),
+                                                self.window_radius, self.max_window_radius))
+        if self.kalman is not None and raw_estimate is not None:
+            self.last_estimate = self.kalman.update(raw_estimate)
+        else:
+            self.last_estimate = raw_estimate
+        return self.last_estimate
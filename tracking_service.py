@@ -0,0 +1,227 @@
+# tracking_service.py
+"""
+Dịch vụ theo dõi nhiều xe đẩy bằng asyncio, không cần giao diện.
+Báo cáo RSSI đến trong cùng một tick được gộp thành một lần định vị theo lô.
+Chạy thử với bộ cấp dữ liệu mô phỏng:
+    python tracking_service.py --carts 2000 --ticks 20
+"""
+import argparse
+import asyncio
+import time
+import numpy as np
+import config
+import map_utils
+import rssi_simulation
+import localization_algorithms
+import map_cache
+
+class CartStateStore:
+    """
+    Trạng thái của mọi xe đẩy trong các mảng NumPy liền khối, đánh chỉ số bằng slot.
+    cart_id -> slot được giữ trong dict; mảng tự nhân đôi dung lượng khi đầy.
+    """
+    def __init__(self, capacity=1024):
+        self.slots = {}
+        self.cart_ids = []
+        self.estimated = np.full((capacity, 2), np.nan, dtype=np.float32)
+        self.actual = np.full((capacity, 2), -1, dtype=np.int32)
+        self.error_m = np.full(capacity, np.nan, dtype=np.float32)
+        self.updated_at = np.zeros(capacity, dtype=np.float64)
+        self.report_count = np.zeros(capacity, dtype=np.uint32)
+        self.targets = {} # slot -> ô đích (chỉ cho xe có đích)
+
+    def __len__(self):
+        return len(self.cart_ids)
+
+    def _grow(self):
+        capacity = 2 * len(self.error_m)
+        for name, fill in (('estimated', np.nan), ('actual', -1), ('error_m', np.nan),
+                           ('updated_at', 0), ('report_count', 0)):
+            old = getattr(self, name)
+            new = np.full((capacity,) + old.shape[1:], fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def slot_for(self, cart_id):
+        slot = self.slots.get(cart_id)
+        if slot is None:
+            slot = len(self.cart_ids)
+            if slot >= len(self.error_m):
+                self._grow()
+            self.slots[cart_id] = slot
+            self.cart_ids.append(cart_id)
+        return slot
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in
+                   ('estimated', 'actual', 'error_m', 'updated_at', 'report_count'))
+
+class TrackingEngine:
+    """
+    Bộ máy theo dõi nhiều xe đẩy.
+    submit() nhận báo cáo (không chặn); run() gom các báo cáo đến trong mỗi tick
+    (config.TRACKING_TICK_S) rồi định vị chúng bằng một lần gọi predict_location_knn_batch.
+    """
+    def __init__(self, fingerprints, distance_fields=None, k=None, weighted=None, tick_s=None):
+        self.fingerprints = fingerprints
+        self.distance_fields = distance_fields
+        self.k = k or config.K_NEIGHBORS
+        self.weighted = config.USE_WEIGHTED_KNN if weighted is None else weighted
+        self.tick_s = tick_s or config.TRACKING_TICK_S
+        self.state = CartStateStore()
+        self.queue = asyncio.Queue()
+        self.running = False
+        self.stats = {'reports': 0, 'batches': 0, 'max_batch': 0, 'localize_time_s': 0.0, 'dropped_reports': 0}
+
+    def submit(self, cart_id, observed_rssi, actual_pos_grid=None):
+        """
+        Nhận một báo cáo RSSI của xe đẩy; được xử lý ở tick kế tiếp.
+        Ném ValueError (báo cáo bị từ chối) nếu số giá trị RSSI khác số AP của fingerprint.
+        """
+        observed_rssi = np.asarray(observed_rssi, dtype=np.float64)
+        if observed_rssi.shape != (self.fingerprints.num_aps,):
+            raise ValueError(f"Báo cáo của xe '{cart_id}' có {observed_rssi.size} giá trị RSSI, "
+                             f"cần {self.fingerprints.num_aps}")
+        self.queue.put_nowait((cart_id, observed_rssi, actual_pos_grid))
+
+    def set_target(self, cart_id, target_pos_grid):
+        """Đặt (hoặc xóa nếu None) ô đích của xe đẩy; lộ trình được tính theo vị trí ước tính mới nhất."""
+        slot = self.state.slot_for(cart_id)
+        if target_pos_grid is None:
+            self.state.targets.pop(slot, None)
+        else:
+            self.state.targets[slot] = tuple(target_pos_grid)
+
+    def get_cart(self, cart_id):
+        """Trạng thái mới nhất của một xe đẩy: vị trí ước tính, sai số (m), lộ trình đến đích."""
+        slot = self.state.slots.get(cart_id)
+        if slot is None:
+            return None
+        estimated = self.state.estimated[slot]
+        position = None if np.isnan(estimated).any() else (float(estimated[0]), float(estimated[1]))
+        route = None
+        target = self.state.targets.get(slot)
+        if target is not None and position is not None and self.distance_fields is not None:
+            route = self.distance_fields.route((round(position[0]), round(position[1])), target)
+        error_m = float(self.state.error_m[slot])
+        return {
+            'cart_id': cart_id,
+            'position': position,
+            'error_m': None if np.isnan(error_m) else error_m,
+            'route': route,
+            'reports': int(self.state.report_count[slot]),
+            'updated_at': float(self.state.updated_at[slot]),
+        }
+
+    def _localize(self, observations):
+        return localization_algorithms.predict_location_knn_batch(
+            observations, self.fingerprints, self.k, self.weighted, config.EPSILON_WEIGHT,
+            approx_epsilon=config.KNN_APPROX_EPSILON
+        )
+
+    def _apply(self, batch, estimates):
+        now = time.time()
+        state = self.state
+        slots = np.array([state.slot_for(cart_id) for cart_id, _, _ in batch], dtype=np.int64)
+        # Nếu một xe gửi nhiều báo cáo trong tick, báo cáo sau cùng được giữ (gán mảng theo thứ tự)
+        state.estimated[slots] = estimates
+        state.updated_at[slots] = now
+        np.add.at(state.report_count, slots, 1)
+        has_actual = np.array([actual is not None for _, _, actual in batch])
+        if has_actual.any():
+            actual = np.array([actual for _, _, actual in batch if actual is not None], dtype=np.int32)
+            state.actual[slots[has_actual]] = actual
+            state.error_m[slots[has_actual]] = np.hypot(
+                *(estimates[has_actual] - actual).T) * config.GRID_RESOLUTION_M
+
+    def _drain(self):
+        batch = []
+        while len(batch) < config.TRACKING_MAX_BATCH:
+            try:
+                batch.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    async def run(self):
+        """Vòng lặp xử lý: chờ báo cáo đầu tiên, đợi hết tick, rồi định vị cả lô."""
+        self.running = True
+        loop = asyncio.get_running_loop()
+        while self.running:
+            first_report = await self.queue.get()
+            await asyncio.sleep(self.tick_s) # Gom các báo cáo đến trong cùng tick
+            batch = [first_report] + self._drain()
+            try:
+                observations = np.array([rssi for _, rssi, _ in batch], dtype=np.float64)
+                start_time = time.perf_counter()
+                # Tính toán NumPy chạy ở thread khác để vòng lặp sự kiện vẫn nhận báo cáo mới
+                estimates = await loop.run_in_executor(None, self._localize, observations)
+                self.stats['localize_time_s'] += time.perf_counter() - start_time
+                self._apply(batch, estimates)
+            except Exception as e: # Một lô lỗi không được làm dừng vòng lặp
+                print(f"Cảnh báo: Bỏ qua lô {len(batch)} báo cáo do lỗi: {e}")
+                self.stats['dropped_reports'] += len(batch)
+                continue
+            self.stats['reports'] += len(batch)
+            self.stats['batches'] += 1
+            self.stats['max_batch'] = max(self.stats['max_batch'], len(batch))
+
+    def stop(self):
+        self.running = False
+
+async def simulated_feeder(engine, grid_map, access_points, shelf_crossing_maps, num_carts, num_ticks, rng):
+    """
+    Bộ cấp dữ liệu mô phỏng thay cho xe đẩy thật: mỗi xe đi ngẫu nhiên một ô mỗi tick trên
+    các ô lối đi và gửi RSSI tính bằng get_observed_rssi_at_cart.
+    """
+    walkable = grid_map == config.CELL_TYPE_PATH
+    walkable_cells = np.argwhere(walkable)
+    positions = walkable_cells[rng.integers(len(walkable_cells), size=num_carts)]
+    for _ in range(num_ticks):
+        steps = rng.integers(-1, 2, size=positions.shape)
+        candidates = np.clip(positions + steps, 0, np.array(grid_map.shape) - 1)
+        can_move = walkable[candidates[:, 0], candidates[:, 1]]
+        positions[can_move] = candidates[can_move]
+        for cart_idx, (r, c) in enumerate(positions.tolist()):
+            observed = rssi_simulation.get_observed_rssi_at_cart(
+                (r, c), grid_map, access_points, shelf_crossing_maps)
+            engine.submit(f"cart-{cart_idx}", observed, (r, c))
+        await asyncio.sleep(engine.tick_s)
+
+async def run_demo(num_carts, num_ticks, seed):
+    grid_map, num_rows, num_cols = map_utils.create_base_map()
+    map_utils.add_shelf(grid_map, num_rows // 4, num_cols // 4, num_rows // 2, 2)
+    map_utils.add_shelf(grid_map, num_rows // 4, (num_cols * 3 // 4) - 2, num_rows // 2, 2)
+    access_points = map_utils.define_access_points(num_rows, num_cols)
+    fingerprints, shelf_crossing_maps = map_cache.load_or_build_fingerprints(grid_map, access_points)
+
+    engine = TrackingEngine(fingerprints)
+    engine_task = asyncio.create_task(engine.run())
+    start_time = time.perf_counter()
+    await simulated_feeder(engine, grid_map, access_points, shelf_crossing_maps, num_carts, num_ticks,
+                           np.random.default_rng(seed))
+    while not engine_task.done() and (not engine.queue.empty() or engine.stats['reports']
+                                      + engine.stats['dropped_reports'] < num_carts * num_ticks):
+        await asyncio.sleep(engine.tick_s)
+    elapsed_s = time.perf_counter() - start_time
+    engine.stop()
+    engine_task.cancel()
+
+    errors = engine.state.error_m[:len(engine.state)]
+    print(f"{engine.stats['reports']} báo cáo từ {len(engine.state)} xe trong {elapsed_s:.2f}s "
+          f"({engine.stats['reports'] / elapsed_s:.0f} báo cáo/s)")
+    print(f"{engine.stats['batches']} lô, lớn nhất {engine.stats['max_batch']}, "
+          f"thời gian định vị {engine.stats['localize_time_s']:.2f}s")
+    print(f"Sai số trung bình lần cuối: {np.nanmean(errors):.2f}m, "
+          f"bộ nhớ trạng thái: {engine.state.nbytes() / 1024:.1f} KB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Dịch vụ theo dõi nhiều xe đẩy (mô phỏng)")
+    parser.add_argument('--carts', type=int, default=1000)
+    parser.add_argument('--ticks', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(run_demo(args.carts, args.ticks, args.seed))
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
 # visualization.py
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
+from matplotlib.collections import LineCollection
 import numpy as np
 import config
+import instrumentation
 
 class InteractiveMap:
     def __init__(self, grid_map, access_points, item_locations,
@@ -26,6 +28,21 @@ class InteractiveMap:
         self.target_item_pos_grid = None
         self.current_path_nodes = None # Sẽ lưu trữ các node (hàng, cột)
         self.error_m = None
+        # Nhiều xe đẩy cùng lúc: mảng (số xe, 2) vị trí thực tế / ước tính (hàng, cột), tùy chọn
+        self.fleet_actual_pos_grid = None
+        self.fleet_estimated_pos_float = None
+        # Lớp phủ bản đồ sai số định vị (mảng (hàng, cột) mét, NaN ở ô kệ), tùy chọn
+        self.error_overlay = None
+        self.error_overlay_label = None
+        self.error_colorbar = None
+
+        # Chế độ blit: artist động tạo một lần, nền tĩnh (bản đồ, AP, món hàng, đường đi) được lưu lại
+        self.use_blit = config.RENDER_MODE == 'blit' and getattr(self.fig.canvas, 'supports_blit', False)
+        self.background = None
+        self.drawn_path_nodes = None
+        self.drawn_target_pos_grid = None
+        if self.use_blit:
+            self.fig.canvas.mpl_connect('draw_event', self._on_draw)
 
         self.custom_cmap = mcolors.ListedColormap([config.COLOR_PATH_ON_MAP, config.COLOR_SHELF_ON_MAP])
         self.bounds = [-0.5, 0.5, 1.5]
@@ -44,12 +61,21 @@ class InteractiveMap:
             y_m = r_or_list_r * config.GRID_RESOLUTION_M + config.GRID_RESOLUTION_M / 2
             return y_m, x_m
 
+    def _grid_to_metric_array(self, positions):
+        """Mảng (N, 2) tọa độ (hàng, cột) -> mảng (N, 2) tọa độ vẽ (x mét, y mét) tâm ô."""
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        return positions[:, ::-1] * config.GRID_RESOLUTION_M + config.GRID_RESOLUTION_M / 2
+
     def plot_initial_map(self):
+        if self.error_colorbar is not None: # Gỡ thanh màu trước ax.clear() để trả lại chỗ cho bản đồ
+            self.error_colorbar.remove()
+            self.error_colorbar = None
         self.ax.clear()
         self.ax.imshow(self.grid_map_data, cmap=self.custom_cmap, norm=self.norm,
                        origin='lower', interpolation='nearest',
                        extent=[0, self.num_cols * config.GRID_RESOLUTION_M,
                                0, self.num_rows * config.GRID_RESOLUTION_M])
+        self._draw_error_overlay()
 
         if self.access_points:
             aps_y_m, aps_x_m = self._grid_to_metric(self.access_points)
@@ -69,12 +95,128 @@ class InteractiveMap:
         self.ax.set_xlabel(f"Chiều rộng (mét)")
         self.ax.set_ylabel(f"Chiều cao (mét)")
         self.ax.invert_yaxis()
+        if self.use_blit:
+            self._create_dynamic_artists()
         self.ax.legend(loc='upper right', bbox_to_anchor=(1.35, 1))
         self.ax.grid(True, which='both', color='lightgray', linestyle=':', linewidth=0.5)
         self.fig.tight_layout(rect=[0, 0, 0.83, 1])
         self.fig.canvas.draw_idle()
 
+    def _draw_error_overlay(self):
+        if self.error_overlay is None:
+            return
+        overlay = self.ax.imshow(np.ma.masked_invalid(self.error_overlay), cmap=config.ERROR_HEATMAP_CMAP,
+                                 alpha=config.ERROR_HEATMAP_ALPHA, origin='lower', interpolation='nearest',
+                                 extent=[0, self.num_cols * config.GRID_RESOLUTION_M,
+                                         0, self.num_rows * config.GRID_RESOLUTION_M], zorder=1)
+        self.error_colorbar = self.fig.colorbar(overlay, ax=self.ax, location='bottom', fraction=0.05, pad=0.25)
+        self.error_colorbar.set_label(self.error_overlay_label)
+
+    def set_error_overlay(self, error_map, label='Sai số định vị (m)'):
+        """Phủ bản đồ sai số (vd. từ error_heatmap.evaluate_localization_error) lên bản đồ; None để tắt."""
+        self.error_overlay = error_map
+        self.error_overlay_label = label
+        self.plot_initial_map()
+        self.update_plot_elements()
+
+    def _create_dynamic_artists(self):
+        """Tạo một lần các artist động; sau đó chỉ cập nhật dữ liệu bằng set_offsets/set_data."""
+        empty = np.empty((0, 2))
+        # Đường đi và ô đích ít thay đổi: vẽ vào nền tĩnh, chụp lại nền khi chúng đổi
+        self.path_artist, = self.ax.plot([], [], color=config.COLOR_PATH_LINE,
+                                         linewidth=3, label='Đường đi', zorder=7)
+        self.target_artist = self.ax.scatter(empty[:, 0], empty[:, 1], marker='*',
+                                             color=config.COLOR_TARGET_ITEM_MARKER, s=250,
+                                             label='Đích', zorder=10)
+        # Xe đẩy thay đổi mỗi bước: artist animated, chỉ vẽ lại khi blit
+        self.error_artist = LineCollection([], colors=config.COLOR_ERROR_LINE, linestyles='--',
+                                           linewidths=1.5, label='Sai số', zorder=8, animated=True)
+        self.ax.add_collection(self.error_artist, autolim=False)
+        self.actual_artist = self.ax.scatter(empty[:, 0], empty[:, 1], marker='s',
+                                             color=config.COLOR_CART_ACTUAL_MARKER, s=150,
+                                             label='Xe đẩy (Thực tế)', zorder=10, animated=True)
+        self.estimated_artist = self.ax.scatter(empty[:, 0], empty[:, 1], marker='P',
+                                                color=config.COLOR_CART_ESTIMATED_MARKER, s=150,
+                                                label=f'Xe đẩy (KNN K={config.K_NEIGHBORS})', zorder=10,
+                                                animated=True)
+        self.status_text = self.ax.text(0.01, 0.01, '', transform=self.ax.transAxes, fontsize=9,
+                                        va='bottom', ha='left', zorder=11, animated=True,
+                                        bbox=dict(facecolor='white', alpha=0.8, edgecolor='none'))
+        self.animated_artists = [self.error_artist, self.actual_artist, self.estimated_artist, self.status_text]
+        self.background = None
+        self.drawn_path_nodes = None
+        self.drawn_target_pos_grid = None
+
+    def _on_draw(self, event):
+        """Sau mỗi lần vẽ đầy đủ (kể cả khi đổi kích thước cửa sổ): lưu nền tĩnh rồi vẽ phần động."""
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self.animated_artists:
+            self.ax.draw_artist(artist)
+
+    def _cart_positions(self):
+        """Vị trí thực tế và ước tính của mọi xe đẩy cần vẽ, dạng mảng (N, 2) (hàng, cột)."""
+        actual = [np.asarray(self.cart_actual_pos_grid, dtype=np.float64).reshape(-1, 2)
+                  if self.cart_actual_pos_grid else np.empty((0, 2))]
+        estimated = [np.asarray(self.cart_estimated_pos_float, dtype=np.float64).reshape(-1, 2)
+                     if self.cart_estimated_pos_float else np.empty((0, 2))]
+        pairs = [np.concatenate([actual[0], estimated[0]], axis=1)
+                 if len(actual[0]) and len(estimated[0]) and self.error_m is not None else np.empty((0, 4))]
+        if self.fleet_actual_pos_grid is not None:
+            fleet_actual = np.asarray(self.fleet_actual_pos_grid, dtype=np.float64).reshape(-1, 2)
+            actual.append(fleet_actual)
+            if self.fleet_estimated_pos_float is not None:
+                fleet_estimated = np.asarray(self.fleet_estimated_pos_float, dtype=np.float64).reshape(-1, 2)
+                estimated.append(fleet_estimated)
+                both = ~np.isnan(fleet_estimated).any(axis=1)
+                pairs.append(np.concatenate([fleet_actual[both], fleet_estimated[both]], axis=1))
+        estimated = np.concatenate(estimated)
+        return np.concatenate(actual), estimated[~np.isnan(estimated).any(axis=1)], np.concatenate(pairs)
+
+    def set_fleet_positions(self, actual_positions, estimated_positions=None):
+        """Đặt vị trí của nhiều xe đẩy (mảng (N, 2) hàng, cột; NaN = chưa có ước tính) rồi vẽ lại."""
+        self.fleet_actual_pos_grid = actual_positions
+        self.fleet_estimated_pos_float = estimated_positions
+        self.update_plot_elements()
+
+    def _update_blit(self):
+        static_changed = self.background is None
+        if self.current_path_nodes is not self.drawn_path_nodes:
+            path_xy = self._grid_to_metric_array(self.current_path_nodes or [])
+            self.path_artist.set_data(path_xy[:, 0], path_xy[:, 1])
+            self.drawn_path_nodes = self.current_path_nodes
+            static_changed = True
+        if self.target_item_pos_grid != self.drawn_target_pos_grid:
+            self.target_artist.set_offsets(self._grid_to_metric_array(self.target_item_pos_grid or []))
+            self.drawn_target_pos_grid = self.target_item_pos_grid
+            static_changed = True
+
+        actual, estimated, pairs = self._cart_positions()
+        self.actual_artist.set_offsets(self._grid_to_metric_array(actual))
+        self.estimated_artist.set_offsets(self._grid_to_metric_array(estimated))
+        self.error_artist.set_segments(np.stack([self._grid_to_metric_array(pairs[:, :2]),
+                                                 self._grid_to_metric_array(pairs[:, 2:])], axis=1))
+        status = []
+        if self.target_item_name and self.target_item_pos_grid:
+            status.append(f'Đến: {self.target_item_name}')
+        if self.error_m is not None:
+            status.append(f'Sai số: {self.error_m:.2f}m')
+        self.status_text.set_text('   '.join(status))
+        self.status_text.set_visible(bool(status))
+
+        canvas = self.fig.canvas
+        if static_changed:
+            canvas.draw() # Vẽ lại nền tĩnh; _on_draw lưu nền và vẽ phần động
+        else:
+            canvas.restore_region(self.background)
+            for artist in self.animated_artists:
+                self.ax.draw_artist(artist)
+            canvas.blit(self.fig.bbox)
+
+    @instrumentation.timed('render.update_plot')
     def update_plot_elements(self):
+        if self.use_blit:
+            self._update_blit()
+            return
         # Xóa các đối tượng động cũ
         # Giữ lại APs và item markers ban đầu
         artists_to_remove = []
@@ -108,6 +250,16 @@ class InteractiveMap:
                              color=config.COLOR_ERROR_LINE, linestyle='--', linewidth=1.5,
                              label=f'Sai số: {self.error_m:.2f}m', zorder=8)
 
+        if self.fleet_actual_pos_grid is not None:
+            fleet_xy = self._grid_to_metric_array(self.fleet_actual_pos_grid)
+            self.ax.scatter(fleet_xy[:, 0], fleet_xy[:, 1], marker='s',
+                            color=config.COLOR_CART_ACTUAL_MARKER, s=60, label='Xe đẩy (Thực tế)', zorder=10)
+            if self.fleet_estimated_pos_float is not None:
+                fleet_xy = self._grid_to_metric_array(self.fleet_estimated_pos_float)
+                self.ax.scatter(fleet_xy[:, 0], fleet_xy[:, 1], marker='P',
+                                color=config.COLOR_CART_ESTIMATED_MARKER, s=60,
+                                label=f'Xe đẩy (KNN K={config.K_NEIGHBORS})', zorder=10)
+
         if self.target_item_pos_grid:
             target_y_m, target_x_m = self._grid_to_metric(*self.target_item_pos_grid)
             self.ax.scatter(target_x_m, target_y_m, marker='*',
@@ -0,0 +1,80 @@
+# walkable_index.py
+import numpy as np
+import config
+
+class WalkableIndex:
+    """
+    Đánh chỉ số dày (dense ID) cho các ô lối đi: ID 0..N-1 theo thứ tự hàng rồi cột.
+    cells: int32 (N, 2), ID -> (hàng, cột).
+    cell_ids: int32 (hàng, cột), (hàng, cột) -> ID, -1 với ô kệ.
+    Chỉ FingerprintDB (from_rssi_grid) và cache fingerprint (map_cache) xếp theo dense ID;
+    GridPlanner vẫn đánh chỉ số trên lưới có viền, trường khoảng cách giữ bố cục 2 chiều.
+    """
+    def __init__(self, grid_map):
+        self._build(grid_map == config.CELL_TYPE_PATH)
+
+    @classmethod
+    def from_walkable(cls, walkable):
+        """Tạo từ mảng bool ô đi được thay vì bản đồ lưới."""
+        index = cls.__new__(cls)
+        index._build(np.asarray(walkable, dtype=bool))
+        return index
+
+    @classmethod
+    def from_cells(cls, cells, shape):
+        """Tạo từ danh sách ô có sẵn (N, 2): ID là thứ tự trong danh sách."""
+        index = cls.__new__(cls)
+        index.shape = tuple(int(v) for v in shape)
+        index.cells = np.asarray(cells, dtype=np.int32).reshape(-1, 2)
+        index.cell_ids = np.full(index.shape, -1, dtype=np.int32)
+        index.cell_ids[index.cells[:, 0], index.cells[:, 1]] = np.arange(len(index.cells), dtype=np.int32)
+        return index
+
+    def _build(self, walkable):
+        self.shape = walkable.shape
+        self.cells = np.argwhere(walkable).astype(np.int32)
+        self.cell_ids = np.full(walkable.shape, -1, dtype=np.int32)
+        self.cell_ids[walkable] = np.arange(len(self.cells), dtype=np.int32)
+
+    def __len__(self):
+        return len(self.cells)
+
+    def id_of(self, cell):
+        """ID của ô (hàng, cột); -1 nếu ô nằm ngoài bản đồ hoặc không đi được."""
+        r, c = cell
+        if not (0 <= r < self.shape[0] and 0 <= c < self.shape[1]):
+            return -1
+        return int(self.cell_ids[r, c])
+
+    def ids_of(self, rows, cols):
+        """ID của nhiều ô cùng lúc (mảng), -1 cho ô ngoài bản đồ hoặc không đi được."""
+        rows, cols = np.asarray(rows), np.asarray(cols)
+        inside = (rows >= 0) & (rows < self.shape[0]) & (cols >= 0) & (cols < self.shape[1])
+        ids = np.full(rows.shape, -1, dtype=np.int32)
+        ids[inside] = self.cell_ids[rows[inside], cols[inside]]
+        return ids
+
+    def cell_of(self, cell_id):
+        r, c = self.cells[cell_id]
+        return (int(r), int(c))
+
+    def nbytes(self):
+        return self.cells.nbytes + self.cell_ids.nbytes
+
+def component_nbytes(component):
+    """Số byte của một thành phần: mảng NumPy hoặc đối tượng có nbytes()."""
+    if component is None:
+        return 0
+    if isinstance(component, np.ndarray):
+        return component.nbytes
+    return int(component.nbytes())
+
+def memory_report(**components):
+    """Bộ nhớ (byte) của từng thành phần theo tên, kèm 'total'."""
+    report = {name: component_nbytes(component) for name, component in components.items()}
+    report['total'] = sum(report.values())
+    return report
+
+def format_memory_report(report):
+    """Chuỗi một dòng 'tên: x MB, ...' để in ra terminal."""
+    return ", ".join(f"{name}: {num_bytes / (1024 * 1024):.2f} MB" for name, num_bytes in report.items())